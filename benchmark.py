@@ -0,0 +1,456 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import importlib
+import platform
+import subprocess
+import threading
+from datetime import datetime
+import numpy as np
+from dotenv import load_dotenv
+from psycopg.conninfo import conninfo_to_dict
+from trading_core.market_sim import MODELS, SIM_MODEL
+
+load_dotenv()
+
+# Load benchmark for both apps.
+#
+#     python benchmark.py run                          # both apps, defaults
+#     python benchmark.py run --sessions 50 --duration 60 --mix page=5,buy=3,sell=2
+#     python benchmark.py run --baseline benchmark-results/abc1234.json
+#     python benchmark.py tick --symbols 20 1000 10000 --ticks 500
+#     python benchmark.py compare OLD.json NEW.json
+#
+# Each simulated session is a thread with its own test client (so its own
+# cookie, user and portfolio) issuing a weighted mix of page views, API reads
+# and market buys/sells back to back for --duration seconds, after --warmup
+# seconds whose requests are not recorded. Requests run in process against
+# DATABASE_URL, which measures the apps and the database without an HTTP
+# server in front, like one threaded worker with --sessions threads.
+#
+# Reported per app and per operation: p50/p95/p99 latency, throughput, and
+# statements executed and connections checked out per request (counted with
+# trading_core.db.track_queries()). Results are written as JSON; compare two
+# runs to see regressions across commits. Every run creates users and trades,
+# so only point it at a local database.
+#
+# The tick scenario times the market tick: MarketSimulator.step() over
+# synthetic universes of each --symbols size (no database needed), and with
+# --db, or as part of `run`, MarketTickEngine.tick() against the real
+# stock_prices, which writes prices, tick history and fills resting orders.
+# It reports the same latency percentiles, with ticks per second of tick time
+# as throughput, under the app name 'tick'.
+
+APPS = {
+    'gamified': 'gamified_app_db',
+    'traditional': 'traditional_app_db'
+}
+
+# op=weight; ops are page, quotes, portfolio, history, buy and sell
+DEFAULT_MIX = 'page=6,quotes=1,portfolio=1,buy=2,sell=1'
+
+RESULTS_DIR = 'benchmark-results'
+
+# Universe sizes and ticks per size for the tick scenario
+DEFAULT_TICK_SYMBOLS = [20, 1000, 10000]
+DEFAULT_TICKS = 200
+
+# Untimed ticks before each tick measurement
+TICK_WARMUP = 5
+
+# A p95 latency rise or throughput drop beyond this percentage is a regression
+DEFAULT_THRESHOLD = 10.0
+
+READS = {
+    'page': '/',
+    'quotes': '/api/quotes',
+    'portfolio': '/api/portfolio',
+    'history': '/api/history'
+}
+
+def parse_mix(text):
+    mix = []
+    for part in text.split(','):
+        op, _, weight = part.partition('=')
+        op = op.strip()
+        if op not in READS and op not in ('buy', 'sell'):
+            raise ValueError(f"Unknown operation: {op}")
+        mix.append((op, float(weight or 1)))
+    return mix
+
+def is_local(conninfo):
+    host = conninfo_to_dict(conninfo or '').get('host')
+    return not host or host.startswith('/') or host in ('localhost', '127.0.0.1', '::1')
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return commit, dirty
+    except Exception:
+        return None, None
+
+class Session:
+    def __init__(self, client, symbols, rng):
+        self.client = client
+        self.symbols = symbols
+        self.rng = rng
+        self.holdings = {}
+
+    # Run one operation; returns (op actually run, succeeded)
+    def run(self, op):
+        if op == 'sell' and not self.holdings:
+            # Nothing to sell yet
+            op = 'buy'
+        if op in READS:
+            response = self.client.get(READS[op])
+            return op, response.status_code == 200
+
+        if op == 'buy':
+            symbol = self.rng.choice(self.symbols)
+        else:
+            symbol = self.rng.choice(sorted(self.holdings))
+        response = self.client.post('/trade', json={'symbol': symbol, 'shares': 1, 'action': op})
+        data = response.get_json(silent=True) or {}
+        ok = response.status_code == 200 and data.get('success', False)
+        if ok:
+            self.holdings[symbol] = self.holdings.get(symbol, 0) + (1 if op == 'buy' else -1)
+            if not self.holdings[symbol]:
+                del self.holdings[symbol]
+        return op, ok
+
+def run_session(app, symbols, mix, seed, record_from, deadline, records):
+    from trading_core import db
+
+    rng = random.Random(seed)
+    session = Session(app.test_client(), symbols, rng)
+    # First visit creates the session's user
+    session.run('page')
+
+    ops = [op for op, _ in mix]
+    weights = [weight for _, weight in mix]
+    while True:
+        start = time.perf_counter()
+        if start >= deadline:
+            break
+        stats = db.track_queries()
+        try:
+            op, ok = session.run(rng.choices(ops, weights)[0])
+        except Exception as e:
+            print(f"Benchmark request error: {e}")
+            op, ok = 'error', False
+        elapsed = time.perf_counter() - start
+        if start >= record_from:
+            records.append((op, elapsed, ok, stats.queries, stats.connections))
+
+def summarize(records, wall):
+    latencies = np.array([record[1] for record in records]) * 1000
+    return {
+        'requests': len(records),
+        'errors': sum(1 for record in records if not record[2]),
+        'throughput_rps': len(records) / wall if wall > 0 else 0.0,
+        'latency_ms': {
+            'mean': float(latencies.mean()),
+            'p50': float(np.percentile(latencies, 50)),
+            'p95': float(np.percentile(latencies, 95)),
+            'p99': float(np.percentile(latencies, 99)),
+            'max': float(latencies.max())
+        },
+        'queries_per_request': sum(record[3] for record in records) / len(records),
+        'connections_per_request': sum(record[4] for record in records) / len(records)
+    }
+
+def bench_app(name, sessions, duration, warmup, mix, seed):
+    from trading_core import db
+
+    app = importlib.import_module(APPS[name]).app
+    symbols = [quote['symbol'] for quote in app.test_client().get('/api/quotes').get_json()['quotes']]
+    if not symbols:
+        raise RuntimeError('No symbols in stock_prices; run the app once to seed it')
+
+    records = []
+    start = time.perf_counter()
+    record_from = start + warmup
+    deadline = record_from + duration
+    db.get_pool().pop_stats()
+    threads = [threading.Thread(target=run_session, name=f"bench-{name}-{i}",
+                                args=(app, symbols, mix, seed * 1000 + i, record_from, deadline, records))
+               for i in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = max(time.perf_counter() - record_from, 1e-9)
+    pool = db.get_pool().pop_stats()
+
+    if not records:
+        raise RuntimeError(f"No requests recorded for {name}")
+
+    by_op = {}
+    for record in records:
+        by_op.setdefault(record[0], []).append(record)
+    return {
+        'overall': summarize(records, wall),
+        'by_op': {op: summarize(op_records, wall) for op, op_records in sorted(by_op.items())},
+        'pool': {
+            'connections_opened': pool.get('connections_num', 0),
+            'checkouts': pool.get('requests_num', 0),
+            'checkouts_queued': pool.get('requests_queued', 0),
+            'checkout_wait_ms': pool.get('requests_wait_ms', 0)
+        }
+    }
+
+# stock_prices-shaped rows for a simulated universe of `count` symbols
+def synthetic_stocks(count, rng):
+    volatilities = ['high', 'medium', 'low']
+    stocks = []
+    for i in range(count):
+        price = round(rng.uniform(5, 500), 2)
+        stocks.append({
+            'symbol': f"SIM{i:05d}",
+            'base_price': price,
+            'current_price': price,
+            'volatility': volatilities[i % len(volatilities)]
+        })
+    return stocks
+
+# Time `ticks` calls of `tick` after TICK_WARMUP untimed ones. Returns records
+# in run_session()'s format under `op`.
+def time_ticks(op, tick, ticks):
+    from trading_core import db
+
+    for _ in range(TICK_WARMUP):
+        tick()
+    records = []
+    for _ in range(ticks):
+        stats = db.track_queries()
+        start = time.perf_counter()
+        try:
+            tick()
+            ok = True
+        except Exception as e:
+            print(f"Benchmark tick error: {e}")
+            ok = False
+        records.append((op, time.perf_counter() - start, ok, stats.queries, stats.connections))
+    return records
+
+# Tick latency: the simulator alone at each universe size, then, given a
+# conninfo, the engine's full tick against stock_prices. Ticks run back to
+# back, so throughput is ticks per second of tick time.
+def bench_tick(symbol_counts, ticks, model, seed, conninfo=None):
+    import psycopg
+    from psycopg.rows import dict_row
+    from trading_core import db
+    from trading_core.market_engine import MarketTickEngine
+    from trading_core.market_sim import MarketSimulator
+
+    records = []
+    for count in symbol_counts:
+        simulator = MarketSimulator(model=model, seed=seed)
+        simulator.load(synthetic_stocks(count, random.Random(seed)))
+        records += time_ticks(f"step-{count}", simulator.step, ticks)
+
+    if conninfo:
+        engine = MarketTickEngine(conninfo=conninfo, simulator=MarketSimulator(model=model, seed=seed))
+        with psycopg.connect(conninfo, row_factory=dict_row, cursor_factory=db.CountingCursor,
+                             autocommit=True) as conn:
+            # The first tick loads the universe the op is named after
+            engine.tick(conn)
+            records += time_ticks(f"engine-{len(engine.simulator.symbols)}", lambda: engine.tick(conn), ticks)
+
+    by_op = {}
+    for record in records:
+        by_op.setdefault(record[0], []).append(record)
+    return {
+        'overall': summarize(records, sum(record[1] for record in records)),
+        'by_op': {op: summarize(op_records, sum(record[1] for record in op_records))
+                  for op, op_records in by_op.items()}
+    }
+
+def print_results(results):
+    for name, result in results['apps'].items():
+        print(f"\n{name}")
+        print(f"  {'op':<10} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'conns':>6}")
+        rows = list(result['by_op'].items()) + [('all', result['overall'])]
+        for op, summary in rows:
+            latency = summary['latency_ms']
+            print(f"  {op:<10} {summary['requests']:>8} {summary['errors']:>6} {summary['throughput_rps']:>8.1f} "
+                  f"{latency['p50']:>8.2f} {latency['p95']:>8.2f} {latency['p99']:>8.2f} "
+                  f"{summary['queries_per_request']:>8.2f} {summary['connections_per_request']:>6.2f}")
+        pool = result.get('pool')
+        if pool:
+            print(f"  pool: {pool['connections_opened']} connections opened, {pool['checkouts']} checkouts, "
+                  f"{pool['checkouts_queued']} queued ({pool['checkout_wait_ms']} ms waiting)")
+
+def percent_change(old, new):
+    return (new - old) / old * 100 if old else 0.0
+
+# Print the change from `baseline` to `current` for every app and op in both.
+# Returns the number of regressions beyond `threshold` percent.
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    print(f"\nBaseline {baseline.get('commit')} ({baseline.get('started_at')}) -> "
+          f"current {current.get('commit')} ({current.get('started_at')})")
+    regressions = 0
+    for name, result in current['apps'].items():
+        old_result = baseline['apps'].get(name)
+        if old_result is None:
+            continue
+        print(f"\n{name}")
+        old_rows = dict(old_result['by_op'], all=old_result['overall'])
+        for op, summary in list(result['by_op'].items()) + [('all', result['overall'])]:
+            old = old_rows.get(op)
+            if old is None:
+                continue
+            p95 = percent_change(old['latency_ms']['p95'], summary['latency_ms']['p95'])
+            rps = percent_change(old['throughput_rps'], summary['throughput_rps'])
+            regressed = p95 > threshold or rps < -threshold
+            regressions += regressed
+            print(f"  {'❌' if regressed else '✅'} {op:<10} "
+                  f"p50 {old['latency_ms']['p50']:.2f} -> {summary['latency_ms']['p50']:.2f} ms  "
+                  f"p95 {old['latency_ms']['p95']:.2f} -> {summary['latency_ms']['p95']:.2f} ms ({p95:+.1f}%)  "
+                  f"p99 {old['latency_ms']['p99']:.2f} -> {summary['latency_ms']['p99']:.2f} ms  "
+                  f"req/s {old['throughput_rps']:.1f} -> {summary['throughput_rps']:.1f} ({rps:+.1f}%)  "
+                  f"queries {old['queries_per_request']:.2f} -> {summary['queries_per_request']:.2f}")
+    return regressions
+
+def run(args):
+    if not is_local(os.environ.get('DATABASE_URL')) and not args.allow_remote:
+        print("❌ DATABASE_URL is not a local database; the benchmark writes users and trades "
+              "(pass --allow-remote to run anyway)")
+        return 1
+
+    mix = parse_mix(args.mix)
+    from trading_core import bootstrap
+    bootstrap.run_migrations()
+
+    results = new_results({
+        'sessions': args.sessions,
+        'duration': args.duration,
+        'warmup': args.warmup,
+        'mix': args.mix,
+        'seed': args.seed,
+        'tick_symbols': args.tick_symbols,
+        'ticks': args.ticks,
+        'model': args.model
+    })
+    for name in args.apps:
+        print(f"Benchmarking {name}: {args.sessions} sessions for {args.duration}s ({args.warmup}s warmup)")
+        results['apps'][name] = bench_app(name, args.sessions, args.duration, args.warmup, mix, args.seed)
+    if args.ticks:
+        print(f"Benchmarking tick: {args.ticks} ticks per universe")
+        results['apps']['tick'] = bench_tick(args.tick_symbols, args.ticks, args.model, args.seed,
+                                             conninfo=os.environ.get('DATABASE_URL'))
+    return finish(results, args)
+
+def run_tick(args):
+    conninfo = os.environ.get('DATABASE_URL') if args.db else None
+    if args.db and not conninfo:
+        print("❌ --db needs DATABASE_URL")
+        return 1
+    if conninfo is not None and not is_local(conninfo) and not args.allow_remote:
+        print("❌ DATABASE_URL is not a local database; engine ticks write prices and fill orders "
+              "(pass --allow-remote to run anyway)")
+        return 1
+
+    results = new_results({
+        'tick_symbols': args.symbols,
+        'ticks': args.ticks,
+        'model': args.model,
+        'seed': args.seed,
+        'db': args.db
+    })
+    print(f"Benchmarking tick: {args.ticks} ticks per universe{' and against DATABASE_URL' if conninfo else ''}")
+    results['apps']['tick'] = bench_tick(args.symbols, args.ticks, args.model, args.seed, conninfo=conninfo)
+    return finish(results, args)
+
+def new_results(config):
+    commit, dirty = git_commit()
+    return {
+        'commit': commit,
+        'dirty': dirty,
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'config': config,
+        'apps': {}
+    }
+
+# Print and write `results`, then compare against --baseline if given
+def finish(results, args):
+    print_results(results)
+
+    commit, dirty = results['commit'], results['dirty']
+    out = args.out or os.path.join(RESULTS_DIR, f"{commit or 'unknown'}{'-dirty' if dirty else ''}-"
+                                                f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✅ Results written to {out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        if regressions:
+            print(f"\n❌ {regressions} regression(s) beyond {args.threshold}%")
+            return 1
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load benchmark for the trading apps')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run the benchmark')
+    run_parser.add_argument('--apps', nargs='+', choices=sorted(APPS), default=sorted(APPS))
+    run_parser.add_argument('--sessions', type=int, default=20, help='concurrent sessions per app')
+    run_parser.add_argument('--duration', type=float, default=30, help='seconds recorded per app')
+    run_parser.add_argument('--warmup', type=float, default=5, help='seconds run before recording')
+    run_parser.add_argument('--mix', default=DEFAULT_MIX, help=f'op=weight list (default: {DEFAULT_MIX})')
+    run_parser.add_argument('--seed', type=int, default=1)
+    run_parser.add_argument('--out', help=f'results file (default: {RESULTS_DIR}/<commit>-<time>.json)')
+    run_parser.add_argument('--baseline', help='results file to compare against')
+    run_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='regression threshold in percent')
+    run_parser.add_argument('--allow-remote', action='store_true', help='allow a non-local DATABASE_URL')
+    run_parser.add_argument('--tick-symbols', type=int, nargs='+', default=DEFAULT_TICK_SYMBOLS,
+                            help='simulated universe sizes for the tick scenario')
+    run_parser.add_argument('--ticks', type=int, default=DEFAULT_TICKS, help='ticks timed per universe (0 to skip)')
+    run_parser.add_argument('--model', choices=sorted(MODELS), default=SIM_MODEL, help='market simulator model')
+
+    tick_parser = commands.add_parser('tick', help='time the market tick only')
+    tick_parser.add_argument('--symbols', type=int, nargs='+', default=DEFAULT_TICK_SYMBOLS,
+                             help='simulated universe sizes')
+    tick_parser.add_argument('--ticks', type=int, default=DEFAULT_TICKS, help='ticks timed per universe')
+    tick_parser.add_argument('--model', choices=sorted(MODELS), default=SIM_MODEL, help='market simulator model')
+    tick_parser.add_argument('--seed', type=int, default=1)
+    tick_parser.add_argument('--db', action='store_true', help='also time engine ticks against DATABASE_URL')
+    tick_parser.add_argument('--out', help=f'results file (default: {RESULTS_DIR}/<commit>-<time>.json)')
+    tick_parser.add_argument('--baseline', help='results file to compare against')
+    tick_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='regression threshold in percent')
+    tick_parser.add_argument('--allow-remote', action='store_true', help='allow a non-local DATABASE_URL')
+
+    compare_parser = commands.add_parser('compare', help='compare two results files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='regression threshold in percent')
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        return run(args)
+    if args.command == 'tick':
+        return run_tick(args)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"\n❌ {regressions} regression(s) beyond {args.threshold}%")
+        return 1
+    print("\n✅ No regressions")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
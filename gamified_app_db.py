@@ -1,358 +1,90 @@
 from flask import Flask, render_template, request, jsonify, session
-from datetime import datetime
-import psycopg
-from psycopg.rows import dict_row
 import os
-import json
+import asyncio
 from dotenv import load_dotenv
 import random
+import trading_core
+from trading_core import accounts, achievements, aio, bootstrap, dashboard, leaderboard, market_cache, metrics, order_book, orders, price_feed, routes, valuation
+from trading_core.asgi import AsgiApp
+from trading_core.clickstream import log_event
+from trading_core.db import get_db_connection
 
 load_dotenv()
 
 app = Flask(__name__)
+trading_core.init_app(app)
 app.secret_key = os.environ.get('SECRET_KEY', 'change-this-in-production-please')
 
-db_initialized = False
-
-@app.before_request
-def initialize_once():
-    global db_initialized
-    if not db_initialized:
-        init_db()
-        init_stock_data()
-        db_initialized = True
+# Number of recent trades shown on the dashboard
+HISTORY_LIMIT = 10
 
 @app.route("/health")
 def health():
     return "ok", 200
 
-# Database connection
-def get_db_connection():
-    conn = psycopg.connect(
-        os.environ.get('DATABASE_URL'),
-        row_factory=dict_row
-    )
-    return conn
-
-# Initialize database tables
-def init_db():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    # Users table
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            user_id SERIAL PRIMARY KEY,
-            session_id VARCHAR(255) UNIQUE NOT NULL,
-            platform_type VARCHAR(50) NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            initial_cash DECIMAL(12, 2) DEFAULT 100000.00,
-            current_cash DECIMAL(12, 2) DEFAULT 100000.00
-        )
-    ''')
-    
-    # Trades table
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS trades (
-            trade_id SERIAL PRIMARY KEY,
-            user_id INTEGER REFERENCES users(user_id),
-            session_id VARCHAR(255) NOT NULL,
-            symbol VARCHAR(10) NOT NULL,
-            action VARCHAR(10) NOT NULL,
-            shares INTEGER NOT NULL,
-            price DECIMAL(10, 2) NOT NULL,
-            total_cost DECIMAL(12, 2) NOT NULL,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Portfolio table
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS portfolio (
-            portfolio_id SERIAL PRIMARY KEY,
-            user_id INTEGER REFERENCES users(user_id),
-            session_id VARCHAR(255) NOT NULL,
-            symbol VARCHAR(10) NOT NULL,
-            shares INTEGER NOT NULL,
-            avg_price DECIMAL(10, 2) NOT NULL,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(session_id, symbol)
-        )
-    ''')
-    
-    # Clickstream table for detailed behavioral tracking
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS clickstream (
-            click_id SERIAL PRIMARY KEY,
-            user_id INTEGER REFERENCES users(user_id),
-            session_id VARCHAR(255) NOT NULL,
-            event_type VARCHAR(50) NOT NULL,
-            event_data JSONB,
-            page_url VARCHAR(255),
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Stock prices table
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS stock_prices (
-            symbol VARCHAR(10) PRIMARY KEY,
-            company_name VARCHAR(100) NOT NULL,
-            base_price DECIMAL(10, 2) NOT NULL,
-            current_price DECIMAL(10, 2) NOT NULL,
-            volatility VARCHAR(10) NOT NULL,
-            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Achievements table
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS achievements (
-            achievement_id SERIAL PRIMARY KEY,
-            user_id INTEGER REFERENCES users(user_id),
-            session_id VARCHAR(255) NOT NULL,
-            achievement_name VARCHAR(100) NOT NULL,
-            unlocked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(session_id, achievement_name)
-        )
-    ''')
-    
-    conn.commit()
-    cur.close()
-    conn.close()
+# New players start with the $100K Portfolio achievement unlocked
+STARTER_ACHIEVEMENTS = ('$100K Portfolio',)
 
 # Initialize session and user
 def init_user():
-    # Always ensure we have a session_id
-    if 'session_id' not in session:
-        session['session_id'] = os.urandom(16).hex()
-        print(f"Created new session_id: {session['session_id']}")
-    
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    # Check if user already exists for this session_id
-    cur.execute('SELECT user_id FROM users WHERE session_id = %s', (session['session_id'],))
-    existing_user = cur.fetchone()
-    
-    if existing_user:
-        # User exists, just set the session variable
-        session['user_id'] = existing_user['user_id']
-        print(f"Found existing user_id: {session['user_id']} for session: {session['session_id']}")
-    else:
-        # Create new user in database
-        print(f"Creating new user for session: {session['session_id']}")
-        cur.execute('''
-            INSERT INTO users (session_id, platform_type, initial_cash, current_cash)
-            VALUES (%s, %s, %s, %s)
-            RETURNING user_id
-        ''', (session['session_id'], 'gamified', 100000.00, 100000.00))
-        
-        user = cur.fetchone()
-        session['user_id'] = user['user_id']
-        print(f"Created new user_id: {session['user_id']}")
-        
-        # Unlock only the $100K Portfolio achievement initially
-        cur.execute('''
-            INSERT INTO achievements (user_id, session_id, achievement_name)
-            VALUES (%s, %s, %s)
-            ON CONFLICT (session_id, achievement_name) DO NOTHING
-        ''', (session['user_id'], session['session_id'], '$100K Portfolio'))
-        
-        conn.commit()
-        print(f"Committed user {session['user_id']} to database")
-    
-    cur.close()
-    conn.close()
-    
-    # Double-check the user exists
-    conn2 = get_db_connection()
-    cur2 = conn2.cursor()
-    cur2.execute('SELECT user_id FROM users WHERE user_id = %s', (session['user_id'],))
-    verify = cur2.fetchone()
-    cur2.close()
-    conn2.close()
-    
-    if not verify:
-        print(f"ERROR: User {session['user_id']} not found after init!")
-        raise Exception(f"User {session['user_id']} does not exist in database")
-    
-    print(f"Verified user {session['user_id']} exists in database")
+    accounts.init_user('gamified', starter_achievements=STARTER_ACHIEVEMENTS)
 
-# Log clickstream event
-def log_event(event_type, event_data=None):
-    if 'session_id' not in session or 'user_id' not in session:
-        return
-    
-    try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute('''
-            INSERT INTO clickstream (user_id, session_id, event_type, event_data, page_url)
-            VALUES (%s, %s, %s, %s, %s)
-        ''', (
-            session.get('user_id'),
-            session['session_id'],
-            event_type,
-            json.dumps(event_data) if event_data else None,
-            request.url
-        ))
-        
-        conn.commit()
-        cur.close()
-        conn.close()
-    except Exception as e:
-        # Silently fail if logging fails - don't break the app
-        print(f"Logging error: {e}")
-        pass
-
-# Update stock prices with algorithmic volatility
-def update_stock_prices():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    # Get all stocks
-    cur.execute('SELECT symbol, base_price, volatility FROM stock_prices')
-    stocks = cur.fetchall()
-    
-    for stock in stocks:
-        symbol = stock['symbol']
-        base_price = float(stock['base_price'])
-        volatility = stock['volatility']
-        
-        # Determine volatility range
-        if volatility == 'high':
-            change_percent = random.uniform(-0.05, 0.05)  # ±5%
-        elif volatility == 'medium':
-            change_percent = random.uniform(-0.02, 0.02)  # ±2%
-        else:  # low
-            change_percent = random.uniform(-0.01, 0.01)  # ±1%
-        
-        # Calculate new price
-        new_price = base_price * (1 + change_percent)
-        new_price = round(new_price, 2)
-        
-        # Update in database
-        cur.execute('''
-            UPDATE stock_prices 
-            SET current_price = %s, last_updated = CURRENT_TIMESTAMP
-            WHERE symbol = %s
-        ''', (new_price, symbol))
-    
-    conn.commit()
-    cur.close()
-    conn.close()
-
-# Initialize stock data if not exists
-def init_stock_data():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    stocks = [
-        ('AAPL', 'Apple Inc.', 178.50, 'medium'),
-        ('MSFT', 'Microsoft Corporation', 378.50, 'medium'),
-        ('GOOGL', 'Alphabet Inc.', 142.00, 'medium'),
-        ('AMZN', 'Amazon.com Inc.', 151.25, 'medium'),
-        ('META', 'Meta Platforms Inc.', 352.75, 'medium'),
-        ('TSLA', 'Tesla Inc.', 242.50, 'high'),
-        ('NVDA', 'NVIDIA Corporation', 478.00, 'high'),
-        ('AMD', 'Advanced Micro Devices', 138.25, 'high'),
-        ('JPM', 'JPMorgan Chase & Co.', 158.75, 'low'),
-        ('BAC', 'Bank of America Corp.', 33.50, 'low'),
-        ('WMT', 'Walmart Inc.', 168.25, 'low'),
-        ('PG', 'Procter & Gamble Co.', 155.50, 'low'),
-        ('JNJ', 'Johnson & Johnson', 157.75, 'low'),
-        ('DIS', 'The Walt Disney Company', 96.50, 'medium'),
-        ('NKE', 'Nike Inc.', 108.75, 'medium'),
-        ('NFLX', 'Netflix Inc.', 442.50, 'high'),
-        ('COST', 'Costco Wholesale Corp.', 588.25, 'low'),
-        ('V', 'Visa Inc.', 258.50, 'low'),
-        ('MA', 'Mastercard Inc.', 412.75, 'low'),
-        ('PEP', 'PepsiCo Inc.', 172.50, 'low')
-    ]
-    
-    for symbol, name, price, volatility in stocks:
-        cur.execute('''
-            INSERT INTO stock_prices (symbol, company_name, base_price, current_price, volatility)
-            VALUES (%s, %s, %s, %s, %s)
-            ON CONFLICT (symbol) DO NOTHING
-        ''', (symbol, name, price, price, volatility))
-    
-    conn.commit()
-    cur.close()
-    conn.close()
+# Format a cached quote for the market table
+def format_quote(quote):
+    return {
+        'symbol': quote['symbol'],
+        'name': quote['name'],
+        'price': quote['price'],
+        'change': quote['change'],
+        'percent': quote['percent'],
+        'volume': f"{random.randint(10, 250)}M"
+    }
 
-# Get current stock prices
-def get_market_data():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    cur.execute('''
-        SELECT symbol, company_name, current_price, base_price, volatility
-        FROM stock_prices
-        ORDER BY symbol
-    ''')
-    stocks = cur.fetchall()
-    
-    cur.close()
-    conn.close()
-    
-    market_data = []
-    for stock in stocks:
-        current = float(stock['current_price'])
-        base = float(stock['base_price'])
-        change = current - base
-        percent = (change / base * 100) if base > 0 else 0
-        
-        market_data.append({
-            'symbol': stock['symbol'],
-            'name': stock['company_name'],
-            'price': current,
-            'change': change,
-            'percent': percent,
-            'volume': f"{random.randint(10, 250)}M"
-        })
-    
-    return market_data
+# Get current stock prices, formatted once per cached snapshot
+def get_market_data(snapshot=None):
+    snapshot = snapshot or market_cache.get_snapshot()
+    return snapshot.view('gamified', format_quote)
 
 # Get user's unlocked achievements
 def get_user_achievements():
-    if 'session_id' not in session:
+    if 'user_id' not in session:
         return []
+    return achievements.get_user_achievements(session['user_id'])
+
+# Cash, positions and totals for a user, in the template's field names.
+# Returns None if the user has no users row.
+def get_portfolio(user_id, snapshot=None):
+    return portfolio_view(valuation.value_account(user_id, snapshot))
+
+# A valuation.value_account() result in the template's field names
+def portfolio_view(account):
+    if account is None:
+        return None
     
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    cur.execute('''
-        SELECT achievement_name
-        FROM achievements
-        WHERE session_id = %s
-    ''', (session['session_id'],))
-    
-    unlocked = [row['achievement_name'] for row in cur.fetchall()]
-    
-    cur.close()
-    conn.close()
-    
-    all_achievements = [
-        {'name': 'First Trade', 'icon': '🎯', 'unlocked': 'First Trade' in unlocked},
-        {'name': '10 Day Streak', 'icon': '🔥', 'unlocked': '10 Day Streak' in unlocked},
-        {'name': 'Green Week', 'icon': '💚', 'unlocked': 'Green Week' in unlocked},
-        {'name': '$100K Portfolio', 'icon': '💎', 'unlocked': '$100K Portfolio' in unlocked},
-        {'name': 'Top 100', 'icon': '🏆', 'unlocked': 'Top 100' in unlocked},
-        {'name': 'Day Trader', 'icon': '⚡', 'unlocked': 'Day Trader' in unlocked}
-    ]
+    portfolio_value = account['total_value']
+    positions = account['positions']
     
-    return all_achievements
+    return {
+        'cash': account['cash'],
+        'portfolio_value': portfolio_value,
+        'daily_change': portfolio_value - 100000.00,
+        'daily_change_percent': ((portfolio_value - 100000.00) / 100000.00 * 100),
+        'positions': [{
+            'symbol': item['symbol'],
+            'shares': item['shares'],
+            'avg_price': item['avg_price'],
+            'current_price': item['current_price'],
+            'current_value': item['market_value'],
+            'gain_loss': item['gain_loss'],
+            'gain_loss_percent': item['gain_loss_percent']
+        } for item in positions]
+    }
 
 @app.route('/')
 def index():
     try:
-        init_db()  # Ensure tables exist first
-        init_stock_data()
-        update_stock_prices()
-        init_user()  # Initialize user - this now guarantees user_id is set
+        with metrics.phase('user'):
+            init_user()  # Initialize user - this now guarantees user_id is set
         
         print(f"After init_user - session_id: {session.get('session_id')}, user_id: {session.get('user_id')}")
         
@@ -362,117 +94,26 @@ def index():
         session_id = session['session_id']
         user_id = session['user_id']  # This is now guaranteed to exist
         
-        # Get user's current cash
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute('SELECT current_cash, user_id FROM users WHERE user_id = %s', (user_id,))
-        user = cur.fetchone()
-        
-        if not user:
+        with metrics.phase('snapshot'):
+            snapshot = market_cache.get_snapshot()
+        # Cash, positions, trade history and achievements in one round-trip
+        with metrics.phase('dashboard'):
+            data = dashboard.load_dashboard(user_id, snapshot, HISTORY_LIMIT, with_achievements=True)
+        if data is None:
+            # The session points at a users row that no longer exists
+            # (e.g. the database was reset); resolve it again
+            accounts.forget_user()
+            init_user()
+            user_id = session['user_id']
+            data = dashboard.load_dashboard(user_id, snapshot, HISTORY_LIMIT, with_achievements=True)
+        if data is None:
             # This should never happen, but just in case
             print(f"ERROR: User {user_id} not found when querying")
-            cur.close()
-            conn.close()
             return f"Error: User {user_id} not found in database. Session: {session_id}", 500
         
-        print(f"Found user: {user}")
-        current_cash = float(user['current_cash'])
-        
-        # Get portfolio from database
-        cur.execute('''
-            SELECT symbol, shares, avg_price 
-            FROM portfolio 
-            WHERE session_id = %s
-        ''', (session_id,))
-        portfolio_data = cur.fetchall()
-        
-        # Calculate portfolio value
-        portfolio_value = current_cash
-        portfolio_items = []
-        market_data = get_market_data()
-        
-        for item in portfolio_data:
-            stock = next((s for s in market_data if s['symbol'] == item['symbol']), None)
-            if stock:
-                current_value = item['shares'] * stock['price']
-                cost_basis = item['shares'] * float(item['avg_price'])
-                gain_loss = current_value - cost_basis
-                gain_loss_percent = (gain_loss / cost_basis * 100) if cost_basis > 0 else 0
-                
-                portfolio_value += current_value
-                
-                portfolio_items.append({
-                    'symbol': item['symbol'],
-                    'shares': item['shares'],
-                    'avg_price': float(item['avg_price']),
-                    'current_price': stock['price'],
-                    'current_value': current_value,
-                    'gain_loss': gain_loss,
-                    'gain_loss_percent': gain_loss_percent
-                })
-        
-        # Get trade history
-        cur.execute('''
-            SELECT symbol, action, shares, price, total_cost, timestamp
-            FROM trades
-            WHERE session_id = %s
-            ORDER BY timestamp DESC
-            LIMIT 10
-        ''', (session_id,))
-        trade_history = cur.fetchall()
-        
-        cur.close()
-        conn.close()
-        
-        user_stats = {
-            'rank': 100,
-            'total_users': 12453,
-            'streak': 0,
-            'badges': 1,
-            'portfolio_value': portfolio_value,
-            'cash': current_cash,
-            'daily_change': portfolio_value - 100000.00,
-            'daily_change_percent': ((portfolio_value - 100000.00) / 100000.00 * 100),
-            'level': 'Beginner',
-            'xp': 0,
-            'next_level_xp': 1000
-        }
-        
-        # Top 10 leaderboard only
-        leaderboard = [
-            {'rank': 1, 'name': 'TradeMaster_99', 'returns': 147.3, 'streak': 45, 'badge': '🏆'},
-            {'rank': 2, 'name': 'BullMarket_King', 'returns': 132.8, 'streak': 38, 'badge': '🥈'},
-            {'rank': 3, 'name': 'DiamondHands_Pro', 'returns': 128.5, 'streak': 31, 'badge': '🥉'},
-            {'rank': 4, 'name': 'MoonShot_Trader', 'returns': 119.2, 'streak': 28, 'badge': '⭐'},
-            {'rank': 5, 'name': 'StockWhiz_AI', 'returns': 115.7, 'streak': 25, 'badge': '⭐'},
-            {'rank': 6, 'name': 'RocketTrader_X', 'returns': 108.3, 'streak': 22, 'badge': '⭐'},
-            {'rank': 7, 'name': 'Alpha_Seeker', 'returns': 102.5, 'streak': 20, 'badge': '⭐'},
-            {'rank': 8, 'name': 'Market_Maven', 'returns': 98.7, 'streak': 18, 'badge': '⭐'},
-            {'rank': 9, 'name': 'Trade_Genius', 'returns': 94.3, 'streak': 15, 'badge': '⭐'},
-            {'rank': 10, 'name': 'Portfolio_Pro', 'returns': 89.1, 'streak': 12, 'badge': '⭐'}
-        ]
-        
-        achievements = get_user_achievements()
-        
-        # Format trade history
-        formatted_history = []
-        for trade in trade_history:
-            formatted_history.append({
-                'symbol': trade['symbol'],
-                'action': trade['action'],
-                'shares': trade['shares'],
-                'price': float(trade['price']),
-                'total': float(trade['total_cost']),
-                'timestamp': trade['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
-            })
-        
-        return render_template('gamified.html',
-                             user_stats=user_stats,
-                             leaderboard=leaderboard,
-                             market_data=market_data,
-                             achievements=achievements,
-                             portfolio=portfolio_items,
-                             trade_history=formatted_history)
+        with metrics.phase('leaderboard'):
+            ranking = get_leaderboard(user_id)
+        return render_dashboard(snapshot, data, ranking)
         
     except Exception as e:
         print(f"Index route error: {e}")
@@ -480,12 +121,49 @@ def index():
         traceback.print_exc()
         return f"Error loading page: {str(e)}", 500
 
+# Live rank among every trader, trading streak and the top 10
+def get_leaderboard(user_id):
+    board = leaderboard.ensure_started()
+    rank, total_users, streak = board.rank_of(user_id)
+    return rank, total_users, streak, board.top(10)
+
+# `data` is a dashboard.load_dashboard() result with achievements
+def render_dashboard(snapshot, data, ranking):
+    portfolio = portfolio_view(data['account'])
+    rank, total_users, streak, leaderboard_top = ranking
+    
+    user_stats = {
+        'rank': rank,
+        'total_users': total_users,
+        'streak': streak,
+        'badges': 1,
+        'portfolio_value': portfolio['portfolio_value'],
+        'cash': portfolio['cash'],
+        'daily_change': portfolio['daily_change'],
+        'daily_change_percent': portfolio['daily_change_percent'],
+        'level': 'Beginner',
+        'xp': 0,
+        'next_level_xp': 1000
+    }
+    
+    with metrics.phase('render'):
+        return render_template('gamified.html',
+                             user_stats=user_stats,
+                             leaderboard=leaderboard_top,
+                             market_data=get_market_data(snapshot),
+                             achievements=data['achievements'],
+                             portfolio=portfolio['positions'],
+                             trade_history=data['history'],
+                             trade_history_limit=HISTORY_LIMIT,
+                             price_stream=price_feed.streaming_enabled())
+
 @app.route('/trade', methods=['POST'])
 def trade():
     try:
         # Ensure user is initialized
         if 'session_id' not in session or 'user_id' not in session:
-            init_user()
+            with metrics.phase('user'):
+                init_user()
         
         data = request.json
         if not data:
@@ -507,167 +185,74 @@ def trade():
         if not symbol:
             return jsonify({'success': False, 'message': 'Please select a symbol from the Market Data list'})
         
-        market_data = get_market_data()
-        stock = next((s for s in market_data if s['symbol'] == symbol), None)
+        stock = market_cache.get_snapshot().by_symbol.get(symbol)
         if not stock:
             return jsonify({'success': False, 'message': 'Please select a symbol from the Market Data list'})
         
-        price = stock['price']
-        total_cost = shares * price
-        session_id = session['session_id']
-        user_id = session['user_id']
-        
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # Get current cash
-        cur.execute('SELECT current_cash FROM users WHERE session_id = %s', (session_id,))
-        user = cur.fetchone()
-        if not user:
-            cur.close()
-            conn.close()
-            return jsonify({'success': False, 'message': 'User not found'})
-        
-        current_cash = float(user['current_cash'])
-        
-        # Check if this is the user's first trade
-        cur.execute('SELECT COUNT(*) as count FROM trades WHERE session_id = %s', (session_id,))
-        trade_count = cur.fetchone()['count']
-        is_first_trade = trade_count == 0
-        
-        if action == 'buy':
-            if total_cost > current_cash:
-                cur.close()
-                conn.close()
-                return jsonify({'success': False, 'message': 'Insufficient funds'})
-            
-            # Update cash
-            new_cash = current_cash - total_cost
-            cur.execute('UPDATE users SET current_cash = %s WHERE session_id = %s', (new_cash, session_id))
-            
-            # Update portfolio
-            cur.execute('SELECT shares, avg_price FROM portfolio WHERE session_id = %s AND symbol = %s', (session_id, symbol))
-            existing = cur.fetchone()
-            
-            if existing:
-                old_shares = existing['shares']
-                old_avg = float(existing['avg_price'])
-                new_shares = old_shares + shares
-                new_avg = ((old_shares * old_avg) + (shares * price)) / new_shares
-                
-                cur.execute('''
-                    UPDATE portfolio 
-                    SET shares = %s, avg_price = %s, updated_at = CURRENT_TIMESTAMP
-                    WHERE session_id = %s AND symbol = %s
-                ''', (new_shares, new_avg, session_id, symbol))
-            else:
-                cur.execute('''
-                    INSERT INTO portfolio (user_id, session_id, symbol, shares, avg_price)
-                    VALUES (%s, %s, %s, %s, %s)
-                ''', (user_id, session_id, symbol, shares, price))
-            
-            # Record trade
-            cur.execute('''
-                INSERT INTO trades (user_id, session_id, symbol, action, shares, price, total_cost)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            ''', (user_id, session_id, symbol, 'BUY', shares, price, total_cost))
-            
-            # Unlock First Trade achievement if this is first trade
-            if is_first_trade:
-                cur.execute('''
-                    INSERT INTO achievements (user_id, session_id, achievement_name)
-                    VALUES (%s, %s, %s)
-                    ON CONFLICT (session_id, achievement_name) DO NOTHING
-                ''', (user_id, session_id, 'First Trade'))
-            
-            conn.commit()
-            cur.close()
-            conn.close()
-            
-            log_event('trade_completed', {
-                'symbol': symbol,
-                'shares': shares,
-                'action': 'buy',
-                'price': price,
-                'total': total_cost
-            })
-            
-            response = {
-                'success': True,
-                'message': f'Successfully bought {shares} shares of {symbol}!',
-                'cash': new_cash
-            }
-            
-            if is_first_trade:
-                response['achievement_unlocked'] = 'First Trade'
-            
-            return jsonify(response)
+        if action not in ('buy', 'sell'):
+            return jsonify({'success': False, 'message': 'Invalid action'})
         
-        elif action == 'sell':
-            cur.execute('SELECT shares FROM portfolio WHERE session_id = %s AND symbol = %s', (session_id, symbol))
-            portfolio_item = cur.fetchone()
-            
-            if not portfolio_item or portfolio_item['shares'] < shares:
-                cur.close()
-                conn.close()
-                return jsonify({'success': False, 'message': 'Insufficient shares'})
-            
-            # Update cash
-            new_cash = current_cash + total_cost
-            cur.execute('UPDATE users SET current_cash = %s WHERE session_id = %s', (new_cash, session_id))
-            
-            # Update portfolio
-            new_shares = portfolio_item['shares'] - shares
-            if new_shares == 0:
-                cur.execute('DELETE FROM portfolio WHERE session_id = %s AND symbol = %s', (session_id, symbol))
-            else:
-                cur.execute('''
-                    UPDATE portfolio 
-                    SET shares = %s, updated_at = CURRENT_TIMESTAMP
-                    WHERE session_id = %s AND symbol = %s
-                ''', (new_shares, session_id, symbol))
-            
-            # Record trade
-            cur.execute('''
-                INSERT INTO trades (user_id, session_id, symbol, action, shares, price, total_cost)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            ''', (user_id, session_id, symbol, 'SELL', shares, price, total_cost))
+        # Limit and stop orders rest in the book until a tick triggers them
+        order_type = data.get('order_type', 'market')
+        if order_type != 'market':
+            try:
+                with metrics.phase('order'):
+                    order = order_book.place_order(get_db_connection(), session['user_id'], symbol, action,
+                                                   order_type, shares, data.get('price'),
+                                                   market_cache.get_snapshot().by_symbol)
+            except orders.OrderRejected as e:
+                return jsonify({'success': False, 'message': str(e)})
             
-            # Unlock First Trade achievement if this is first trade
-            if is_first_trade:
-                cur.execute('''
-                    INSERT INTO achievements (user_id, session_id, achievement_name)
-                    VALUES (%s, %s, %s)
-                    ON CONFLICT (session_id, achievement_name) DO NOTHING
-                ''', (user_id, session_id, 'First Trade'))
-            
-            conn.commit()
-            cur.close()
-            conn.close()
-            
-            log_event('trade_completed', {
+            log_event('order_placed', {
+                'order_id': order['order_id'],
                 'symbol': symbol,
                 'shares': shares,
-                'action': 'sell',
-                'price': price,
-                'total': total_cost
+                'action': action,
+                'order_type': order_type,
+                'price': order['price']
             })
             
-            response = {
+            return jsonify({
                 'success': True,
-                'message': f'Successfully sold {shares} shares of {symbol}!',
-                'cash': new_cash
-            }
-            
-            if is_first_trade:
-                response['achievement_unlocked'] = 'First Trade'
-            
-            return jsonify(response)
+                'message': f'{order_type.title()} order placed: {action.upper()} {shares} {symbol} at ${order["price"]:.2f}',
+                'order': order,
+                'orders': order_book.get_open_orders(session['user_id'])
+            })
         
-        else:
-            cur.close()
-            conn.close()
-            return jsonify({'success': False, 'message': 'Invalid action'})
+        # Balance check, cash, position and trade in one locked transaction
+        try:
+            with metrics.phase('order'):
+                fill = orders.execute_order(get_db_connection(), session['user_id'], symbol, action,
+                                            shares, stock['price'], award_achievements=True)
+        except orders.OrderRejected as e:
+            return jsonify({'success': False, 'message': str(e)})
+        
+        log_event('trade_completed', {
+            'symbol': symbol,
+            'shares': shares,
+            'action': action,
+            'price': fill['price'],
+            'total': fill['total']
+        })
+        
+        with metrics.phase('portfolio'):
+            portfolio = get_portfolio(session['user_id'])
+        
+        verb = 'bought' if action == 'buy' else 'sold'
+        response = {
+            'success': True,
+            'message': f'Successfully {verb} {shares} shares of {symbol}!',
+            'cash': fill['cash'],
+            # Everything the page needs to update itself without a reload
+            'trade': accounts.format_trade(fill),
+            'portfolio': portfolio
+        }
+        
+        if fill['achievements']:
+            response['achievement_unlocked'] = fill['achievements'][0]
+            response['achievements_unlocked'] = fill['achievements']
+        
+        return jsonify(response)
         
     except Exception as e:
         print(f"Trade route error: {e}")
@@ -675,6 +260,153 @@ def trade():
         traceback.print_exc()
         return jsonify({'success': False, 'message': f'Server error: {str(e)}'})
 
+@app.route('/trade/batch', methods=['POST'])
+def trade_batch():
+    try:
+        # Ensure user is initialized
+        if 'session_id' not in session or 'user_id' not in session:
+            init_user()
+        
+        data = request.json
+        if not data or not isinstance(data.get('orders'), list) or not data['orders']:
+            return jsonify({'success': False, 'message': 'No orders received'})
+        
+        if len(data['orders']) > orders.MAX_BATCH_ORDERS:
+            return jsonify({'success': False, 'message': f'At most {orders.MAX_BATCH_ORDERS} orders per batch'})
+        
+        atomic = bool(data.get('atomic', False))
+        
+        # Every order is validated and priced against the same snapshot
+        snapshot = market_cache.get_snapshot()
+        try:
+            results, summary = orders.execute_batch(get_db_connection(), session['user_id'], data['orders'],
+                                                    snapshot.by_symbol, atomic=atomic, award_achievements=True)
+        except orders.OrderRejected as e:
+            return jsonify({'success': False, 'message': str(e)})
+        
+        log_event('trade_batch_completed', {
+            'orders': len(results),
+            'filled': summary['filled'],
+            'rejected': summary['rejected'],
+            'atomic': atomic
+        })
+        
+        response = {
+            'success': summary['filled'] > 0,
+            'message': f"Filled {summary['filled']} of {len(results)} orders",
+            'results': results,
+            'cash': summary['cash'],
+            'portfolio': get_portfolio(session['user_id'])
+        }
+        
+        if summary['achievements']:
+            response['achievement_unlocked'] = summary['achievements'][0]
+            response['achievements_unlocked'] = summary['achievements']
+        
+        return jsonify(response)
+        
+    except Exception as e:
+        print(f"Batch trade route error: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'message': f'Server error: {str(e)}'})
+
+# JSON read API, used by the page to update itself in place after a trade
+
+@app.route('/api/portfolio')
+def api_portfolio():
+    init_user()
+    portfolio = get_portfolio(session['user_id'])
+    if portfolio is None:
+        return jsonify({'success': False, 'message': 'User not found'}), 404
+    return jsonify(portfolio)
+
+@app.route('/api/history')
+def api_history():
+    init_user()
+    return jsonify({'trades': accounts.get_trade_history(session['user_id'], HISTORY_LIMIT)})
+
+@app.route('/api/leaderboard')
+def api_leaderboard():
+    init_user()
+    rank, total_users, streak, top = get_leaderboard(session['user_id'])
+    return jsonify({'rank': rank, 'total_users': total_users, 'streak': streak, 'top': top})
+
+@app.route('/api/achievements')
+def api_achievements():
+    init_user()
+    return jsonify({'achievements': get_user_achievements()})
+
+# ASGI serving mode: `uvicorn gamified_app_db:asgi_app`. The read routes
+# below replace their sync views on the event loop; trades run the sync views
+# above on the ASGI app's thread pool. Quotes, bars and order changes are the
+# shared routes in trading_core.routes, registered here for both modes.
+asgi_app = AsgiApp(app)
+routes.init_app(app, asgi_app, 'gamified', format_quote, starter_achievements=STARTER_ACHIEVEMENTS)
+
+async def init_user_async():
+    return await aio.init_user('gamified', starter_achievements=STARTER_ACHIEVEMENTS)
+
+async def get_portfolio_async(user_id, snapshot):
+    return portfolio_view(await aio.value_account(user_id, snapshot))
+
+# The user's dashboard rows (one round-trip) and the leaderboard, concurrently
+async def load_dashboard_async(user_id, snapshot):
+    return await asyncio.gather(aio.load_dashboard(user_id, snapshot, HISTORY_LIMIT, with_achievements=True),
+                                aio.run_sync(get_leaderboard, user_id))
+
+@asgi_app.view('index')
+async def index_async():
+    try:
+        with metrics.phase('user'):
+            user_id = await init_user_async()
+        log_event('page_view', {'page': 'home'})
+        
+        with metrics.phase('snapshot'):
+            snapshot = await aio.get_snapshot()
+        with metrics.phase('dashboard'):
+            data, ranking = await load_dashboard_async(user_id, snapshot)
+        if data is None:
+            # The session points at a users row that no longer exists; resolve it again
+            accounts.forget_user()
+            user_id = await init_user_async()
+            data, ranking = await load_dashboard_async(user_id, snapshot)
+        if data is None:
+            print(f"ERROR: User {user_id} not found when querying")
+            return f"Error: User {user_id} not found in database. Session: {session['session_id']}", 500
+        
+        return render_dashboard(snapshot, data, ranking)
+        
+    except Exception as e:
+        print(f"Index route error: {e}")
+        import traceback
+        traceback.print_exc()
+        return f"Error loading page: {str(e)}", 500
+
+@asgi_app.view('api_portfolio')
+async def api_portfolio_async():
+    user_id = await init_user_async()
+    portfolio = await get_portfolio_async(user_id, await aio.get_snapshot())
+    if portfolio is None:
+        return jsonify({'success': False, 'message': 'User not found'}), 404
+    return jsonify(portfolio)
+
+@asgi_app.view('api_history')
+async def api_history_async():
+    user_id = await init_user_async()
+    return jsonify({'trades': await aio.get_trade_history(user_id, HISTORY_LIMIT)})
+
+@asgi_app.view('api_leaderboard')
+async def api_leaderboard_async():
+    user_id = await init_user_async()
+    rank, total_users, streak, top = await aio.run_sync(get_leaderboard, user_id)
+    return jsonify({'rank': rank, 'total_users': total_users, 'streak': streak, 'top': top})
+
+@asgi_app.view('api_achievements')
+async def api_achievements_async():
+    user_id = await init_user_async()
+    return jsonify({'achievements': await aio.get_user_achievements(user_id)})
+
 if __name__ == '__main__':
-    init_db()
+    bootstrap.run_migrations()
     app.run(debug=True, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
@@ -0,0 +1,56 @@
+import os
+import sys
+import uuid
+import pytest
+from dotenv import load_dotenv
+
+# Tests import trading_core from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+load_dotenv()
+
+# Tables holding a user's rows, deleted before the user
+USER_TABLES = ('orders', 'trades', 'portfolio', 'achievements', 'user_stats')
+
+# DATABASE_URL with the schema migrated; tests using it are skipped when it
+# is unset or unreachable. They write real rows, so only point it at a local
+# database.
+@pytest.fixture(scope='session')
+def database_url():
+    url = os.environ.get('DATABASE_URL')
+    if not url:
+        pytest.skip('DATABASE_URL is not set')
+    from trading_core import bootstrap
+    try:
+        conn = bootstrap.get_connection()
+    except Exception as e:
+        pytest.skip(f"Database unavailable: {e}")
+    try:
+        bootstrap.run_migrations(conn)
+    finally:
+        conn.close()
+    return url
+
+@pytest.fixture
+def db_conn(database_url):
+    from trading_core import bootstrap
+    conn = bootstrap.get_connection()
+    yield conn
+    conn.close()
+
+# A new user with STARTING_CASH, removed with everything it owns afterwards
+@pytest.fixture
+def db_user(db_conn):
+    from trading_core import accounts
+    cur = db_conn.cursor()
+    cur.execute(accounts.RESOLVE_USER_SQL,
+                accounts.resolve_params(f"test-{uuid.uuid4().hex}", 'traditional', ()))
+    user_id = cur.fetchone()['user_id']
+    db_conn.commit()
+    yield user_id
+    db_conn.rollback()
+    for table in USER_TABLES:
+        cur.execute(f'DELETE FROM {table} WHERE user_id = %s', (user_id,))
+    cur.execute('DELETE FROM users WHERE user_id = %s', (user_id,))
+    db_conn.commit()
+    cur.close()
@@ -0,0 +1,116 @@
+from collections import OrderedDict
+import pytest
+from flask import Flask, jsonify, session
+from trading_core import accounts
+
+# Fake pooled connection answering RESOLVE_USER_SQL with the next queued row
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        assert sql is accounts.RESOLVE_USER_SQL
+        self.conn.resolved.append(params['session_id'])
+
+    def fetchone(self):
+        return self.conn.rows.pop(0)
+
+    def close(self):
+        pass
+
+class FakeConn:
+    def __init__(self, *rows):
+        self.rows = list(rows)
+        self.resolved = []
+        self.commits = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+@pytest.fixture(autouse=True)
+def user_cache(monkeypatch):
+    cache = OrderedDict()
+    monkeypatch.setattr(accounts, '_user_cache', cache)
+    return cache
+
+@pytest.fixture
+def db(monkeypatch):
+    conn = FakeConn()
+    monkeypatch.setattr(accounts, 'get_db_connection', lambda: conn)
+    return conn
+
+def make_app(secret='test-secret'):
+    app = Flask(__name__)
+    app.secret_key = secret
+
+    @app.route('/whoami')
+    def whoami():
+        return jsonify({'user_id': accounts.init_user('traditional'), 'session_id': session['session_id']})
+
+    return app
+
+def test_cache_evicts_the_least_recently_used(monkeypatch, user_cache):
+    monkeypatch.setattr(accounts, 'USER_CACHE_SIZE', 2)
+    accounts.cache_user_id('a', 1)
+    accounts.cache_user_id('b', 2)
+    assert accounts.cached_user_id('a') == 1
+    accounts.cache_user_id('c', 3)
+    assert list(user_cache) == ['a', 'c']
+    assert accounts.cached_user_id('b') is None
+
+def test_resolves_a_new_session_once(db):
+    db.rows = [{'user_id': 7, 'created': True}]
+    client = make_app().test_client()
+    first = client.get('/whoami').get_json()
+    assert first['user_id'] == 7
+    assert db.resolved == [first['session_id']]
+    assert db.commits == 1
+    # The signed cookie now carries the user_id, so no further lookups
+    assert client.get('/whoami').get_json() == first
+    assert len(db.resolved) == 1
+
+def test_cached_session_skips_the_database(db, user_cache):
+    app = make_app()
+    with app.test_request_context():
+        session['session_id'] = 'known'
+        accounts.cache_user_id('known', 42)
+        assert accounts.init_user('traditional') == 42
+        assert session['user_id'] == 42
+    assert db.resolved == []
+
+def test_lost_creation_race_resolves_again(db):
+    db.rows = [None, {'user_id': 9, 'created': False}]
+    with make_app().test_request_context():
+        assert accounts.init_user('gamified') == 9
+    assert len(db.resolved) == 2
+
+def test_forget_user_drops_the_session_and_cache(db, user_cache):
+    db.rows = [{'user_id': 12, 'created': False}]
+    with make_app().test_request_context():
+        session['session_id'] = 'stale'
+        session['user_id'] = 11
+        accounts.cache_user_id('stale', 11)
+        accounts.forget_user()
+        assert 'user_id' not in session
+        assert 'stale' not in user_cache
+        assert accounts.init_user('traditional') == 12
+    assert db.resolved == ['stale']
+
+def test_forged_session_cookie_is_not_trusted(db):
+    db.rows = [{'user_id': 5, 'created': True}]
+    # A cookie claiming user 1, signed with some other key
+    forger = make_app(secret='not-our-secret').test_client()
+    with forger.session_transaction() as forged:
+        forged['session_id'] = 'victim'
+        forged['user_id'] = 1
+    cookie = forger.get_cookie('session').value
+
+    client = make_app().test_client()
+    client.set_cookie('session', cookie)
+    data = client.get('/whoami').get_json()
+    assert data['user_id'] == 5
+    assert data['session_id'] != 'victim'
+    assert db.resolved == [data['session_id']]
@@ -0,0 +1,72 @@
+from datetime import date
+from trading_core import achievements
+from trading_core.achievements import ACHIEVEMENTS, BITS, AchievementWriter, catalog, evaluate, week_start
+
+def test_bits_are_unique_and_stable():
+    assert len(set(BITS.values())) == len(ACHIEVEMENTS)
+    # Stored in user_stats.unlocked; shipped bits must never move
+    assert BITS == {
+        'First Trade': 1,
+        '10 Day Streak': 2,
+        'Green Week': 4,
+        '$100K Portfolio': 8,
+        'Top 100': 16,
+        'Day Trader': 32
+    }
+
+def test_every_rule_has_a_known_event_and_operator():
+    for achievement in ACHIEVEMENTS:
+        assert achievement['event'] in ('trade', 'tick')
+        for _, op, _ in achievement['conditions']:
+            assert op in achievements.OPERATORS
+
+def test_first_trade():
+    assert evaluate('trade', {'trade_count': 0, 'trades_today': 0, 'streak_days': 0}) == []
+    assert evaluate('trade', {'trade_count': 1, 'trades_today': 1, 'streak_days': 1}) == ['First Trade']
+
+def test_trade_thresholds():
+    metrics = {'trade_count': 25, 'trades_today': 10, 'streak_days': 10}
+    assert evaluate('trade', metrics) == ['First Trade', '10 Day Streak', 'Day Trader']
+    metrics = {'trade_count': 25, 'trades_today': 9, 'streak_days': 9}
+    assert evaluate('trade', metrics) == ['First Trade']
+
+def test_unlocked_achievements_are_skipped():
+    metrics = {'trade_count': 25, 'trades_today': 10, 'streak_days': 10}
+    unlocked = BITS['First Trade'] | BITS['Day Trader']
+    assert evaluate('trade', metrics, unlocked) == ['10 Day Streak']
+
+def test_rules_only_fire_for_their_event():
+    assert evaluate('tick', {'trade_count': 1}) == []
+    assert evaluate('trade', {'total_value': 200000, 'rank': 1}) == []
+    assert evaluate('unknown', {'trade_count': 1}) == []
+
+def test_tick_rules():
+    assert evaluate('tick', {'total_value': 100000, 'rank': 101, 'trade_count': 1}) == ['$100K Portfolio']
+    assert evaluate('tick', {'total_value': 99999.99, 'rank': 100, 'trade_count': 1}) == ['Top 100']
+    # Top 100 needs a trade, so untouched starting accounts don't qualify
+    assert evaluate('tick', {'total_value': 99999.99, 'rank': 1, 'trade_count': 0}) == []
+
+def test_missing_metrics_never_match():
+    assert evaluate('tick', {'total_value': 100000}) == ['$100K Portfolio']
+    assert evaluate('tick', {'total_value': 100000, 'closed_week_pnl': None}) == ['$100K Portfolio']
+    assert 'Green Week' in evaluate('tick', {'closed_week_pnl': 0.01})
+    assert 'Green Week' not in evaluate('tick', {'closed_week_pnl': 0})
+
+def test_week_start_is_monday():
+    assert week_start(date(2024, 1, 1)) == date(2024, 1, 1)
+    assert week_start(date(2024, 1, 7)) == date(2024, 1, 1)
+    assert week_start(date(2024, 1, 8)) == date(2024, 1, 8)
+
+def test_catalog_keeps_display_order():
+    rows = catalog({'Top 100'})
+    assert [row['name'] for row in rows] == [achievement['name'] for achievement in ACHIEVEMENTS]
+    assert [row['name'] for row in rows if row['unlocked']] == ['Top 100']
+
+def test_writer_reports_queued_unlocks_as_pending():
+    # Never started, so nothing is written
+    writer = AchievementWriter()
+    writer.unlock(1, ['First Trade'])
+    writer.unlock(1, ['Day Trader'])
+    assert writer.pending(1) == {'First Trade', 'Day Trader'}
+    assert writer.pending(2) == set()
+    assert writer.queue.qsize() == 2
@@ -0,0 +1,119 @@
+import asyncio
+from flask import Flask, jsonify, request
+from werkzeug.wrappers import Request
+from trading_core.asgi import AsgiApp, build_environ, encode_headers
+
+def scope(**overrides):
+    base = {
+        'type': 'http',
+        'http_version': '1.1',
+        'method': 'POST',
+        'scheme': 'https',
+        'path': '/trade',
+        'root_path': '',
+        'query_string': b'n=20&symbol=AAPL',
+        'headers': [
+            (b'host', b'example.com'),
+            (b'content-type', b'application/json'),
+            (b'content-length', b'2'),
+            (b'x-profile-token', b'abc'),
+            (b'accept', b'text/html'),
+            (b'accept', b'application/json')
+        ],
+        'client': ('10.0.0.1', 51234),
+        'server': ('example.com', 443)
+    }
+    base.update(overrides)
+    return base
+
+def test_request_line_and_addresses():
+    environ = build_environ(scope(), b'{}')
+    assert environ['REQUEST_METHOD'] == 'POST'
+    assert environ['PATH_INFO'] == '/trade'
+    assert environ['QUERY_STRING'] == 'n=20&symbol=AAPL'
+    assert environ['SERVER_PROTOCOL'] == 'HTTP/1.1'
+    assert environ['wsgi.url_scheme'] == 'https'
+    assert (environ['SERVER_NAME'], environ['SERVER_PORT']) == ('example.com', '443')
+    assert (environ['REMOTE_ADDR'], environ['REMOTE_PORT']) == ('10.0.0.1', '51234')
+    assert environ['wsgi.input'].read() == b'{}'
+
+def test_headers():
+    environ = build_environ(scope(), b'{}')
+    # Content headers have no HTTP_ prefix
+    assert environ['CONTENT_TYPE'] == 'application/json'
+    assert environ['CONTENT_LENGTH'] == '2'
+    assert 'HTTP_CONTENT_TYPE' not in environ
+    assert environ['HTTP_X_PROFILE_TOKEN'] == 'abc'
+    # Repeated headers are joined in order
+    assert environ['HTTP_ACCEPT'] == 'text/html,application/json'
+
+def test_threaded_worker_flags():
+    environ = build_environ(scope(), b'')
+    # The price feed streams only where a request doesn't pin the worker
+    assert environ['wsgi.multithread'] is True
+    assert environ['wsgi.run_once'] is False
+
+def test_defaults_for_a_minimal_scope():
+    environ = build_environ({'type': 'http', 'method': 'GET', 'path': '/'}, b'')
+    assert environ['QUERY_STRING'] == ''
+    assert environ['SCRIPT_NAME'] == ''
+    assert environ['wsgi.url_scheme'] == 'http'
+    assert (environ['SERVER_NAME'], environ['SERVER_PORT']) == ('localhost', '80')
+
+def test_werkzeug_reads_the_environ():
+    req = Request(build_environ(scope(), b'{}'))
+    assert req.host == 'example.com'
+    assert req.args['symbol'] == 'AAPL'
+    assert req.url.startswith('https://example.com/trade')
+
+def test_encode_headers():
+    assert encode_headers([('Content-Type', 'text/plain')]) == [(b'content-type', b'text/plain')]
+
+def call(asgi_app, request_scope, body=b''):
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi_app(request_scope, receive, send))
+    return sent[0]['status'], b''.join(message.get('body', b'') for message in sent[1:])
+
+def make_app():
+    app = Flask(__name__)
+
+    @app.route('/sync', methods=['POST'])
+    def sync_view():
+        return jsonify({'view': 'sync', 'body': request.get_json()})
+
+    @app.route('/items/<int:item_id>')
+    def item(item_id):
+        return jsonify({'view': 'sync', 'item': item_id})
+
+    asgi_app = AsgiApp(app, sync_threads=1)
+
+    @asgi_app.view('item')
+    async def item_async(item_id):
+        return jsonify({'view': 'async', 'item': item_id, 'n': request.args.get('n')})
+
+    return asgi_app
+
+def test_sync_views_run_on_the_thread_pool():
+    headers = [(b'content-type', b'application/json'), (b'content-length', b'8')]
+    status, body = call(make_app(), scope(path='/sync', query_string=b'', headers=headers), b'{"a": 1}')
+    assert status == 200
+    assert body == b'{"body":{"a":1},"view":"sync"}\n'
+
+def test_async_views_replace_their_endpoint():
+    status, body = call(make_app(), scope(method='GET', path='/items/7', query_string=b'n=3'))
+    assert status == 200
+    assert body == b'{"item":7,"n":"3","view":"async"}\n'
+
+def test_unknown_paths_are_flasks_404():
+    status, _ = call(make_app(), scope(method='GET', path='/missing'))
+    assert status == 404
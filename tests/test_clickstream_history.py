@@ -0,0 +1,80 @@
+from datetime import date, datetime
+from trading_core import clickstream_history
+from trading_core.clickstream_history import create_partitions, drop_expired, pending_days
+
+NOW = datetime(2024, 3, 10, 12, 0)
+
+# Fake cursor: answers the catalog and rollup lookups from memory and records
+# every statement
+class FakeCursor:
+    def __init__(self, partitions=(), last_final=None, first_event=None):
+        # (name, start, end) for each partition
+        self.partitions = list(partitions)
+        self.last_final = last_final
+        self.first_event = first_event
+        self.statements = []
+        self.result = None
+        # Nothing to move out of the default partition
+        self.rowcount = 0
+
+    def execute(self, sql, params=None):
+        self.statements.append(sql)
+        if 'FROM pg_inherits' in sql:
+            self.result = [{'relname': name, 'bound': f"FOR VALUES FROM ('{start}') TO ('{end}')"}
+                           for name, start, end in self.partitions]
+        elif 'FROM clickstream_rollups' in sql:
+            self.result = {'day': self.last_final}
+        elif 'MIN(timestamp)' in sql:
+            self.result = {'day': self.first_event}
+
+    def fetchone(self):
+        return self.result
+
+    def fetchall(self):
+        return self.result
+
+def partition(day):
+    return (clickstream_history.partition_name(day), f"{day} 00:00:00",
+            f"{date.fromordinal(day.toordinal() + 1)} 00:00:00")
+
+def test_pending_days_start_after_the_last_final_day():
+    cur = FakeCursor(last_final=date(2024, 3, 7))
+    assert pending_days(cur, NOW) == [date(2024, 3, 8), date(2024, 3, 9), date(2024, 3, 10)]
+
+def test_pending_days_on_the_first_run_start_at_the_oldest_event():
+    cur = FakeCursor(first_event=date(2024, 3, 9))
+    assert pending_days(cur, NOW) == [date(2024, 3, 9), date(2024, 3, 10)]
+    # No events at all: just today
+    assert pending_days(FakeCursor(), NOW) == [date(2024, 3, 10)]
+
+def test_pending_days_once_today_is_final():
+    assert pending_days(FakeCursor(last_final=date(2024, 3, 10)), NOW) == []
+
+def test_drop_expired_keeps_partitions_inside_retention(monkeypatch):
+    monkeypatch.setattr(clickstream_history, 'RETENTION_DAYS', 3)
+    days = [date(2024, 3, day) for day in (5, 6, 7, 8)]
+    cur = FakeCursor(partitions=[partition(day) for day in days], last_final=date(2024, 3, 9))
+    # The cutoff is midnight on the 7th, so only partitions ending by then go
+    assert drop_expired(cur, NOW) == ['clickstream_p20240305', 'clickstream_p20240306']
+    assert 'DROP TABLE IF EXISTS clickstream_p20240306' in cur.statements
+
+def test_drop_expired_keeps_days_not_yet_rolled_up(monkeypatch):
+    monkeypatch.setattr(clickstream_history, 'RETENTION_DAYS', 3)
+    days = [date(2024, 3, day) for day in (4, 5, 6)]
+    cur = FakeCursor(partitions=[partition(day) for day in days], last_final=date(2024, 3, 4))
+    assert drop_expired(cur, NOW) == ['clickstream_p20240304']
+    # Nothing final yet: nothing is dropped
+    assert drop_expired(FakeCursor(partitions=[partition(days[0])]), NOW) == []
+
+def test_create_partitions_locks_the_default_before_moving_rows():
+    cur = FakeCursor(partitions=[partition(date(2024, 3, 10))])
+    create_partitions(cur, NOW)
+    lock = cur.statements.index('LOCK TABLE clickstream_default IN SHARE ROW EXCLUSIVE MODE')
+    moves = [i for i, sql in enumerate(cur.statements) if 'DELETE FROM clickstream_default' in sql]
+    assert len(moves) == 2 and lock < moves[0]
+    assert any('clickstream_p20240312' in sql and 'ATTACH PARTITION' in sql for sql in cur.statements)
+
+def test_create_partitions_takes_no_lock_when_up_to_date():
+    cur = FakeCursor(partitions=[partition(date(2024, 3, 12))])
+    assert create_partitions(cur, NOW) == 0
+    assert not any(sql.startswith('LOCK') for sql in cur.statements)
@@ -0,0 +1,185 @@
+import random
+from datetime import timedelta
+import pytest
+from trading_core import achievements, leaderboard, market_cache
+from trading_core.leaderboard import Leaderboard, RankedSkipList, TraderState
+
+def check(skiplist, reference):
+    assert len(skiplist) == len(reference)
+    assert skiplist.head(len(reference) + 1) == reference
+    for position, key in enumerate(reference, start=1):
+        assert skiplist.rank(key) == position
+
+def test_empty():
+    skiplist = RankedSkipList()
+    assert len(skiplist) == 0
+    assert skiplist.head(10) == []
+    assert skiplist.rank((0.0, 1)) is None
+    assert not skiplist.remove((0.0, 1))
+
+def test_ranks_match_a_sorted_list_under_random_updates():
+    rng = random.Random(1)
+    random.seed(1)
+    skiplist = RankedSkipList()
+    reference = []
+    # Leaderboard keys: (negated return, user_id)
+    for _ in range(3000):
+        if reference and rng.random() < 0.4:
+            key = rng.choice(reference)
+            assert skiplist.remove(key)
+            reference.remove(key)
+        else:
+            key = (-round(rng.uniform(-50, 50), 1), rng.randrange(100000))
+            if key in reference:
+                continue
+            skiplist.insert(key)
+            reference.append(key)
+            reference.sort()
+    check(skiplist, reference)
+
+def test_moving_a_key_is_remove_then_insert():
+    skiplist = RankedSkipList()
+    for user_id in range(1, 6):
+        skiplist.insert((-float(user_id), user_id))
+    assert skiplist.rank((-1.0, 1)) == 5
+    skiplist.remove((-1.0, 1))
+    skiplist.insert((-10.0, 1))
+    check(skiplist, [(-10.0, 1), (-5.0, 5), (-4.0, 4), (-3.0, 3), (-2.0, 2)])
+
+def test_absent_keys_have_no_rank_and_are_not_removed():
+    skiplist = RankedSkipList()
+    skiplist.insert((-1.0, 1))
+    skiplist.insert((-3.0, 3))
+    assert skiplist.rank((-2.0, 2)) is None
+    assert not skiplist.remove((-2.0, 2))
+    check(skiplist, [(-3.0, 3), (-1.0, 1)])
+
+def test_head_stops_at_n():
+    skiplist = RankedSkipList()
+    for user_id in range(20):
+        skiplist.insert((0.0, user_id))
+    assert skiplist.head(3) == [(0.0, 0), (0.0, 1), (0.0, 2)]
+
+class Snapshot:
+    def __init__(self, version, prices):
+        self.version = version
+        self.quotes = [{'symbol': symbol, 'price': price} for symbol, price in prices.items()]
+
+def trader_row(user_id, shares, platform_type='gamified', **stats):
+    row = {
+        'user_id': user_id,
+        'platform_type': platform_type,
+        'initial_cash': 1000,
+        'current_cash': 0,
+        'symbols': ['AAPL'],
+        'shares': [shares],
+        'trade_count': 1,
+        'streak_days': 0,
+        'unlocked': 0,
+        'week_start': None,
+        'week_start_value': None
+    }
+    row.update(stats)
+    return row
+
+def trader(user_id, shares, platform_type='gamified', **stats):
+    return TraderState(trader_row(user_id, shares, platform_type, **stats))
+
+# Records what the board queues, and that it never queues under the lock
+class Writer:
+    def __init__(self, board):
+        self.board = board
+        self.weeks = []
+        self.unlocks = []
+
+    def pending(self, user_id):
+        assert not self.board._lock.locked()
+        return set()
+
+    def set_week(self, user_id, start, value):
+        assert not self.board._lock.locked()
+        self.weeks.append((user_id, start, value))
+
+    def unlock(self, user_id, names):
+        assert not self.board._lock.locked()
+        self.unlocks.append((user_id, names))
+
+@pytest.fixture
+def board(monkeypatch):
+    board = Leaderboard()
+    board._prices = {'AAPL': 100.0}
+    board._version = 1
+    writer = Writer(board)
+    monkeypatch.setattr(achievements, 'get_writer', lambda: writer)
+    return board
+
+def test_tick_rolls_the_week_over_and_queues_unlocks_after_the_lock(board, monkeypatch):
+    current_week = achievements.week_start()
+    board._put(trader(1, 20, week_start=current_week - timedelta(days=7), week_start_value=1500))
+    board._put(trader(2, 5, platform_type='traditional'))
+    monkeypatch.setattr(market_cache.cache, 'get_snapshot', lambda conn: Snapshot(2, {'AAPL': 110.0}))
+
+    board.tick(None)
+    first = board._traders[1]
+    assert (first.week_start, first.week_start_value) == (current_week, 2200.0)
+    assert first.unlocked & achievements.BITS['Green Week']
+    writer = achievements.get_writer()
+    assert writer.weeks == [(1, current_week, 2200.0)]
+    assert writer.unlocks == [(1, ['Green Week', 'Top 100'])]
+    # Traditional traders are ranked but never checked
+    assert board._traders[2].week_start is None
+
+    # The same week again queues nothing new
+    monkeypatch.setattr(market_cache.cache, 'get_snapshot', lambda conn: Snapshot(3, {'AAPL': 111.0}))
+    board.tick(None)
+    assert len(writer.weeks) == 1
+    assert len(writer.unlocks) == 1
+
+def test_rank_of_an_unloaded_user_asks_the_board_thread(board, monkeypatch):
+    monkeypatch.setattr(leaderboard, 'get_pool', lambda: pytest.fail('rank_of must not query'))
+    board._put(trader(1, 20))
+    assert board.rank_of(1) == (1, 1, 0)
+    # Before the first load, that load will pick the user up
+    assert board.rank_of(2) == (None, 1, 0)
+    assert board._pending_users == set()
+    board.loaded = True
+    assert board.rank_of(2) == (None, 1, 0)
+    assert board._pending_users == {2}
+    assert board._wake.is_set()
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        assert sql is leaderboard.LOAD_TRADERS_SQL
+        self.conn.loads.append(params)
+
+    def fetchall(self):
+        return [row for row in self.conn.rows if row['user_id'] > self.conn.loads[-1]['after']]
+
+    def close(self):
+        pass
+
+class FakeConn:
+    def __init__(self, rows):
+        self.rows = rows
+        self.loads = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+def test_load_new_adds_only_users_the_board_lacks(board, monkeypatch):
+    monkeypatch.setattr(leaderboard, 'USER_ID_LOOKBACK', 2)
+    for user_id in (1, 2, 3, 4):
+        board._put(trader(user_id, 10))
+    conn = FakeConn([trader_row(3, 99), trader_row(4, 99), trader_row(5, 30), trader_row(7, 0)])
+    board.load_new(conn)
+    # Only from just before the newest user already loaded
+    assert conn.loads == [{'user_ids': None, 'after': 2}]
+    assert sorted(board._traders) == [1, 2, 3, 4, 5, 7]
+    # Known users stay as their notifications left them
+    assert board._traders[3].shares == {'AAPL': 10}
+    assert board.rank_of(5)[0] == 1
+    board.load_new(conn)
+    assert conn.loads[-1]['after'] == 5
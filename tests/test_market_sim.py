@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from trading_core import market_sim
+from trading_core.market_sim import MarketSimulator, MODELS
+
+STOCKS = [
+    {'symbol': 'AAA', 'base_price': 100.0, 'current_price': 100.0, 'volatility': 'high'},
+    {'symbol': 'BBB', 'base_price': 50.0, 'current_price': 55.0, 'volatility': 'medium'},
+    {'symbol': 'CCC', 'base_price': 10.0, 'current_price': None, 'volatility': 'low'},
+    {'symbol': 'DDD', 'base_price': 20.0, 'current_price': 20.0, 'volatility': 'unknown'}
+]
+
+def run(model, seed, ticks=50):
+    simulator = MarketSimulator(model=model, seed=seed)
+    simulator.load(STOCKS)
+    return np.array([simulator.step() for _ in range(ticks)])
+
+def test_unknown_model_is_rejected():
+    with pytest.raises(ValueError):
+        MarketSimulator(model='nope')
+
+def test_load_uses_current_price_or_base_price():
+    simulator = MarketSimulator(model='ou', seed=1)
+    simulator.load(STOCKS)
+    assert simulator.symbols == ['AAA', 'BBB', 'CCC', 'DDD']
+    assert np.allclose(np.exp(simulator.log_prices), [100.0, 55.0, 10.0, 20.0])
+    # Unknown volatility buckets fall back to low
+    assert list(simulator.sigma) == [0.0125, 0.005, 0.0025, 0.0025]
+
+@pytest.mark.parametrize('model', sorted(MODELS))
+def test_same_seed_replays_the_same_market(model):
+    assert np.array_equal(run(model, 42), run(model, 42))
+    assert not np.array_equal(run(model, 42), run(model, 43))
+
+@pytest.mark.parametrize('model', sorted(MODELS))
+def test_prices_are_dollars_rounded_to_the_cent_and_never_below_min(model):
+    prices = run(model, 7, ticks=200)
+    assert prices.shape == (200, len(STOCKS))
+    assert (prices >= market_sim.MIN_PRICE).all()
+    assert np.allclose(prices, np.round(prices, 2))
+
+def test_step_continues_from_the_published_price():
+    simulator = MarketSimulator(model='gbm', seed=3)
+    simulator.load(STOCKS)
+    prices = simulator.step()
+    assert np.allclose(np.exp(simulator.log_prices), prices)
+
+def test_ou_reverts_towards_base_price():
+    simulator = MarketSimulator(model='ou', seed=5)
+    simulator.load([{'symbol': 'AAA', 'base_price': 100.0, 'current_price': 200.0, 'volatility': 'low'}])
+    for _ in range(200):
+        price = simulator.step()[0]
+    assert abs(price - 100.0) < 10.0
+
+def test_one_step_advances_every_symbol():
+    stocks = [{'symbol': f"S{i}", 'base_price': 10.0, 'current_price': 10.0, 'volatility': 'high'}
+              for i in range(1000)]
+    simulator = MarketSimulator(model='gbm', seed=9)
+    simulator.load(stocks)
+    prices = simulator.step()
+    assert prices.shape == (1000,)
+    assert (prices != 10.0).any()
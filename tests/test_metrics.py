@@ -0,0 +1,97 @@
+import json
+import re
+import pytest
+from flask import Flask
+from trading_core import db, metrics
+from trading_core.metrics import BUCKETS, Registry, render_metrics
+
+# A fresh registry, with every output on whatever the environment says
+@pytest.fixture
+def registry(monkeypatch):
+    for flag in ('SERVER_TIMING', 'REQUEST_LOG', 'METRICS_ENABLED'):
+        monkeypatch.setattr(metrics, flag, True)
+    monkeypatch.setattr(metrics, 'REQUEST_LOG_MIN_MS', 0.0)
+    registry = Registry()
+    monkeypatch.setattr(metrics, 'registry', registry)
+    monkeypatch.setattr(metrics, 'collect_gauges', lambda: {'db_pool_size': 4})
+    return registry
+
+def test_renders_prometheus_text_format(registry):
+    labels = (('app', 'test'), ('endpoint', 'index'))
+    registry.inc('http_requests_total', labels + (('method', 'GET'), ('status', 200)))
+    registry.inc('http_requests_total', labels + (('method', 'GET'), ('status', 200)), 2)
+    registry.observe('http_request_duration_seconds', labels, 0.003)
+    registry.observe('http_request_duration_seconds', labels, 20.0)
+    text = render_metrics()
+    lines = text.splitlines()
+
+    assert text.endswith('\n')
+    assert '# HELP http_requests_total Requests served, by endpoint, method and status' in lines
+    assert '# TYPE http_requests_total counter' in lines
+    assert '# TYPE http_request_duration_seconds histogram' in lines
+    assert 'db_pool_size 4' in lines
+    assert 'http_requests_total{app="test",endpoint="index",method="GET",status="200"} 3' in lines
+
+    # Buckets are cumulative; the 20s request only counts in +Inf
+    buckets = [line for line in lines if line.startswith('http_request_duration_seconds_bucket')]
+    assert len(buckets) == len(BUCKETS) + 1
+    assert buckets[0] == 'http_request_duration_seconds_bucket{app="test",endpoint="index",le="0.001"} 0'
+    assert buckets[2] == 'http_request_duration_seconds_bucket{app="test",endpoint="index",le="0.005"} 1'
+    assert buckets[-2].endswith('le="10.0"} 1')
+    assert buckets[-1] == 'http_request_duration_seconds_bucket{app="test",endpoint="index",le="+Inf"} 2'
+    assert 'http_request_duration_seconds_count{app="test",endpoint="index"} 2' in lines
+    assert 'http_request_duration_seconds_sum{app="test",endpoint="index"} 20.003' in lines
+
+    # Every sample line is `name{labels} value`
+    sample = re.compile(r'^[a-z_]+(\{[^}]*\})? \S+$')
+    assert all(line.startswith('# ') or sample.match(line) for line in lines)
+
+def test_label_values_are_escaped():
+    assert metrics.format_labels((('path', 'a"b\\c\nd'),)) == '{path="a\\"b\\\\c\\nd"}'
+    assert metrics.format_labels(()) == ''
+
+def make_app():
+    app = Flask('metrics_test')
+    metrics.init_app(app)
+
+    @app.route('/page')
+    def page():
+        with metrics.phase('render'):
+            db.query_stats().queries += 2
+        return 'ok'
+
+    return app
+
+def test_response_carries_server_timing(registry, monkeypatch):
+    monkeypatch.setattr(metrics, 'REQUEST_LOG', False)
+    response = make_app().test_client().get('/page')
+    assert re.fullmatch(r'render;dur=\d+\.\d{2}, '
+                        r'db;dur=\d+\.\d{2};desc="2 queries, 0 connections", '
+                        r'total;dur=\d+\.\d{2}', response.headers['Server-Timing'])
+
+    counters, histograms = registry.samples()
+    labels = (('app', 'metrics_test'), ('endpoint', 'page'))
+    assert counters[('http_requests_total', labels + (('method', 'GET'), ('status', 200)))] == 1
+    assert counters[('db_queries_total', labels)] == 2
+    assert ('request_phase_duration_seconds', labels + (('phase', 'render'),)) in histograms
+
+def test_logs_one_json_line_per_request(registry, capsys):
+    client = make_app().test_client()
+    client.get('/page?x=1')
+    line = capsys.readouterr().out.strip()
+    entry = json.loads(line)
+    assert len(line.splitlines()) == 1
+    assert {key: entry[key] for key in ('app', 'method', 'path', 'endpoint', 'status', 'user_id', 'db_queries')} == {
+        'app': 'metrics_test', 'method': 'GET', 'path': '/page', 'endpoint': 'page', 'status': 200,
+        'user_id': None, 'db_queries': 2
+    }
+    assert set(entry['phases_ms']) == {'render'}
+    assert entry['duration_ms'] >= entry['phases_ms']['render']
+
+def test_metrics_scrapes_are_neither_counted_nor_logged(registry, capsys):
+    client = make_app().test_client()
+    response = client.get('/metrics')
+    assert response.mimetype == 'text/plain'
+    assert '# TYPE http_requests_total counter' in response.get_data(as_text=True)
+    assert registry.samples() == ({}, {})
+    assert capsys.readouterr().out == ''
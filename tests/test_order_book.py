@@ -0,0 +1,187 @@
+from contextlib import contextmanager
+import pytest
+from trading_core import order_book
+from trading_core.order_book import (MAX_PRICE, OrderBook, OrderMatcher, RestingOrder, SymbolBook,
+                                     parse_resting_order, parse_size)
+from trading_core.orders import OrderRejected
+
+QUOTES = {'AAPL': {'symbol': 'AAPL', 'price': 150.0}}
+
+def order(order_id, side, order_type, price, symbol='AAPL', platform_type='traditional', user_id=1):
+    return RestingOrder({
+        'order_id': order_id,
+        'user_id': user_id,
+        'symbol': symbol,
+        'side': side,
+        'order_type': order_type,
+        'shares': 1,
+        'trigger_price': price,
+        'platform_type': platform_type
+    })
+
+def book_of(*orders):
+    book = SymbolBook()
+    for resting in orders:
+        book.add(resting)
+    return book
+
+def test_buy_limit_triggers_at_or_below_its_limit():
+    book = book_of(order(1, 'buy', 'limit', 100.0))
+    assert book.trigger(100.01) == []
+    assert book.trigger(100.0) == [1]
+    assert len(book) == 0
+
+def test_sell_limit_triggers_at_or_above_its_limit():
+    book = book_of(order(1, 'sell', 'limit', 100.0))
+    assert book.trigger(99.99) == []
+    assert book.trigger(100.0) == [1]
+
+def test_buy_stop_triggers_at_or_above_its_stop():
+    book = book_of(order(1, 'buy', 'stop', 100.0))
+    assert book.trigger(99.99) == []
+    assert book.trigger(101.0) == [1]
+
+def test_sell_stop_triggers_at_or_below_its_stop():
+    book = book_of(order(1, 'sell', 'stop', 100.0))
+    assert book.trigger(100.01) == []
+    assert book.trigger(95.0) == [1]
+
+def test_trigger_pops_only_the_orders_the_price_crosses():
+    book = book_of(order(1, 'buy', 'limit', 90.0), order(2, 'buy', 'limit', 100.0),
+                   order(3, 'sell', 'limit', 110.0), order(4, 'sell', 'limit', 120.0),
+                   order(5, 'buy', 'stop', 115.0), order(6, 'sell', 'stop', 95.0))
+    assert sorted(book.trigger(112.0)) == [3]
+    assert sorted(book.trigger(94.0)) == [2, 6]
+    assert sorted(book.trigger(130.0)) == [4, 5]
+    assert len(book) == 1
+
+def test_match_returns_triggered_orders_oldest_first():
+    book = OrderBook()
+    for resting in (order(3, 'buy', 'limit', 100.0), order(1, 'buy', 'limit', 99.0),
+                    order(2, 'sell', 'stop', 105.0, symbol='MSFT'), order(4, 'buy', 'limit', 50.0)):
+        book.add(resting)
+    triggered = book.match({'AAPL': 98.0, 'MSFT': 104.0})
+    assert [resting.order_id for resting in triggered] == [1, 2, 3]
+    assert len(book) == 1
+    assert book.last_order_id == 4
+
+def test_adding_an_order_twice_keeps_one():
+    book = OrderBook()
+    book.add(order(1, 'buy', 'limit', 100.0))
+    book.add(order(1, 'buy', 'limit', 100.0))
+    assert len(book) == 1
+    assert len(book.match({'AAPL': 90.0})) == 1
+
+def test_resting_order_knows_its_owners_platform():
+    assert order(1, 'buy', 'limit', 100.0, platform_type='gamified').gamified
+    assert not order(1, 'buy', 'limit', 100.0).gamified
+
+def test_parse_resting_order():
+    assert parse_resting_order('aapl', 'buy', 'limit', '10', '149.999', QUOTES) == ('AAPL', 'buy', 'limit', 10, 150.0)
+
+@pytest.mark.parametrize('symbol, side, order_type', [
+    ('MSFT', 'buy', 'limit'),
+    (None, 'buy', 'limit'),
+    ('AAPL', 'hold', 'limit'),
+    ('AAPL', 'buy', 'market')
+])
+def test_parse_resting_order_rejects_bad_fields(symbol, side, order_type):
+    with pytest.raises(OrderRejected):
+        parse_resting_order(symbol, side, order_type, 1, 100.0, QUOTES)
+
+@pytest.mark.parametrize('shares, price', [
+    (0, 100.0),
+    (-1, 100.0),
+    ('ten', 100.0),
+    (None, 100.0),
+    (1, None),
+    (1, 'abc'),
+    (1, 0),
+    (1, -5.0),
+    (1, 'nan'),
+    (1, float('nan')),
+    (1, 'inf'),
+    (1, float('-inf')),
+    (1, MAX_PRICE + 1),
+    (1, 10 ** 400)
+])
+def test_parse_size_rejects_bad_sizes_and_prices(shares, price):
+    with pytest.raises(OrderRejected):
+        parse_size(shares, price)
+
+def test_parse_size_accepts_the_largest_price():
+    assert parse_size(1, MAX_PRICE) == (1, MAX_PRICE)
+
+# Fake pooled connection for OrderMatcher: the book loads nothing new, every
+# claim succeeds, and released orders are the ones still 'triggered'
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+
+    def execute(self, sql, params=None):
+        self.conn.statements.append(sql)
+        if "SET status = 'triggered'" in sql:
+            self.rows = [{'order_id': order_id} for order_id in params[0]]
+        elif "SET status = 'open'" in sql:
+            self.conn.released.extend(params[0])
+            self.rows = [{'order_id': order_id} for order_id in params[0]]
+        else:
+            self.rows = []
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+class FakeConn:
+    def __init__(self):
+        self.statements = []
+        self.released = []
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self.rollbacks += 1
+
+class FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    @contextmanager
+    def connection(self):
+        yield self.conn
+
+def test_a_failed_fill_releases_its_orders_and_the_rest_still_fill(monkeypatch):
+    conn = FakeConn()
+    filled = []
+
+    def execute_batch(conn, user_id, raw_orders, quotes, award_achievements, before_commit):
+        if user_id == 1:
+            raise RuntimeError('deadlock detected')
+        filled.append(user_id)
+        return [{'success': True, 'price': 90.0}], {'filled': 1, 'rejected': 0}
+
+    monkeypatch.setattr(order_book, 'get_pool', lambda: FakePool(conn))
+    monkeypatch.setattr(order_book, 'execute_batch', execute_batch)
+    matcher = OrderMatcher()
+    # Loaded recently, so the sync only looks for new orders
+    matcher._loaded_at = order_book.time.monotonic()
+    for resting in (order(1, 'buy', 'limit', 100.0), order(2, 'buy', 'limit', 95.0, user_id=2),
+                    order(3, 'sell', 'limit', 200.0, user_id=1)):
+        matcher.book.add(resting)
+
+    assert matcher.run(['AAPL'], [90.0]) == 2
+    assert filled == [2]
+    assert matcher.filled == 1
+    assert conn.rollbacks == 1
+    assert conn.released == [1]
+    # Order 1 rests again and triggers on the next matching tick
+    assert sorted(matcher.book.orders) == [1, 3]
+    assert [resting.order_id for resting in matcher.book.match({'AAPL': 99.0})] == [1]
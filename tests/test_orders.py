@@ -0,0 +1,228 @@
+import pytest
+from trading_core import orders
+from trading_core.orders import OrderRejected, execute_batch, execute_order, parse_order
+
+# Fake connection: serves the account and position locks from memory and
+# records every statement, so the checks and the in-memory batch math run
+# without a database
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = None
+
+    def execute(self, sql, params=None):
+        self.conn.statements.append((sql, params))
+        if 'FROM users' in sql and 'FOR UPDATE' in sql:
+            self.result = {'user_id': params[0], 'current_cash': self.conn.cash}
+        elif 'FROM portfolio' in sql and 'FOR UPDATE' in sql:
+            self.result = [{'symbol': symbol, 'shares': shares, 'avg_price': avg_price}
+                           for symbol, (shares, avg_price) in sorted(self.conn.positions.items())
+                           if symbol in params[1]]
+        elif sql is orders.SELL_SQL:
+            # No position matched
+            self.result = None
+        elif sql is orders.BATCH_SQL:
+            self.result = {'trades': len(params['trade_symbols']), 'trade_count': None}
+
+    def fetchone(self):
+        return self.result
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+class FakeConn:
+    def __init__(self, cash, positions=None):
+        self.cash = cash
+        # symbol -> (shares, avg_price)
+        self.positions = positions or {}
+        self.statements = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+def test_invalid_action_is_rejected_before_any_query():
+    conn = FakeConn(1000.0)
+    with pytest.raises(OrderRejected, match='Invalid action'):
+        execute_order(conn, 1, 'AAPL', 'short', 1, 10.0)
+    assert conn.statements == []
+
+def test_buy_beyond_cash_is_rejected_after_the_lock():
+    conn = FakeConn(1000.0)
+    with pytest.raises(OrderRejected, match='Insufficient funds'):
+        execute_order(conn, 1, 'AAPL', 'buy', 11, 100.0)
+    # Only the account lock ran, and it was released
+    assert len(conn.statements) == 1
+    assert (conn.commits, conn.rollbacks) == (0, 1)
+
+def test_sell_matching_no_position_is_rejected():
+    conn = FakeConn(1000.0)
+    with pytest.raises(OrderRejected, match='Insufficient shares'):
+        execute_order(conn, 1, 'AAPL', 'sell', 1, 100.0)
+    assert (conn.commits, conn.rollbacks) == (0, 1)
+
+QUOTES = {
+    'AAPL': {'symbol': 'AAPL', 'price': 100.0},
+    'MSFT': {'symbol': 'MSFT', 'price': 50.0}
+}
+
+def test_parse_order():
+    assert parse_order({'symbol': 'aapl', 'action': 'buy', 'shares': '3'}, QUOTES) == ('AAPL', 'buy', 3)
+
+@pytest.mark.parametrize('raw, message', [
+    ('AAPL', 'Invalid order parameters'),
+    (None, 'Invalid order parameters'),
+    ({'symbol': 'AAPL', 'action': 'buy'}, 'Invalid number of shares'),
+    ({'symbol': 'AAPL', 'action': 'buy', 'shares': 0}, 'Invalid number of shares'),
+    ({'symbol': 'AAPL', 'action': 'buy', 'shares': -2}, 'Invalid number of shares'),
+    ({'symbol': 'AAPL', 'action': 'buy', 'shares': 'two'}, 'Invalid number of shares'),
+    ({'symbol': 'AAPL', 'action': 'buy', 'shares': [1]}, 'Invalid number of shares'),
+    ({'symbol': 'TSLA', 'action': 'buy', 'shares': 1}, 'Market Data list'),
+    ({'action': 'buy', 'shares': 1}, 'Market Data list'),
+    ({'symbol': 'AAPL', 'action': 'hold', 'shares': 1}, 'Invalid action')
+])
+def test_parse_order_rejections(raw, message):
+    with pytest.raises(OrderRejected, match=message):
+        parse_order(raw, QUOTES)
+
+def batch_params(conn):
+    return next(params for sql, params in conn.statements if sql is orders.BATCH_SQL)
+
+def test_batch_fills_in_sequence_and_skips_rejections():
+    conn = FakeConn(1000.0, {'MSFT': (4, 40.0)})
+    results, summary = execute_batch(conn, 1, [
+        {'symbol': 'AAPL', 'action': 'buy', 'shares': 5},
+        # Only 500 left
+        {'symbol': 'AAPL', 'action': 'buy', 'shares': 6},
+        # Uses the shares bought earlier in the batch
+        {'symbol': 'AAPL', 'action': 'sell', 'shares': 2},
+        {'symbol': 'MSFT', 'action': 'sell', 'shares': 5},
+        {'symbol': 'MSFT', 'action': 'sell', 'shares': 4},
+        {'symbol': 'TSLA', 'action': 'buy', 'shares': 1}
+    ], QUOTES)
+
+    assert [result['success'] for result in results] == [True, False, True, False, True, False]
+    assert [result['index'] for result in results] == [0, 1, 2, 3, 4, 5]
+    assert results[0] == {'index': 0, 'success': True, 'symbol': 'AAPL', 'action': 'buy',
+                          'shares': 5, 'price': 100.0, 'total': 500.0}
+    assert results[1]['message'] == 'Insufficient funds'
+    assert results[3]['message'] == 'Insufficient shares'
+    assert 'Market Data list' in results[5]['message']
+    assert summary == {'filled': 3, 'rejected': 3, 'cash': 900.0, 'achievements': []}
+    assert conn.commits == 1
+
+    params = batch_params(conn)
+    assert params['cash'] == 900.0
+    # AAPL stays open at its cost; MSFT was sold out
+    assert (params['open_symbols'], params['open_shares'], params['open_avg']) == (['AAPL'], [3], [100.0])
+    assert params['closed_symbols'] == ['MSFT']
+    assert params['trade_actions'] == ['BUY', 'SELL', 'SELL']
+    assert params['trade_totals'] == [500.0, 200.0, 200.0]
+    assert params['trade_count'] == 3
+
+def test_batch_buys_average_into_existing_positions():
+    conn = FakeConn(10000.0, {'AAPL': (10, 80.0)})
+    execute_batch(conn, 1, [{'symbol': 'AAPL', 'action': 'buy', 'shares': 30}], QUOTES)
+    params = batch_params(conn)
+    assert (params['open_shares'], params['open_avg']) == ([40], [95.0])
+
+def test_atomic_batch_rolls_back_on_the_first_rejection():
+    conn = FakeConn(1000.0)
+    with pytest.raises(OrderRejected, match='Order 2: Insufficient funds'):
+        execute_batch(conn, 1, [
+            {'symbol': 'AAPL', 'action': 'buy', 'shares': 5},
+            {'symbol': 'AAPL', 'action': 'buy', 'shares': 6}
+        ], QUOTES, atomic=True)
+    assert (conn.commits, conn.rollbacks) == (0, 1)
+    assert not any(sql is orders.BATCH_SQL for sql, _ in conn.statements)
+
+def test_batch_without_fills_writes_nothing():
+    conn = FakeConn(1000.0)
+    recorded = []
+    results, summary = execute_batch(conn, 1, [{'symbol': 'AAPL', 'action': 'sell', 'shares': 1}], QUOTES,
+                                     before_commit=lambda cur, results: recorded.append(results))
+    assert summary['filled'] == 0 and summary['rejected'] == 1
+    assert not any(sql is orders.BATCH_SQL for sql, _ in conn.statements)
+    # The outcome hook still runs in the transaction
+    assert recorded == [results]
+    assert conn.commits == 1
+
+# Against DATABASE_URL
+
+def account(conn, user_id, symbol='AAPL'):
+    cur = conn.cursor()
+    cur.execute('SELECT current_cash FROM users WHERE user_id = %s', (user_id,))
+    cash = float(cur.fetchone()['current_cash'])
+    cur.execute('SELECT shares, avg_price FROM portfolio WHERE user_id = %s AND symbol = %s', (user_id, symbol))
+    position = cur.fetchone()
+    cur.execute('SELECT action, shares, price, total_cost FROM trades WHERE user_id = %s ORDER BY trade_id',
+                (user_id,))
+    trades = [(t['action'], t['shares'], float(t['price']), float(t['total_cost'])) for t in cur.fetchall()]
+    conn.commit()
+    cur.close()
+    return cash, (position['shares'], float(position['avg_price'])) if position else None, trades
+
+def test_buys_average_the_position_price(db_conn, db_user):
+    first = execute_order(db_conn, db_user, 'AAPL', 'buy', 10, 100.0)
+    assert first['cash'] == 99000.0
+    second = execute_order(db_conn, db_user, 'AAPL', 'buy', 30, 200.0)
+    assert second['position_shares'] == 40
+    assert second['avg_price'] == 175.0
+    assert account(db_conn, db_user) == (93000.0, (40, 175.0), [('BUY', 10, 100.0, 1000.0),
+                                                                 ('BUY', 30, 200.0, 6000.0)])
+
+def test_buy_beyond_cash_changes_nothing(db_conn, db_user):
+    with pytest.raises(OrderRejected, match='Insufficient funds'):
+        execute_order(db_conn, db_user, 'AAPL', 'buy', 1001, 100.0)
+    assert account(db_conn, db_user) == (100000.0, None, [])
+
+def test_selling_more_than_held_changes_nothing(db_conn, db_user):
+    execute_order(db_conn, db_user, 'AAPL', 'buy', 5, 100.0)
+    with pytest.raises(OrderRejected, match='Insufficient shares'):
+        execute_order(db_conn, db_user, 'AAPL', 'sell', 6, 120.0)
+    with pytest.raises(OrderRejected, match='Insufficient shares'):
+        execute_order(db_conn, db_user, 'MSFT', 'sell', 1, 120.0)
+    assert account(db_conn, db_user) == (99500.0, (5, 100.0), [('BUY', 5, 100.0, 500.0)])
+
+def test_sells_reduce_then_close_the_position(db_conn, db_user):
+    execute_order(db_conn, db_user, 'AAPL', 'buy', 10, 100.0)
+    reduced = execute_order(db_conn, db_user, 'AAPL', 'sell', 4, 150.0)
+    assert (reduced['position_shares'], reduced['avg_price'], reduced['cash']) == (6, 100.0, 99600.0)
+    closed = execute_order(db_conn, db_user, 'AAPL', 'sell', 6, 50.0)
+    assert closed['position_shares'] == 0
+    cash, position, trades = account(db_conn, db_user)
+    assert (cash, position) == (99900.0, None)
+    assert [trade[0] for trade in trades] == ['BUY', 'SELL', 'SELL']
+
+def test_batch_statement_writes_the_final_state(db_conn, db_user):
+    execute_order(db_conn, db_user, 'MSFT', 'buy', 2, 50.0)
+    results, summary = execute_batch(db_conn, db_user, [
+        {'symbol': 'AAPL', 'action': 'buy', 'shares': 4},
+        {'symbol': 'AAPL', 'action': 'sell', 'shares': 1},
+        {'symbol': 'MSFT', 'action': 'sell', 'shares': 2},
+        {'symbol': 'MSFT', 'action': 'sell', 'shares': 1}
+    ], QUOTES)
+    assert (summary['filled'], summary['rejected']) == (3, 1)
+    cash, position, trades = account(db_conn, db_user)
+    assert cash == summary['cash'] == 100000.0 - 100.0 - 400.0 + 100.0 + 100.0
+    assert position == (3, 100.0)
+    assert account(db_conn, db_user, 'MSFT')[1] is None
+    assert [trade[:2] for trade in trades] == [('BUY', 2), ('BUY', 4), ('SELL', 1), ('SELL', 2)]
+
+def test_atomic_batch_writes_nothing_on_rejection(db_conn, db_user):
+    with pytest.raises(OrderRejected):
+        execute_batch(db_conn, db_user, [
+            {'symbol': 'AAPL', 'action': 'buy', 'shares': 1},
+            {'symbol': 'AAPL', 'action': 'sell', 'shares': 5}
+        ], QUOTES, atomic=True)
+    assert account(db_conn, db_user) == (100000.0, None, [])
@@ -0,0 +1,99 @@
+import cProfile
+import json
+import time
+from collections import Counter
+import pytest
+from flask import Flask
+from trading_core import profiling
+from trading_core.profiling import ProfileTotals, check_token, make_token
+
+SECRET = 'test-secret'
+
+def test_token_round_trip():
+    assert check_token(make_token(60, SECRET), SECRET)
+
+def test_expired_token_is_refused():
+    assert not check_token(make_token(-1, SECRET), SECRET)
+
+def test_tampered_token_is_refused():
+    expires, signature = make_token(60, SECRET).split('.')
+    # A later expiry with the old signature
+    assert not check_token(f"{int(expires) + 3600}.{signature}", SECRET)
+    flipped = '0' if signature[-1] != '0' else '1'
+    assert not check_token(f"{expires}.{signature[:-1]}{flipped}", SECRET)
+    assert not check_token(make_token(60, 'other-secret'), SECRET)
+
+@pytest.mark.parametrize('expires', ['soon', '-5', '1e99', ''])
+def test_non_digit_expiry_is_refused(expires):
+    # Correctly signed, so only the expiry check stands in the way
+    signature = profiling.hmac.new(SECRET.encode(), expires.encode(), profiling.hashlib.sha256).hexdigest()
+    assert not check_token(f"{expires}.{signature}", SECRET)
+
+@pytest.mark.parametrize('token', [None, '', 'no-dot'])
+def test_malformed_token_is_refused(token):
+    assert not check_token(token, SECRET)
+
+def test_nothing_passes_without_a_secret(monkeypatch):
+    monkeypatch.setattr(profiling, 'PROFILE_SECRET', '')
+    # Signed with the empty key
+    token = make_token(60, '')
+    assert token.split('.')[0].isdigit()
+    assert not check_token(token)
+    assert not check_token(token, '')
+
+def make_app():
+    app = Flask('profiling_test')
+    profiling.init_app(app)
+    return app
+
+def test_report_needs_a_valid_token_in_the_header(monkeypatch):
+    monkeypatch.setattr(profiling, 'PROFILE_SECRET', SECRET)
+    monkeypatch.setattr(profiling, 'totals', ProfileTotals())
+    client = make_app().test_client()
+    assert client.get('/admin/profile').status_code == 403
+    assert client.get('/admin/profile', headers={profiling.TOKEN_HEADER: make_token(-1)}).status_code == 403
+    # Never from the query string
+    assert client.get(f'/admin/profile?token={make_token(60)}').status_code == 403
+
+    response = client.get('/admin/profile?n=5', headers={profiling.TOKEN_HEADER: make_token(60)})
+    assert response.status_code == 200
+    assert response.get_json()['top'] == {'sample': [], 'cprofile': []}
+
+def test_report_is_forbidden_without_a_secret(monkeypatch):
+    monkeypatch.setattr(profiling, 'PROFILE_SECRET', '')
+    client = make_app().test_client()
+    assert client.get('/admin/profile', headers={profiling.TOKEN_HEADER: make_token(60, '')}).status_code == 403
+
+def busy():
+    return sum(range(1000))
+
+def test_top_reports_samples_and_cprofile_separately(monkeypatch):
+    monkeypatch.setattr(profiling, 'PROFILE_INTERVAL', 0.01)
+    totals = ProfileTotals()
+    totals.add_samples(Counter({'main;handler;render': 3, 'main;handler': 1}))
+    profile = cProfile.Profile()
+    profile.enable()
+    busy()
+    profile.disable()
+    totals.add_profile(profile)
+
+    top = totals.top(5)
+    assert totals.profiles == {'sample': 1, 'cprofile': 1}
+    assert top['sample'] == [
+        {'function': 'render', 'self_ms': 30.0, 'total_ms': 30.0, 'self_samples': 3, 'total_samples': 3},
+        {'function': 'handler', 'self_ms': 10.0, 'total_ms': 40.0, 'self_samples': 1, 'total_samples': 4}
+    ]
+    assert top['cprofile']
+    assert all('calls' in row and 'self_samples' not in row for row in top['cprofile'])
+    assert any(row['function'].startswith('busy (test_profiling.py:') for row in top['cprofile'])
+
+def test_top_command_merges_collapsed_files(tmp_path, capsys):
+    for name, stacks in (('a.collapsed', 'main;work 2\nmain 1\n'), ('b.collapsed', 'main;work 3\n')):
+        (tmp_path / name).write_text(stacks)
+    assert profiling.main(['top', str(tmp_path / 'a.collapsed'), str(tmp_path / 'b.collapsed'), '-n', '1']) == 0
+    rows = json.loads(capsys.readouterr().out)
+    assert [(row['function'], row['self_samples'], row['total_samples']) for row in rows] == [('work', 5, 5)]
+
+def test_token_expiry_is_in_the_future():
+    expires = int(make_token(60, SECRET).split('.')[0])
+    assert time.time() < expires <= time.time() + 61
@@ -0,0 +1,55 @@
+from datetime import datetime
+import pytest
+from trading_core import tick_history
+from trading_core.tick_history import get_bars, maintain_partitions
+
+NOW = datetime(2024, 3, 10, 12, 0)
+
+# Fake cursor listing the given price_ticks partitions and recording every
+# statement
+class FakeCursor:
+    def __init__(self, partitions=()):
+        self.partitions = list(partitions)
+        self.statements = []
+
+    def execute(self, sql, params=None):
+        self.statements.append((' '.join(sql.split()), params))
+
+    def fetchall(self):
+        return [{'relname': name} for name in self.partitions]
+
+def test_creates_today_and_the_partitions_ahead():
+    cur = FakeCursor()
+    maintain_partitions(cur, NOW)
+    created = [sql for sql, _ in cur.statements if sql.startswith('CREATE TABLE')]
+    assert created == [
+        "CREATE TABLE IF NOT EXISTS price_ticks_p20240310 PARTITION OF price_ticks "
+        "FOR VALUES FROM ('2024-03-10') TO ('2024-03-11')",
+        "CREATE TABLE IF NOT EXISTS price_ticks_p20240311 PARTITION OF price_ticks "
+        "FOR VALUES FROM ('2024-03-11') TO ('2024-03-12')",
+        "CREATE TABLE IF NOT EXISTS price_ticks_p20240312 PARTITION OF price_ticks "
+        "FOR VALUES FROM ('2024-03-12') TO ('2024-03-13')"
+    ]
+
+def test_drops_only_partitions_past_retention(monkeypatch):
+    monkeypatch.setattr(tick_history, 'TICK_RETENTION_DAYS', 2)
+    cur = FakeCursor(['price_ticks_p20240307', 'price_ticks_p20240308', 'price_ticks_p20240309',
+                      'price_ticks_p20240310'])
+    maintain_partitions(cur, NOW)
+    dropped = [sql for sql, _ in cur.statements if sql.startswith('DROP TABLE')]
+    # The 8th is exactly TICK_RETENTION_DAYS old and is kept
+    assert dropped == ['DROP TABLE IF EXISTS price_ticks_p20240307']
+
+def test_prunes_1s_bars_older_than_their_retention(monkeypatch):
+    monkeypatch.setattr(tick_history, 'BAR_1S_RETENTION_HOURS', 6)
+    cur = FakeCursor()
+    maintain_partitions(cur, NOW)
+    sql, params = cur.statements[-1]
+    assert sql.startswith('DELETE FROM price_bars')
+    assert "resolution = '1s'" in sql
+    assert params == (datetime(2024, 3, 10, 6, 0),)
+
+def test_get_bars_rejects_an_unknown_resolution_before_querying(monkeypatch):
+    monkeypatch.setattr(tick_history, 'get_db_connection', lambda: pytest.fail('must not query'))
+    with pytest.raises(ValueError, match='Unknown resolution'):
+        get_bars('AAPL', '5m')
@@ -0,0 +1,98 @@
+import pytest
+from trading_core import accounts
+from trading_core.valuation import PortfolioBook
+
+class Snapshot:
+    def __init__(self, version, prices):
+        self.version = version
+        self.quotes = [{'symbol': symbol, 'price': price} for symbol, price in prices.items()]
+        self.by_symbol = {quote['symbol']: quote for quote in self.quotes}
+
+SNAPSHOT = Snapshot(1, {'AAPL': 100.0, 'MSFT': 50.0})
+
+ROWS = [{'symbol': 'AAPL', 'shares': 10, 'avg_price': 90.0}]
+
+def test_add_values_and_keeps_the_account():
+    book = PortfolioBook()
+    account = book.add(1, 1000.0, ROWS, SNAPSHOT, book.token())
+    assert (account.cash, account.market_value, account.total_value) == (1000.0, 1000.0, 2000.0)
+    assert book.cached(1, SNAPSHOT) is account
+
+def test_ticks_move_only_the_holders():
+    book = PortfolioBook()
+    book.add(1, 0.0, ROWS, SNAPSHOT, book.token())
+    book.add(2, 0.0, [{'symbol': 'MSFT', 'shares': 2, 'avg_price': 50.0}], SNAPSHOT, book.token())
+    tick = Snapshot(2, {'AAPL': 101.5, 'MSFT': 50.0})
+    assert book.cached(1, tick).market_value == 1015.0
+    assert book.cached(2, tick).market_value == 100.0
+
+def test_invalidation_during_the_read_is_not_cached():
+    book = PortfolioBook()
+    token = book.token()
+    # The trade's NOTIFY lands between the read and add()
+    book.invalidate(1)
+    account = book.add(1, 1000.0, ROWS, SNAPSHOT, token)
+    assert account.cash == 1000.0
+    assert book.cached(1, SNAPSHOT) is None
+    # A read that starts afterwards is kept
+    book.add(1, 500.0, ROWS, SNAPSHOT, book.token())
+    assert book.cached(1, SNAPSHOT).cash == 500.0
+
+def test_an_order_applied_during_the_read_is_not_overwritten():
+    book = PortfolioBook()
+    book.add(1, 1000.0, ROWS, SNAPSHOT, book.token())
+    book.invalidate(1)
+    token = book.token()
+    book.apply(1, 0.0, {'AAPL': (20, 95.0)})
+    book.add(1, 1000.0, ROWS, SNAPSHOT, token)
+    assert book.cached(1, SNAPSHOT) is None
+
+def test_other_users_invalidations_dont_block_caching():
+    book = PortfolioBook()
+    token = book.token()
+    book.invalidate(2)
+    book.add(1, 1000.0, ROWS, SNAPSHOT, token)
+    assert book.cached(1, SNAPSHOT) is not None
+
+def test_invalidating_everyone_blocks_every_read_in_flight():
+    book = PortfolioBook()
+    token = book.token()
+    book.invalidate()
+    book.add(1, 1000.0, ROWS, SNAPSHOT, token)
+    assert book.cached(1, SNAPSHOT) is None
+
+def test_forgotten_invalidations_are_treated_as_stale():
+    book = PortfolioBook(max_accounts=2)
+    token = book.token()
+    for user_id in (1, 2, 3):
+        book.invalidate(user_id)
+    # User 1's invalidation was evicted from the bounded record
+    book.add(1, 1000.0, ROWS, SNAPSHOT, token)
+    assert book.cached(1, SNAPSHOT) is None
+
+def test_get_interleaved_with_a_notify(monkeypatch):
+    book = PortfolioBook()
+    reads = []
+
+    def get_positions(user_id):
+        reads.append(user_id)
+        if len(reads) == 1:
+            # Cash was read before the trade, positions after its NOTIFY
+            book.invalidate(user_id)
+        return ROWS
+
+    monkeypatch.setattr(accounts, 'get_cash', lambda user_id: 1000.0)
+    monkeypatch.setattr(accounts, 'get_positions', get_positions)
+    assert book.get(1, SNAPSHOT).cash == 1000.0
+    assert book.cached(1, SNAPSHOT) is None
+    book.get(1, SNAPSHOT)
+    assert book.cached(1, SNAPSHOT) is not None
+    assert reads == [1, 1]
+
+@pytest.mark.parametrize('shares, expected', [(0, {}), (5, {'AAPL': [5, 90.0]})])
+def test_apply_updates_a_loaded_account(shares, expected):
+    book = PortfolioBook()
+    book.add(1, 1000.0, ROWS, SNAPSHOT, book.token())
+    book.apply(1, 1500.0, {'AAPL': (shares, 90.0)})
+    account = book.cached(1, SNAPSHOT)
+    assert (account.cash, account.positions) == (1500.0, expected)
@@ -0,0 +1,15 @@
+# Shared trading core used by both the gamified and traditional apps:
+# connection pooling, schema migrations, market pricing and caching, order
+# execution, accounts, achievements and clickstream logging. The apps only
+# add their own presentation on top.
+
+from . import db, market_engine, market_cache, metrics, profiling
+
+# Wire request metrics and profiling, the per-request connection and
+# per-worker background threads into a Flask app
+def init_app(app):
+    metrics.init_app(app)
+    profiling.init_app(app)
+    db.init_app(app)
+    market_engine.init_app(app)
+    market_cache.init_app(app)
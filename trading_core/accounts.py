@@ -0,0 +1,199 @@
+import os
+import threading
+from collections import OrderedDict
+from flask import session
+from . import achievements
+from .db import get_db_connection
+
+# Users, positions and trade history for the current session.
+
+STARTING_CASH = 100000.00
+
+# Per-worker session_id -> user_id cache, least recently used evicted first
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 100000))
+
+_user_cache = OrderedDict()
+_user_cache_lock = threading.Lock()
+
+def cached_user_id(session_id):
+    with _user_cache_lock:
+        user_id = _user_cache.get(session_id)
+        if user_id is not None:
+            _user_cache.move_to_end(session_id)
+        return user_id
+
+def cache_user_id(session_id, user_id):
+    with _user_cache_lock:
+        _user_cache[session_id] = user_id
+        _user_cache.move_to_end(session_id)
+        while len(_user_cache) > USER_CACHE_SIZE:
+            _user_cache.popitem(last=False)
+
+# Look up the user for a session, creating it (with its starter achievements
+# and achievement counters) if needed, in one round-trip
+RESOLVE_USER_SQL = '''
+    WITH existing AS (
+        SELECT user_id FROM users WHERE session_id = %(session_id)s
+    ), created AS (
+        INSERT INTO users (session_id, platform_type, initial_cash, current_cash)
+        SELECT %(session_id)s, %(platform_type)s, %(cash)s, %(cash)s
+        WHERE NOT EXISTS (SELECT 1 FROM existing)
+        ON CONFLICT (session_id) DO NOTHING
+        RETURNING user_id
+    ), starter AS (
+        INSERT INTO achievements (user_id, achievement_name)
+        SELECT created.user_id, name
+        FROM created, unnest(%(achievements)s::varchar[]) AS name
+        ON CONFLICT (user_id, achievement_name) DO NOTHING
+    ), stats AS (
+        INSERT INTO user_stats (user_id, unlocked)
+        SELECT user_id, %(unlocked)s
+        FROM created
+        ON CONFLICT (user_id) DO NOTHING
+    )
+    SELECT user_id, false AS created FROM existing
+    UNION ALL
+    SELECT user_id, true AS created FROM created
+'''
+
+# The session's session_id, creating one if needed
+def ensure_session_id():
+    if 'session_id' not in session:
+        session['session_id'] = os.urandom(16).hex()
+        print(f"Created new session_id: {session['session_id']}")
+    return session['session_id']
+
+def resolve_params(session_id, platform_type, starter_achievements):
+    return {
+        'session_id': session_id,
+        'platform_type': platform_type,
+        'cash': STARTING_CASH,
+        'achievements': list(starter_achievements),
+        'unlocked': sum(achievements.BITS[name] for name in starter_achievements)
+    }
+
+# Ensure the session has a session_id and a matching users row.
+# New users get STARTING_CASH and any starter achievements.
+#
+# Flask sessions are signed, so a session that already carries a user_id was
+# set by us after the row existed and is trusted without a query. Otherwise
+# the worker's session_id -> user_id cache is tried before the database.
+def init_user(platform_type, starter_achievements=()):
+    if 'session_id' in session and 'user_id' in session:
+        return session['user_id']
+
+    session_id = ensure_session_id()
+
+    user_id = cached_user_id(session_id)
+    if user_id is None:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        params = resolve_params(session_id, platform_type, starter_achievements)
+        cur.execute(RESOLVE_USER_SQL, params)
+        user = cur.fetchone()
+        if not user:
+            # Lost a race with a concurrent request creating the same session;
+            # its row is committed by now
+            cur.execute(RESOLVE_USER_SQL, params)
+            user = cur.fetchone()
+        conn.commit()
+        cur.close()
+
+        user_id = user['user_id']
+        if user['created']:
+            print(f"Created new {platform_type} user_id: {user_id}")
+        cache_user_id(session_id, user_id)
+
+    session['user_id'] = user_id
+    return user_id
+
+# Drop a session's cached identity, e.g. when its users row has gone missing,
+# so the next init_user() resolves it against the database again
+def forget_user():
+    session_id = session.get('session_id')
+    session.pop('user_id', None)
+    if session_id is not None:
+        with _user_cache_lock:
+            _user_cache.pop(session_id, None)
+
+CASH_SQL = 'SELECT current_cash FROM users WHERE user_id = %s'
+
+POSITIONS_SQL = '''
+    SELECT symbol, shares, avg_price
+    FROM portfolio
+    WHERE user_id = %s
+'''
+
+TRADE_HISTORY_SQL = '''
+    SELECT symbol, action, shares, price, total_cost, timestamp
+    FROM trades
+    WHERE user_id = %s
+    ORDER BY timestamp DESC
+    LIMIT %s
+'''
+
+def get_cash(user_id):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(CASH_SQL, (user_id,))
+    user = cur.fetchone()
+    cur.close()
+    return float(user['current_cash']) if user else None
+
+def get_positions(user_id):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(POSITIONS_SQL, (user_id,))
+    positions = cur.fetchall()
+    cur.close()
+    return positions
+
+# Mark positions to market. `quotes` maps symbol -> quote with a 'price';
+# positions in symbols without a quote are skipped.
+# Returns (items, total market value).
+def value_positions(positions, quotes):
+    items = []
+    total_value = 0.0
+    for position in positions:
+        quote = quotes.get(position['symbol'])
+        if not quote:
+            continue
+
+        avg_price = float(position['avg_price'])
+        market_value = position['shares'] * quote['price']
+        cost_basis = position['shares'] * avg_price
+        gain_loss = market_value - cost_basis
+        total_value += market_value
+
+        items.append({
+            'symbol': position['symbol'],
+            'shares': position['shares'],
+            'avg_price': avg_price,
+            'current_price': quote['price'],
+            'market_value': market_value,
+            'cost_basis': cost_basis,
+            'gain_loss': gain_loss,
+            'gain_loss_percent': (gain_loss / cost_basis * 100) if cost_basis > 0 else 0
+        })
+    return items, total_value
+
+# Trade row (or order fill) formatted for display
+def format_trade(trade):
+    return {
+        'symbol': trade['symbol'],
+        'action': trade['action'].upper(),
+        'shares': trade['shares'],
+        'price': float(trade['price']),
+        'total': float(trade['total_cost'] if 'total_cost' in trade else trade['total']),
+        'timestamp': trade['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+# Most recent trades first, formatted for display
+def get_trade_history(user_id, limit):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(TRADE_HISTORY_SQL, (user_id, limit))
+    trades = cur.fetchall()
+    cur.close()
+
+    return [format_trade(trade) for trade in trades]
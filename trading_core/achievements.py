@@ -0,0 +1,254 @@
+import os
+import queue
+import atexit
+import threading
+from datetime import date, timedelta
+from dotenv import load_dotenv
+from .db import get_db_connection, get_pool
+
+load_dotenv()
+
+# Achievements.
+#
+# Rules are data: each achievement lists the event that can unlock it and the
+# conditions on a user's metrics. Metrics come from incremental counters, never
+# from scanning history:
+#
+#   trade events  user_stats counters, bumped by the order statements in the
+#                 same transaction as the fill (trade_count, trades_today,
+#                 streak_days)
+#   tick events   the live leaderboard's valuation of the user (total_value,
+#                 rank, and closed_week_pnl when the user's week rolls over)
+#
+# Each user's unlocked achievements are a bitmask in user_stats.unlocked, so
+# a rule that is already unlocked costs one AND. New unlocks are returned to
+# the caller straight away and written in batches by a background thread.
+
+FLUSH_INTERVAL = float(os.environ.get('ACHIEVEMENT_FLUSH_INTERVAL', 1.0))
+
+# Achievement catalog, in display order. `bit` is the position in
+# user_stats.unlocked and must never change once shipped.
+ACHIEVEMENTS = [
+    {'name': 'First Trade', 'icon': '🎯', 'bit': 0, 'event': 'trade',
+     'conditions': [('trade_count', '>=', 1)]},
+    {'name': '10 Day Streak', 'icon': '🔥', 'bit': 1, 'event': 'trade',
+     'conditions': [('streak_days', '>=', 10)]},
+    {'name': 'Green Week', 'icon': '💚', 'bit': 2, 'event': 'tick',
+     'conditions': [('closed_week_pnl', '>', 0)]},
+    {'name': '$100K Portfolio', 'icon': '💎', 'bit': 3, 'event': 'tick',
+     'conditions': [('total_value', '>=', 100000)]},
+    {'name': 'Top 100', 'icon': '🏆', 'bit': 4, 'event': 'tick',
+     'conditions': [('rank', '<=', 100), ('trade_count', '>=', 1)]},
+    {'name': 'Day Trader', 'icon': '⚡', 'bit': 5, 'event': 'trade',
+     'conditions': [('trades_today', '>=', 10)]}
+]
+
+BITS = {achievement['name']: 1 << achievement['bit'] for achievement in ACHIEVEMENTS}
+
+OPERATORS = {
+    '>=': lambda a, b: a >= b,
+    '>': lambda a, b: a > b,
+    '<=': lambda a, b: a <= b
+}
+
+RULES = {}
+for _achievement in ACHIEVEMENTS:
+    RULES.setdefault(_achievement['event'], []).append(_achievement)
+
+# Upsert the trade counters; spliced into the order statements after their
+# `account` CTE, recording %(trade_count)s trades when %(award_achievements)s
+TRADE_STATS_CTE = '''
+    stats AS (
+        INSERT INTO user_stats AS s (user_id, trade_count, trades_today, last_trade_date, streak_days)
+        SELECT user_id, %(trade_count)s, %(trade_count)s, CURRENT_DATE, 1
+        FROM account
+        WHERE %(award_achievements)s
+        ON CONFLICT (user_id) DO UPDATE
+        SET trade_count = s.trade_count + EXCLUDED.trade_count,
+            trades_today = CASE WHEN s.last_trade_date = CURRENT_DATE
+                                THEN s.trades_today + EXCLUDED.trades_today
+                                ELSE EXCLUDED.trades_today END,
+            streak_days = CASE WHEN s.last_trade_date = CURRENT_DATE THEN s.streak_days
+                               WHEN s.last_trade_date = CURRENT_DATE - 1 THEN s.streak_days + 1
+                               ELSE 1 END,
+            last_trade_date = CURRENT_DATE,
+            updated_at = CURRENT_TIMESTAMP
+        RETURNING trade_count, trades_today, streak_days, unlocked
+    )
+'''
+
+# Names of the achievements `event` unlocks for these metrics, skipping the
+# ones already in the `unlocked` bitmask. Missing metrics never match.
+def evaluate(event, metrics, unlocked=0):
+    names = []
+    for rule in RULES.get(event, ()):
+        if unlocked & BITS[rule['name']]:
+            continue
+        if all(metrics.get(metric) is not None and OPERATORS[op](metrics[metric], value)
+               for metric, op, value in rule['conditions']):
+            names.append(rule['name'])
+    return names
+
+# Monday of the current week
+def week_start(today=None):
+    today = today or date.today()
+    return today - timedelta(days=today.weekday())
+
+class AchievementWriter:
+    def __init__(self, flush_interval=FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.written = 0
+        self.failed = 0
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='achievement-writer', daemon=True)
+        self._thread.start()
+
+    # Stop the worker thread and write everything still queued
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    # Unlocks not yet written, so a fast second trade doesn't report them again
+    def pending(self, user_id):
+        with self._pending_lock:
+            return set(self._pending.get(user_id, ()))
+
+    def unlock(self, user_id, names):
+        with self._pending_lock:
+            self._pending.setdefault(user_id, set()).update(names)
+        for name in names:
+            self.queue.put(('unlock', user_id, name))
+
+    def set_week(self, user_id, start, value):
+        self.queue.put(('week', user_id, start, value))
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if not batch:
+            return
+
+        unlocks = [item for item in batch if item[0] == 'unlock']
+        bits = {}
+        for _, user_id, name in unlocks:
+            bits[user_id] = bits.get(user_id, 0) | BITS[name]
+        weeks = {item[1]: item for item in batch if item[0] == 'week'}
+
+        try:
+            with get_pool().connection() as conn:
+                cur = conn.cursor()
+                if unlocks:
+                    cur.execute('''
+                        INSERT INTO achievements (user_id, achievement_name)
+                        SELECT * FROM unnest(%s::integer[], %s::varchar[])
+                        ON CONFLICT (user_id, achievement_name) DO NOTHING
+                    ''', ([u[1] for u in unlocks], [u[2] for u in unlocks]))
+                    cur.execute('''
+                        INSERT INTO user_stats AS s (user_id, unlocked)
+                        SELECT * FROM unnest(%s::integer[], %s::integer[])
+                        ON CONFLICT (user_id) DO UPDATE
+                        SET unlocked = s.unlocked | EXCLUDED.unlocked
+                    ''', (list(bits), list(bits.values())))
+                if weeks:
+                    # Only the first worker to see a user's new week sets its baseline
+                    cur.execute('''
+                        INSERT INTO user_stats AS s (user_id, week_start, week_start_value)
+                        SELECT * FROM unnest(%s::integer[], %s::date[], %s::numeric[])
+                        ON CONFLICT (user_id) DO UPDATE
+                        SET week_start = EXCLUDED.week_start, week_start_value = EXCLUDED.week_start_value
+                        WHERE s.week_start IS DISTINCT FROM EXCLUDED.week_start
+                    ''', ([w[1] for w in weeks.values()], [w[2] for w in weeks.values()],
+                          [w[3] for w in weeks.values()]))
+                cur.close()
+            self.written += len(unlocks)
+        except Exception as e:
+            self.failed += len(unlocks)
+            print(f"Achievement flush error ({len(unlocks)} unlocks lost): {e}")
+
+        with self._pending_lock:
+            for _, user_id, name in unlocks:
+                names = self._pending.get(user_id)
+                if names is not None:
+                    names.discard(name)
+                    if not names:
+                        del self._pending[user_id]
+
+_writer = None
+_writer_pid = None
+
+# This worker's writer, started on first use
+def get_writer():
+    global _writer, _writer_pid
+    if _writer_pid != os.getpid():
+        _writer = AchievementWriter()
+        _writer.start()
+        _writer_pid = os.getpid()
+    return _writer
+
+def shutdown():
+    if _writer is not None and _writer_pid == os.getpid():
+        _writer.stop()
+
+# Registered after db's close_pool, so it runs first and can still use the pool
+atexit.register(shutdown)
+
+# Evaluate the trade rules against the counters an order statement returned.
+# Returns the names of newly unlocked achievements.
+def on_trade(user_id, stats):
+    writer = get_writer()
+    names = [name for name in evaluate('trade', stats, stats['unlocked'] or 0)
+             if name not in writer.pending(user_id)]
+    if names:
+        writer.unlock(user_id, names)
+    return names
+
+# Queue the tick rules one user just met (from evaluate('tick', ...)),
+# skipping any already pending. Returns the names queued.
+def on_tick(user_id, names):
+    writer = get_writer()
+    names = [name for name in names if name not in writer.pending(user_id)]
+    if names:
+        writer.unlock(user_id, names)
+    return names
+
+UNLOCKED_SQL = '''
+    SELECT achievement_name
+    FROM achievements
+    WHERE user_id = %s
+'''
+
+def get_unlocked(user_id):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(UNLOCKED_SQL, (user_id,))
+    unlocked = {row['achievement_name'] for row in cur.fetchall()}
+    cur.close()
+    return unlocked | get_writer().pending(user_id)
+
+# Full catalog with an unlocked flag per achievement
+def catalog(unlocked):
+    return [{'name': achievement['name'], 'icon': achievement['icon'], 'unlocked': achievement['name'] in unlocked}
+            for achievement in ACHIEVEMENTS]
+
+def get_user_achievements(user_id):
+    return catalog(get_unlocked(user_id))
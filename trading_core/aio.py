@@ -0,0 +1,147 @@
+import os
+import asyncio
+from flask import session
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+from dotenv import load_dotenv
+from . import accounts, achievements, dashboard, market_cache, order_book, valuation
+from .db import POOL_MIN_SIZE, POOL_TIMEOUT, POOL_MAX_IDLE, POOL_MAX_LIFETIME, AsyncCountingCursor, count_connection, get_pool
+
+load_dotenv()
+
+# Async data access for the ASGI serving mode (see asgi.py).
+#
+# The same statements as the sync helpers, run on psycopg's async connections
+# so a request waiting on the database costs a coroutine instead of a worker
+# thread. Each helper checks a connection out of the async pool for its own
+# statement only, which lets independent reads run concurrently under
+# asyncio.gather(). The per-worker caches (users, valued accounts, market
+# snapshot, pending achievements) are shared with the sync code.
+
+# Connections are per statement rather than per request, so size this for
+# the number of reads in flight, not the number of open requests
+ASYNC_POOL_MAX_SIZE = int(os.environ.get('DB_ASYNC_POOL_MAX_SIZE', 20))
+
+_pool = None
+_pool_opened = None
+_pool_key = None
+
+# Async pool for this worker's event loop, opened on first use
+async def get_async_pool():
+    global _pool, _pool_opened, _pool_key
+    key = (os.getpid(), asyncio.get_running_loop())
+    if _pool is None or _pool_key != key:
+        _pool = AsyncConnectionPool(
+            os.environ.get('DATABASE_URL'),
+            min_size=POOL_MIN_SIZE,
+            max_size=ASYNC_POOL_MAX_SIZE,
+            timeout=POOL_TIMEOUT,
+            max_idle=POOL_MAX_IDLE,
+            max_lifetime=POOL_MAX_LIFETIME,
+            kwargs={'row_factory': dict_row, 'cursor_factory': AsyncCountingCursor},
+            check=AsyncConnectionPool.check_connection,
+            name='trading-async',
+            open=False
+        )
+        _pool_key = key
+        # Requests arriving while it opens wait for the same open
+        _pool_opened = asyncio.ensure_future(_pool.open())
+    await _pool_opened
+    return _pool
+
+async def close_async_pool():
+    global _pool, _pool_opened, _pool_key
+    if _pool is not None and _pool_key == (os.getpid(), asyncio.get_running_loop()):
+        await _pool.close()
+    _pool = None
+    _pool_opened = None
+    _pool_key = None
+
+async def fetchall(sql, params):
+    pool = await get_async_pool()
+    count_connection()
+    async with pool.connection() as conn:
+        cur = await conn.execute(sql, params)
+        return await cur.fetchall()
+
+async def fetchone(sql, params):
+    pool = await get_async_pool()
+    count_connection()
+    async with pool.connection() as conn:
+        cur = await conn.execute(sql, params)
+        return await cur.fetchone()
+
+# Run a blocking helper on a thread, in a copy of the caller's context (so
+# with its Flask request context). For code that refreshes a shared cache
+# under a thread lock, like the market snapshot and the leaderboard.
+async def run_sync(fn, *args):
+    return await asyncio.to_thread(fn, *args)
+
+def _load_snapshot():
+    with get_pool().connection() as conn:
+        return market_cache.cache.get_snapshot(conn)
+
+# The cached market snapshot, refreshed on a thread when it has expired
+async def get_snapshot():
+    return market_cache.cache.fresh() or await run_sync(_load_snapshot)
+
+# accounts.init_user() on the async pool
+async def init_user(platform_type, starter_achievements=()):
+    if 'session_id' in session and 'user_id' in session:
+        return session['user_id']
+
+    session_id = accounts.ensure_session_id()
+    user_id = accounts.cached_user_id(session_id)
+    if user_id is None:
+        params = accounts.resolve_params(session_id, platform_type, starter_achievements)
+        pool = await get_async_pool()
+        count_connection()
+        async with pool.connection() as conn:
+            cur = await conn.execute(accounts.RESOLVE_USER_SQL, params)
+            user = await cur.fetchone()
+            if not user:
+                # Lost a race with a concurrent request creating the same session
+                cur = await conn.execute(accounts.RESOLVE_USER_SQL, params)
+                user = await cur.fetchone()
+
+        user_id = user['user_id']
+        if user['created']:
+            print(f"Created new {platform_type} user_id: {user_id}")
+        accounts.cache_user_id(session_id, user_id)
+
+    session['user_id'] = user_id
+    return user_id
+
+# valuation.value_account(); an account this worker hasn't loaded is read
+# with its cash and positions queries in parallel
+async def value_account(user_id, snapshot):
+    account = valuation.book.cached(user_id, snapshot)
+    if account is None:
+        token = valuation.book.token()
+        user, rows = await asyncio.gather(fetchone(accounts.CASH_SQL, (user_id,)),
+                                          fetchall(accounts.POSITIONS_SQL, (user_id,)))
+        if user is None:
+            return None
+        account = valuation.book.add(user_id, float(user['current_cash']), rows, snapshot, token)
+    return valuation.describe(account, snapshot)
+
+async def get_trade_history(user_id, limit):
+    trades = await fetchall(accounts.TRADE_HISTORY_SQL, (user_id, limit))
+    return [accounts.format_trade(trade) for trade in trades]
+
+async def get_open_orders(user_id):
+    orders = await fetchall(order_book.OPEN_ORDERS_SQL, (user_id,))
+    return [order_book.format_order(order) for order in orders]
+
+async def get_user_achievements(user_id):
+    rows = await fetchall(achievements.UNLOCKED_SQL, (user_id,))
+    unlocked = {row['achievement_name'] for row in rows}
+    return achievements.catalog(unlocked | achievements.get_writer().pending(user_id))
+
+# dashboard.load_dashboard() on the async pool
+async def load_dashboard(user_id, snapshot, history_limit, with_achievements=False, with_orders=False):
+    account = valuation.book.cached(user_id, snapshot)
+    token = valuation.book.token()
+    row = await fetchone(dashboard.DASHBOARD_SQL,
+                         dashboard.query_params(user_id, account, history_limit, with_achievements, with_orders))
+    return dashboard.build(user_id, row, snapshot, account, token)
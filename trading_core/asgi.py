@@ -0,0 +1,200 @@
+import io
+import os
+import sys
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.exceptions import HTTPException
+from dotenv import load_dotenv
+from . import aio, db
+
+load_dotenv()
+
+# ASGI serving mode.
+#
+# AsgiApp wraps one of the Flask apps so it can run under an ASGI server:
+#
+#     uvicorn gamified_app_db:asgi_app --workers 4
+#
+# Routing, sessions, templates and error handling stay Flask's. A route with
+# an async view registered through @asgi_app.view(endpoint) is served on the
+# event loop: the view runs inside a Flask request context (so `session`,
+# `request`, render_template and jsonify work as usual) and awaits its
+# database reads on the async pool in aio.py. Every other route, notably the
+# order-placing POSTs, runs the app's sync view unchanged on a thread pool,
+# so there is one copy of the write paths for both serving modes.
+#
+# Async views may return a response whose body is an async iterable; it is
+# streamed until the client disconnects (used by the SSE price feed).
+
+# Threads for the sync (WSGI) routes, per worker
+SYNC_THREADS = int(os.environ.get('ASGI_SYNC_THREADS', 16))
+
+# Build a WSGI environ for an HTTP scope
+def build_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            key = 'CONTENT_TYPE'
+        elif name == 'CONTENT_LENGTH':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = f'HTTP_{name}'
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+def encode_headers(headers):
+    return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+class AsgiApp:
+    def __init__(self, app, sync_threads=SYNC_THREADS):
+        self.app = app
+        self.views = {}
+        self.executor = ThreadPoolExecutor(sync_threads, thread_name_prefix='asgi-sync')
+
+    # Register an async view for an endpoint of the Flask app; it receives
+    # the same URL arguments as the sync view it replaces
+    def view(self, endpoint):
+        def register(fn):
+            self.views[endpoint] = fn
+            return fn
+        return register
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await aio.close_async_pool()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        body = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+        environ = build_environ(scope, b''.join(body))
+
+        try:
+            endpoint, view_args = self.app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            # Let Flask produce the 404/405 (or redirect)
+            endpoint, view_args = None, None
+
+        fn = self.views.get(endpoint)
+        if fn is None:
+            loop = asyncio.get_running_loop()
+            status, headers, chunks = await loop.run_in_executor(self.executor, self._call_wsgi, environ)
+            await send({'type': 'http.response.start', 'status': status, 'headers': encode_headers(headers)})
+            await send({'type': 'http.response.body', 'body': b''.join(chunks)})
+            return
+
+        response = await self._call_async(fn, view_args, environ)
+        try:
+            await send({'type': 'http.response.start', 'status': response.status_code,
+                        'headers': encode_headers(response.headers.to_wsgi_list())})
+            if hasattr(response.response, '__aiter__'):
+                await self._stream(response.response, receive, send)
+            else:
+                await send({'type': 'http.response.body', 'body': b''.join(response.iter_encoded())})
+        finally:
+            response.close()
+
+    # Flask's full_dispatch_request() with an awaited view
+    async def _call_async(self, fn, view_args, environ):
+        app = self.app
+        # Each request is its own task; give it its own query counters
+        db.track_queries()
+        ctx = app.request_context(environ)
+        ctx.push()
+        try:
+            try:
+                rv = app.preprocess_request()
+                if rv is None:
+                    rv = await fn(**view_args)
+            except Exception as e:
+                rv = app.handle_user_exception(e)
+            return app.process_response(app.make_response(rv))
+        except Exception as e:
+            return app.handle_exception(e)
+        finally:
+            ctx.pop()
+
+    # Run the sync app on a worker thread, buffering its response
+    def _call_wsgi(self, environ):
+        started = []
+        chunks = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [int(status.split(' ', 1)[0]), headers]
+            return chunks.append
+
+        result = self.app(environ, start_response)
+        try:
+            for chunk in result:
+                chunks.append(chunk)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return started[0], started[1], chunks
+
+    # Send each chunk as it is produced; a disconnect stops the body at once,
+    # even while it is waiting for its next chunk
+    async def _stream(self, body, receive, send):
+        async def watch():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        watcher = asyncio.create_task(watch())
+        try:
+            while True:
+                step = asyncio.ensure_future(anext(body))
+                await asyncio.wait((step, watcher), return_when=asyncio.FIRST_COMPLETED)
+                if not step.done():
+                    step.cancel()
+                    await asyncio.wait((step,))
+                    return
+                try:
+                    chunk = step.result()
+                except StopAsyncIteration:
+                    break
+                if isinstance(chunk, str):
+                    chunk = chunk.encode()
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            watcher.cancel()
+            await body.aclose()
@@ -0,0 +1,481 @@
+import os
+import sys
+import argparse
+import psycopg
+from psycopg.rows import dict_row
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Schema bootstrap and versioned migrations.
+#
+# Run once per deploy, before starting the web workers:
+#
+#     python -m trading_core.bootstrap            # apply pending migrations
+#     python -m trading_core.bootstrap --status   # list applied / pending migrations
+#
+# The request path never runs DDL; each migration is applied exactly once and
+# recorded in schema_migrations. Add new migrations at the end with the next
+# version number and never edit one that has already shipped.
+
+MIGRATIONS = []
+
+# Arbitrary key for pg_advisory_xact_lock so concurrent bootstraps serialize
+MIGRATION_LOCK_ID = 72315001
+
+def migration(version, description):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+# Stocks available on both platforms
+SEED_STOCKS = [
+    ('AAPL', 'Apple Inc.', 178.50, 'medium'),
+    ('MSFT', 'Microsoft Corporation', 378.50, 'medium'),
+    ('GOOGL', 'Alphabet Inc.', 142.00, 'medium'),
+    ('AMZN', 'Amazon.com Inc.', 151.25, 'medium'),
+    ('META', 'Meta Platforms Inc.', 352.75, 'medium'),
+    ('TSLA', 'Tesla Inc.', 242.50, 'high'),
+    ('NVDA', 'NVIDIA Corporation', 478.00, 'high'),
+    ('AMD', 'Advanced Micro Devices', 138.25, 'high'),
+    ('JPM', 'JPMorgan Chase & Co.', 158.75, 'low'),
+    ('BAC', 'Bank of America Corp.', 33.50, 'low'),
+    ('WMT', 'Walmart Inc.', 168.25, 'low'),
+    ('PG', 'Procter & Gamble Co.', 155.50, 'low'),
+    ('JNJ', 'Johnson & Johnson', 157.75, 'low'),
+    ('DIS', 'The Walt Disney Company', 96.50, 'medium'),
+    ('NKE', 'Nike Inc.', 108.75, 'medium'),
+    ('NFLX', 'Netflix Inc.', 442.50, 'high'),
+    ('COST', 'Costco Wholesale Corp.', 588.25, 'low'),
+    ('V', 'Visa Inc.', 258.50, 'low'),
+    ('MA', 'Mastercard Inc.', 412.75, 'low'),
+    ('PEP', 'PepsiCo Inc.', 172.50, 'low')
+]
+
+@migration(1, 'Create core tables')
+def create_core_tables(cur):
+    # IF NOT EXISTS so databases created by the old per-request init_db()
+    # can adopt the migration history without changes
+
+    # Users table
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id SERIAL PRIMARY KEY,
+            session_id VARCHAR(255) UNIQUE NOT NULL,
+            platform_type VARCHAR(50) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            initial_cash DECIMAL(12, 2) DEFAULT 100000.00,
+            current_cash DECIMAL(12, 2) DEFAULT 100000.00
+        )
+    ''')
+
+    # Trades table
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS trades (
+            trade_id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(user_id),
+            session_id VARCHAR(255) NOT NULL,
+            symbol VARCHAR(10) NOT NULL,
+            action VARCHAR(10) NOT NULL,
+            shares INTEGER NOT NULL,
+            price DECIMAL(10, 2) NOT NULL,
+            total_cost DECIMAL(12, 2) NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Portfolio table
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS portfolio (
+            portfolio_id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(user_id),
+            session_id VARCHAR(255) NOT NULL,
+            symbol VARCHAR(10) NOT NULL,
+            shares INTEGER NOT NULL,
+            avg_price DECIMAL(10, 2) NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(session_id, symbol)
+        )
+    ''')
+
+    # Clickstream table for detailed behavioral tracking
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS clickstream (
+            click_id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(user_id),
+            session_id VARCHAR(255) NOT NULL,
+            event_type VARCHAR(50) NOT NULL,
+            event_data JSONB,
+            page_url VARCHAR(255),
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Stock prices table (shared by both platforms)
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS stock_prices (
+            symbol VARCHAR(10) PRIMARY KEY,
+            company_name VARCHAR(100) NOT NULL,
+            base_price DECIMAL(10, 2) NOT NULL,
+            current_price DECIMAL(10, 2) NOT NULL,
+            volatility VARCHAR(10) NOT NULL,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Achievements table
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS achievements (
+            achievement_id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(user_id),
+            session_id VARCHAR(255) NOT NULL,
+            achievement_name VARCHAR(100) NOT NULL,
+            unlocked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(session_id, achievement_name)
+        )
+    ''')
+
+@migration(2, 'Seed stock prices')
+def seed_stock_prices(cur):
+    cur.executemany('''
+        INSERT INTO stock_prices (symbol, company_name, base_price, current_price, volatility)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (symbol) DO NOTHING
+    ''', [(symbol, name, price, price, volatility) for symbol, name, price, volatility in SEED_STOCKS])
+
+@migration(3, 'Add market clock for tick versioning')
+def create_market_clock(cur):
+    # Single row; tick_version is bumped by the tick engine on every tick
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS market_clock (
+            id SMALLINT PRIMARY KEY CHECK (id = 1),
+            tick_version BIGINT NOT NULL DEFAULT 0,
+            ticked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cur.execute('INSERT INTO market_clock (id) VALUES (1) ON CONFLICT (id) DO NOTHING')
+
+@migration(4, 'Add tick history and OHLCV bars')
+def create_tick_history(cur):
+    # Raw ticks, one partition per day; partitions are created and dropped by
+    # trading_core.tick_history as the tick engine runs
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS price_ticks (
+            symbol VARCHAR(10) NOT NULL,
+            ts TIMESTAMP NOT NULL,
+            price DECIMAL(10, 2) NOT NULL,
+            tick_version BIGINT NOT NULL
+        ) PARTITION BY RANGE (ts)
+    ''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_price_ticks_symbol_ts ON price_ticks (symbol, ts)')
+
+    # Rolled-up bars; resolution is '1s', '1m' or '1h'
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS price_bars (
+            symbol VARCHAR(10) NOT NULL,
+            resolution VARCHAR(4) NOT NULL,
+            bucket TIMESTAMP NOT NULL,
+            open DECIMAL(10, 2) NOT NULL,
+            high DECIMAL(10, 2) NOT NULL,
+            low DECIMAL(10, 2) NOT NULL,
+            close DECIMAL(10, 2) NOT NULL,
+            volume INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (symbol, resolution, bucket)
+        )
+    ''')
+
+@migration(5, 'Add leaderboard snapshots')
+def create_leaderboard_snapshots(cur):
+    # Periodic copies of the top of the in-memory leaderboard
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS leaderboard_snapshots (
+            taken_at TIMESTAMP NOT NULL,
+            rank INTEGER NOT NULL,
+            user_id INTEGER REFERENCES users(user_id) ON DELETE CASCADE,
+            total_value DECIMAL(14, 2) NOT NULL,
+            return_percent DECIMAL(10, 4) NOT NULL,
+            PRIMARY KEY (taken_at, rank)
+        )
+    ''')
+
+@migration(6, 'Add resting limit and stop orders')
+def create_orders(cur):
+    # status: open -> triggered -> filled | rejected, or open -> cancelled | replaced
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS orders (
+            order_id BIGSERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(user_id),
+            session_id VARCHAR(255) NOT NULL,
+            symbol VARCHAR(10) NOT NULL,
+            side VARCHAR(4) NOT NULL,
+            order_type VARCHAR(10) NOT NULL,
+            shares INTEGER NOT NULL CHECK (shares > 0),
+            trigger_price DECIMAL(10, 2) NOT NULL CHECK (trigger_price > 0),
+            status VARCHAR(12) NOT NULL DEFAULT 'open',
+            replaces BIGINT,
+            filled_price DECIMAL(10, 2),
+            filled_at TIMESTAMP,
+            message VARCHAR(255),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # The engine's book loads only live orders
+    cur.execute('''
+        CREATE INDEX IF NOT EXISTS idx_orders_live
+        ON orders (order_id)
+        WHERE status IN ('open', 'triggered')
+    ''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_orders_session ON orders (session_id, created_at DESC)')
+
+@migration(7, 'Add per-user achievement counters')
+def create_user_stats(cur):
+    # Counters the achievement rules read instead of scanning trades;
+    # unlocked is a bitmask over trading_core.achievements.ACHIEVEMENTS
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+            trade_count INTEGER NOT NULL DEFAULT 0,
+            trades_today INTEGER NOT NULL DEFAULT 0,
+            last_trade_date DATE,
+            streak_days INTEGER NOT NULL DEFAULT 0,
+            week_start DATE,
+            week_start_value DECIMAL(14, 2),
+            unlocked INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cur.execute('''
+        INSERT INTO user_stats (user_id, trade_count, trades_today, last_trade_date, streak_days)
+        SELECT user_id, COUNT(*),
+               COUNT(*) FILTER (WHERE timestamp >= CURRENT_DATE),
+               MAX(timestamp)::date, 1
+        FROM trades
+        WHERE user_id IS NOT NULL
+        GROUP BY user_id
+        ON CONFLICT (user_id) DO NOTHING
+    ''')
+    # Bit positions as of this migration; later catalog entries append bits
+    cur.execute('''
+        INSERT INTO user_stats AS s (user_id, unlocked)
+        SELECT a.user_id, bit_or(b.bit)
+        FROM achievements a
+        JOIN (VALUES ('First Trade', 1), ('10 Day Streak', 2), ('Green Week', 4),
+                     ('$100K Portfolio', 8), ('Top 100', 16), ('Day Trader', 32)) AS b(name, bit)
+            ON b.name = a.achievement_name
+        WHERE a.user_id IS NOT NULL
+        GROUP BY a.user_id
+        ON CONFLICT (user_id) DO UPDATE SET unlocked = EXCLUDED.unlocked
+    ''')
+
+@migration(8, 'Index session-keyed trade and clickstream lookups')
+def create_session_indexes(cur):
+    # Trade history reads a session's newest trades; with the sort order in
+    # the index that is a short index range scan whatever the table size.
+    # users, portfolio and achievements are already served by their UNIQUE
+    # constraints, which lead with session_id.
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_trades_session_ts ON trades (session_id, timestamp DESC)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_clickstream_session_ts ON clickstream (session_id, timestamp)')
+
+# Tables that carried a session_id copy next to user_id
+USER_KEYED_TABLES = ('trades', 'portfolio', 'clickstream', 'achievements', 'orders')
+
+@migration(9, 'Key per-user tables by user_id instead of session_id')
+def key_tables_by_user_id(cur):
+    # session_id stays only on users; everything else joins through the
+    # integer user_id the apps already keep in the Flask session
+    for table in USER_KEYED_TABLES:
+        cur.execute(f'''
+            UPDATE {table} t
+            SET user_id = u.user_id
+            FROM users u
+            WHERE t.user_id IS NULL AND u.session_id = t.session_id
+        ''')
+        # Rows whose session never had a users row can't be attributed
+        cur.execute(f'DELETE FROM {table} WHERE user_id IS NULL')
+        cur.execute(f'ALTER TABLE {table} ALTER COLUMN user_id SET NOT NULL')
+
+    cur.execute('ALTER TABLE portfolio DROP CONSTRAINT IF EXISTS portfolio_session_id_symbol_key')
+    cur.execute('ALTER TABLE portfolio ADD CONSTRAINT portfolio_user_id_symbol_key UNIQUE (user_id, symbol)')
+    cur.execute('ALTER TABLE achievements DROP CONSTRAINT IF EXISTS achievements_session_id_achievement_name_key')
+    cur.execute('''
+        ALTER TABLE achievements
+        ADD CONSTRAINT achievements_user_id_achievement_name_key UNIQUE (user_id, achievement_name)
+    ''')
+
+    cur.execute('DROP INDEX IF EXISTS idx_trades_session_ts')
+    cur.execute('DROP INDEX IF EXISTS idx_clickstream_session_ts')
+    cur.execute('DROP INDEX IF EXISTS idx_orders_session')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_trades_user_ts ON trades (user_id, timestamp DESC)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_clickstream_user_ts ON clickstream (user_id, timestamp)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_orders_user ON orders (user_id, created_at DESC)')
+
+    # Dropping a column is a catalog change; the space comes back as rows
+    # are rewritten (or with VACUUM FULL)
+    for table in USER_KEYED_TABLES:
+        cur.execute(f'ALTER TABLE {table} DROP COLUMN IF EXISTS session_id')
+
+@migration(10, 'Partition clickstream by day and add daily rollups')
+def partition_clickstream(cur):
+    # The existing table becomes one partition holding everything up to
+    # tomorrow; trading_core.clickstream_history creates the daily partitions
+    # after it and drops them (and eventually this one) once they expire.
+    # click_id goes: nothing reads it, and a partitioned table can't keep a
+    # primary key without the partition key in it.
+    cur.execute('ALTER TABLE clickstream RENAME TO clickstream_legacy')
+    cur.execute('ALTER INDEX IF EXISTS idx_clickstream_user_ts RENAME TO clickstream_legacy_user_ts')
+    cur.execute('ALTER TABLE clickstream_legacy DROP COLUMN IF EXISTS click_id')
+    cur.execute('DELETE FROM clickstream_legacy WHERE timestamp IS NULL')
+    cur.execute('ALTER TABLE clickstream_legacy ALTER COLUMN timestamp SET NOT NULL')
+
+    cur.execute('''
+        CREATE TABLE clickstream (
+            user_id INTEGER NOT NULL,
+            event_type VARCHAR(50) NOT NULL,
+            event_data JSONB,
+            page_url VARCHAR(255),
+            timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        ) PARTITION BY RANGE (timestamp)
+    ''')
+    cur.execute('CREATE INDEX idx_clickstream_user_ts ON clickstream (user_id, timestamp)')
+    cur.execute("SELECT date_trunc('day', LOCALTIMESTAMP) + INTERVAL '1 day' AS bound")
+    bound = cur.fetchone()['bound']
+    cur.execute(f'''
+        ALTER TABLE clickstream ATTACH PARTITION clickstream_legacy
+        FOR VALUES FROM (MINVALUE) TO ('{bound}')
+    ''')
+
+    # Daily summaries kept after the raw events expire
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS clickstream_user_days (
+            day DATE NOT NULL,
+            user_id INTEGER NOT NULL,
+            events INTEGER NOT NULL,
+            page_views INTEGER NOT NULL,
+            trades INTEGER NOT NULL,
+            first_event_at TIMESTAMP NOT NULL,
+            last_event_at TIMESTAMP NOT NULL,
+            event_counts JSONB NOT NULL,
+            PRIMARY KEY (day, user_id)
+        )
+    ''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_clickstream_user_days_user ON clickstream_user_days (user_id, day)')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS clickstream_event_days (
+            day DATE NOT NULL,
+            event_type VARCHAR(50) NOT NULL,
+            events INTEGER NOT NULL,
+            users INTEGER NOT NULL,
+            PRIMARY KEY (day, event_type)
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS clickstream_rollups (
+            day DATE PRIMARY KEY,
+            final BOOLEAN NOT NULL DEFAULT false,
+            rolled_up_at TIMESTAMP NOT NULL
+        )
+    ''')
+
+@migration(11, 'Add a default clickstream partition and a timestamp index')
+def add_clickstream_default_partition(cur):
+    # Catches events past the newest daily partition if maintenance falls
+    # behind, so the clickstream writer's COPY keeps working; maintenance
+    # moves them out when it creates their day's partition
+    cur.execute('CREATE TABLE IF NOT EXISTS clickstream_default PARTITION OF clickstream DEFAULT')
+    # Rollups read one day at a time; a BRIN index keeps that from scanning
+    # all of clickstream_legacy, and is small and quick to build on
+    # append-only data
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_clickstream_ts ON clickstream USING brin (timestamp)')
+
+def get_connection():
+    return psycopg.connect(
+        os.environ.get('DATABASE_URL'),
+        row_factory=dict_row
+    )
+
+def ensure_migrations_table(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def get_applied_versions(cur):
+    cur.execute('SELECT version FROM schema_migrations')
+    return {row['version'] for row in cur.fetchall()}
+
+# Apply every pending migration, each in its own transaction.
+# Returns the list of versions that were applied by this call.
+def run_migrations(conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+
+    applied_now = []
+    try:
+        for version, description, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+            with conn.transaction():
+                cur = conn.cursor()
+                cur.execute('SELECT pg_advisory_xact_lock(%s)', (MIGRATION_LOCK_ID,))
+                ensure_migrations_table(cur)
+
+                # Re-check under the lock; another worker may have won the race
+                if version in get_applied_versions(cur):
+                    cur.close()
+                    continue
+
+                print(f"Applying migration {version}: {description}")
+                fn(cur)
+                cur.execute('''
+                    INSERT INTO schema_migrations (version, description)
+                    VALUES (%s, %s)
+                ''', (version, description))
+                cur.close()
+                applied_now.append(version)
+    finally:
+        if own_conn:
+            conn.close()
+
+    return applied_now
+
+def print_status(conn):
+    with conn.transaction():
+        cur = conn.cursor()
+        ensure_migrations_table(cur)
+        applied = get_applied_versions(cur)
+        cur.close()
+
+    for version, description, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+        state = 'applied' if version in applied else 'pending'
+        print(f"{version:>4}  {state:<8} {description}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Create and migrate the trading platform schema')
+    parser.add_argument('--status', action='store_true', help='show migration status and exit')
+    args = parser.parse_args(argv)
+
+    try:
+        conn = get_connection()
+    except Exception as e:
+        print(f"❌ Connection failed: {e}")
+        return 1
+
+    try:
+        if args.status:
+            print_status(conn)
+        else:
+            applied = run_migrations(conn)
+            if applied:
+                print(f"✅ Applied {len(applied)} migration(s)")
+            else:
+                print("✅ Schema is up to date")
+    finally:
+        conn.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import queue
+import atexit
+import threading
+from datetime import datetime
+from flask import session, request
+from dotenv import load_dotenv
+from .db import get_pool
+
+load_dotenv()
+
+# Buffered clickstream sink.
+#
+# Handlers enqueue events and return immediately; a background thread per
+# worker writes them with COPY once CLICKSTREAM_BATCH_SIZE events are waiting
+# or CLICKSTREAM_FLUSH_INTERVAL seconds have passed. The buffer is bounded:
+# when it is full, events are dropped (the default) or the caller blocks for up
+# to CLICKSTREAM_BLOCK_TIMEOUT seconds before dropping. Whatever is still
+# buffered is flushed at interpreter shutdown.
+#
+# The table is partitioned by day; retention and daily rollups are handled by
+# trading_core.clickstream_history.
+
+BATCH_SIZE = int(os.environ.get('CLICKSTREAM_BATCH_SIZE', 500))
+FLUSH_INTERVAL = float(os.environ.get('CLICKSTREAM_FLUSH_INTERVAL', 1.0))
+MAX_BUFFER = int(os.environ.get('CLICKSTREAM_MAX_BUFFER', 10000))
+OVERFLOW_POLICY = os.environ.get('CLICKSTREAM_OVERFLOW', 'drop')  # 'drop' or 'block'
+BLOCK_TIMEOUT = float(os.environ.get('CLICKSTREAM_BLOCK_TIMEOUT', 0.05))
+
+# Column limits from the clickstream table; one oversized value would
+# otherwise fail the whole COPY batch
+EVENT_TYPE_MAX = 50
+PAGE_URL_MAX = 255
+
+class ClickstreamWriter:
+    def __init__(self, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 max_buffer=MAX_BUFFER, overflow=OVERFLOW_POLICY):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.queue = queue.Queue(maxsize=max_buffer)
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='clickstream-writer', daemon=True)
+        self._thread.start()
+
+    # Stop the worker thread and write everything still buffered
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def enqueue(self, user_id, event_type, event_data=None, page_url=None):
+        row = (
+            user_id,
+            event_type[:EVENT_TYPE_MAX],
+            json.dumps(event_data) if event_data else None,
+            page_url[:PAGE_URL_MAX] if page_url else None,
+            datetime.now()
+        )
+        try:
+            if self.overflow == 'block':
+                self.queue.put(row, timeout=BLOCK_TIMEOUT)
+            else:
+                self.queue.put_nowait(row)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _drain(self, first=None):
+        batch = [] if first is None else [first]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            deadline = time.monotonic() + self.flush_interval
+            batch = []
+            # Collect until the batch is full or the flush interval elapses
+            while len(batch) < self.batch_size and not self._stop.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.extend(self._drain(self.queue.get(timeout=remaining)))
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+
+    # Write whatever is buffered right now, in batch_size chunks
+    def flush(self):
+        while True:
+            batch = self._drain()
+            if not batch:
+                return
+            self._write(batch)
+
+    def _write(self, batch):
+        try:
+            with get_pool().connection() as conn:
+                cur = conn.cursor()
+                with cur.copy('''
+                    COPY clickstream (user_id, event_type, event_data, page_url, timestamp)
+                    FROM STDIN
+                ''') as copy:
+                    for row in batch:
+                        copy.write_row(row)
+                cur.close()
+            self.written += len(batch)
+        except Exception as e:
+            # Never let analytics take the app down; count the loss and move on
+            self.failed += len(batch)
+            print(f"Clickstream flush error ({len(batch)} events lost): {e}")
+
+_writer = None
+_writer_pid = None
+
+# This worker's writer, started on first use
+def get_writer():
+    global _writer, _writer_pid
+    if _writer_pid != os.getpid():
+        _writer = ClickstreamWriter()
+        _writer.start()
+        _writer_pid = os.getpid()
+    return _writer
+
+def enqueue(user_id, event_type, event_data=None, page_url=None):
+    return get_writer().enqueue(user_id, event_type, event_data, page_url)
+
+# Log clickstream event for the current request's session.
+# Buffered; written in bulk by the clickstream writer thread.
+def log_event(event_type, event_data=None):
+    if 'user_id' not in session:
+        return
+
+    enqueue(
+        session['user_id'],
+        event_type,
+        event_data,
+        request.url
+    )
+
+def shutdown():
+    if _writer is not None and _writer_pid == os.getpid():
+        _writer.stop()
+
+# Registered after db's close_pool, so it runs first and can still use the pool
+atexit.register(shutdown)
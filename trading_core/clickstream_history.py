@@ -0,0 +1,249 @@
+import os
+import re
+import sys
+import psycopg
+from psycopg.rows import dict_row
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from .bootstrap import get_connection
+
+load_dotenv()
+
+# Clickstream partitions, retention and daily rollups.
+#
+# clickstream is range partitioned by day on timestamp (rows from before the
+# partitioning live in one clickstream_legacy partition). Raw events are kept
+# for CLICKSTREAM_RETENTION_DAYS; older partitions are dropped whole, which
+# costs a catalog change instead of a DELETE and the VACUUM after it. Events
+# past the newest daily partition land in clickstream_default rather than
+# failing the writer's COPY; they are moved into their day's partition when
+# it is created, with a warning, since it means maintenance fell behind.
+#
+# Before raw events age out they are summarized into two tables for analysis:
+#
+#   clickstream_user_days   one row per user per day: event totals, page views,
+#                           trades, first/last event and counts by event type
+#   clickstream_event_days  one row per event type per day: events and users
+#
+# clickstream_rollups records which days are summarized; a day is final once
+# it has been rolled up after it ended (plus a grace period for buffered
+# events), and a partition is only dropped once all of its days are final.
+# Each day is rolled up in its own transaction, so a backfill (the first run
+# over the legacy partition) never holds one long transaction.
+#
+# The leading tick engine runs maintain() every CLICKSTREAM_ROLLUP_INTERVAL
+# seconds on a thread and connection of its own (run_forever()), so ticks
+# never wait on it; it can also be run by hand or from cron:
+#
+#     python -m trading_core.clickstream_history
+
+RETENTION_DAYS = int(os.environ.get('CLICKSTREAM_RETENTION_DAYS', 30))
+ROLLUP_INTERVAL = float(os.environ.get('CLICKSTREAM_ROLLUP_INTERVAL', 3600))
+
+# Days of partitions to keep ready ahead of the current one
+PARTITIONS_AHEAD = 2
+
+# How long after midnight a day's rollup is considered complete
+FINAL_GRACE = timedelta(minutes=5)
+
+# Arbitrary key for the advisory lock that serializes maintenance runs
+MAINTENANCE_LOCK_ID = 72315004
+
+DEFAULT_PARTITION = 'clickstream_default'
+
+TRADE_EVENTS = ('trade_completed', 'trade_batch_completed')
+
+def partition_name(day):
+    return f"clickstream_p{day:%Y%m%d}"
+
+# Every partition with the end of its range
+def list_partitions(cur):
+    cur.execute('''
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) AS bound
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'clickstream'
+    ''')
+    partitions = []
+    for row in cur.fetchall():
+        match = re.search(r"TO \('([^']+)'\)", row['bound'])
+        if match:
+            partitions.append((row['relname'], datetime.fromisoformat(match.group(1))))
+    return partitions
+
+# Create the partitions from the end of the newest one through
+# PARTITIONS_AHEAD days past today. A day's events already in the default
+# partition move into the new partition before it is attached (attaching
+# fails while the default holds rows in its range). The default is locked
+# against writes first, so no event can land in a day's range between the
+# move and the attach; the writer's COPY waits for the transaction.
+# Returns the number of events moved.
+def create_partitions(cur, now):
+    ends = [end for _, end in list_partitions(cur)]
+    day = max(ends).date() if ends else now.date()
+    last = now.date() + timedelta(days=PARTITIONS_AHEAD)
+    moved = 0
+    if day <= last:
+        cur.execute(f'LOCK TABLE {DEFAULT_PARTITION} IN SHARE ROW EXCLUSIVE MODE')
+    while day <= last:
+        name = partition_name(day)
+        end = day + timedelta(days=1)
+        cur.execute(f'CREATE TABLE {name} (LIKE clickstream INCLUDING DEFAULTS)')
+        cur.execute(f'''
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION}
+                WHERE timestamp >= %s AND timestamp < %s
+                RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+        ''', (day, end))
+        moved += cur.rowcount
+        cur.execute(f"ALTER TABLE clickstream ATTACH PARTITION {name} FOR VALUES FROM ('{day}') TO ('{end}')")
+        day = end
+    return moved
+
+# Summarize [start, end) by day in one pass over the raw events and record
+# which of those days are final. Re-running a day replaces its summaries.
+# maintain() runs it one day at a time.
+ROLLUP_SQL = '''
+    WITH per_type AS (
+        SELECT timestamp::date AS day, user_id, event_type, COUNT(*) AS events,
+               MIN(timestamp) AS first_event_at, MAX(timestamp) AS last_event_at
+        FROM clickstream
+        WHERE timestamp >= %(start)s AND timestamp < %(end)s
+        GROUP BY 1, 2, 3
+    ), user_days AS (
+        INSERT INTO clickstream_user_days
+            (day, user_id, events, page_views, trades, first_event_at, last_event_at, event_counts)
+        SELECT day, user_id, SUM(events),
+               COALESCE(SUM(events) FILTER (WHERE event_type = 'page_view'), 0),
+               COALESCE(SUM(events) FILTER (WHERE event_type = ANY(%(trade_events)s::varchar[])), 0),
+               MIN(first_event_at), MAX(last_event_at),
+               jsonb_object_agg(event_type, events)
+        FROM per_type
+        GROUP BY day, user_id
+        ON CONFLICT (day, user_id) DO UPDATE
+        SET events = EXCLUDED.events, page_views = EXCLUDED.page_views, trades = EXCLUDED.trades,
+            first_event_at = EXCLUDED.first_event_at, last_event_at = EXCLUDED.last_event_at,
+            event_counts = EXCLUDED.event_counts
+    ), event_days AS (
+        INSERT INTO clickstream_event_days (day, event_type, events, users)
+        SELECT day, event_type, SUM(events), COUNT(*)
+        FROM per_type
+        GROUP BY day, event_type
+        ON CONFLICT (day, event_type) DO UPDATE
+        SET events = EXCLUDED.events, users = EXCLUDED.users
+    )
+    INSERT INTO clickstream_rollups (day, final, rolled_up_at)
+    SELECT day::date, day + INTERVAL '1 day' <= %(final_before)s, CURRENT_TIMESTAMP
+    FROM generate_series(%(start)s::date, %(end)s::date - 1, INTERVAL '1 day') AS day
+    ON CONFLICT (day) DO UPDATE
+    SET final = EXCLUDED.final, rolled_up_at = EXCLUDED.rolled_up_at
+'''
+
+# Every day from the first one that isn't final through today
+def pending_days(cur, now):
+    cur.execute('SELECT MAX(day) AS day FROM clickstream_rollups WHERE final')
+    last_final = cur.fetchone()['day']
+    if last_final is not None:
+        start = last_final + timedelta(days=1)
+    else:
+        # First run: summarize everything that is still retained
+        cur.execute('SELECT MIN(timestamp)::date AS day FROM clickstream')
+        start = cur.fetchone()['day'] or now.date()
+    return [start + timedelta(days=i) for i in range((now.date() - start).days + 1)]
+
+def rollup_day(cur, day, now):
+    cur.execute(ROLLUP_SQL, {
+        'start': datetime.combine(day, datetime.min.time()),
+        'end': datetime.combine(day + timedelta(days=1), datetime.min.time()),
+        'final_before': now - FINAL_GRACE,
+        'trade_events': list(TRADE_EVENTS)
+    })
+
+# Drop partitions that ended more than RETENTION_DAYS ago and whose days are
+# all final. Returns the names dropped.
+def drop_expired(cur, now):
+    cutoff = datetime.combine(now.date() - timedelta(days=RETENTION_DAYS), datetime.min.time())
+    cur.execute('SELECT MAX(day) AS day FROM clickstream_rollups WHERE final')
+    last_final = cur.fetchone()['day']
+    if last_final is None:
+        return []
+    rolled_up_to = datetime.combine(last_final + timedelta(days=1), datetime.min.time())
+
+    dropped = []
+    for name, end in list_partitions(cur):
+        if end <= cutoff and end <= rolled_up_to:
+            cur.execute(f'DROP TABLE IF EXISTS {name}')
+            dropped.append(name)
+    return dropped
+
+# Create upcoming partitions, roll up each pending day, then drop what has
+# expired, each step in its own transaction. The session-level lock keeps
+# other runs out throughout. Returns (days rolled up, partitions dropped), or
+# None if another run holds the lock.
+def maintain(conn, now=None):
+    now = now or datetime.now()
+    cur = conn.cursor()
+    with conn.transaction():
+        cur.execute('SELECT pg_try_advisory_lock(%s) AS locked', (MAINTENANCE_LOCK_ID,))
+        locked = cur.fetchone()['locked']
+    if not locked:
+        cur.close()
+        return None
+
+    try:
+        with conn.transaction():
+            moved = create_partitions(cur, now)
+        if moved:
+            print(f"⚠️ Moved {moved} clickstream event(s) out of {DEFAULT_PARTITION}; "
+                  f"partition maintenance had fallen behind")
+        with conn.transaction():
+            days = pending_days(cur, now)
+        for day in days:
+            with conn.transaction():
+                rollup_day(cur, day, now)
+        with conn.transaction():
+            dropped = drop_expired(cur, now)
+    finally:
+        with conn.transaction():
+            cur.execute('SELECT pg_advisory_unlock(%s)', (MAINTENANCE_LOCK_ID,))
+        cur.close()
+    return len(days), dropped
+
+# Run maintain() every ROLLUP_INTERVAL seconds on its own connection until
+# `stop` is set; used by the tick engine
+def run_forever(conninfo, stop, interval=ROLLUP_INTERVAL):
+    while True:
+        try:
+            with psycopg.connect(conninfo, row_factory=dict_row, autocommit=True) as conn:
+                maintain(conn)
+        except Exception as e:
+            print(f"Clickstream maintenance error: {e}")
+        if stop.wait(interval):
+            return
+
+def main():
+    try:
+        conn = get_connection()
+    except Exception as e:
+        print(f"❌ Connection failed: {e}")
+        return 1
+
+    try:
+        result = maintain(conn)
+    finally:
+        conn.close()
+
+    if result is None:
+        print("Another clickstream maintenance run is in progress")
+        return 0
+    days, dropped = result
+    print(f"✅ Rolled up {days} day(s), dropped {len(dropped)} partition(s)")
+    for name in dropped:
+        print(f"   {name}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
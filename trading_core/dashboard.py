@@ -0,0 +1,102 @@
+from datetime import datetime
+from . import accounts, achievements, order_book, valuation
+from .db import get_db_connection
+
+# Everything a dashboard reads about one user, in one round-trip.
+#
+# Cash, positions, recent trades, unlocked achievements and open orders come
+# back from a single statement, each as a JSON (or array) column of the
+# users row. Sections the page doesn't show are switched off by parameter
+# and cost nothing: a sub-select inside a CASE only runs when its branch is
+# taken. Positions are also skipped when this worker already holds the
+# user's valued account (see valuation.PortfolioBook), which is the usual
+# case for anyone who has loaded a page recently.
+#
+# Quotes come from the market snapshot cache and ranks from the in-memory
+# leaderboard, so a dashboard normally costs this one statement.
+
+# Keep the sub-selects in step with accounts.POSITIONS_SQL and
+# TRADE_HISTORY_SQL, achievements.UNLOCKED_SQL and order_book.OPEN_ORDERS_SQL
+DASHBOARD_SQL = '''
+    SELECT u.current_cash,
+           CASE WHEN %(positions)s THEN (
+               SELECT COALESCE(json_agg(p), '[]')
+               FROM (SELECT symbol, shares, avg_price
+                     FROM portfolio
+                     WHERE user_id = u.user_id) AS p
+           ) END AS positions,
+           (
+               SELECT COALESCE(json_agg(t ORDER BY t.timestamp DESC), '[]')
+               FROM (SELECT symbol, action, shares, price, total_cost, timestamp
+                     FROM trades
+                     WHERE user_id = u.user_id
+                     ORDER BY timestamp DESC
+                     LIMIT %(history_limit)s) AS t
+           ) AS trades,
+           CASE WHEN %(achievements)s THEN ARRAY(
+               SELECT achievement_name
+               FROM achievements
+               WHERE user_id = u.user_id
+           ) END AS achievements,
+           CASE WHEN %(orders)s THEN (
+               SELECT COALESCE(json_agg(o ORDER BY o.created_at DESC), '[]')
+               FROM (SELECT order_id, symbol, side, order_type, shares, trigger_price, status, created_at
+                     FROM orders
+                     WHERE user_id = u.user_id AND status IN ('open', 'triggered')) AS o
+           ) END AS orders
+    FROM users u
+    WHERE u.user_id = %(user_id)s
+'''
+
+# `account` is the user's valued account if this worker holds it
+def query_params(user_id, account, history_limit, with_achievements, with_orders):
+    return {
+        'user_id': user_id,
+        'positions': account is None,
+        'history_limit': history_limit,
+        'achievements': with_achievements,
+        'orders': with_orders
+    }
+
+# JSON timestamps come back as ISO strings
+def _parse_times(rows, field):
+    for row in rows:
+        row[field] = datetime.fromisoformat(row[field])
+    return rows
+
+# The dashboard's data from a DASHBOARD_SQL row, or None without a users row.
+# `token` is valuation.book.token() from before the query.
+# {'account': valuation.value_account() form, 'history': accounts.format_trade()
+# rows, 'achievements': achievements.catalog() or None, 'orders':
+# order_book.format_order() rows or None}
+def build(user_id, row, snapshot, account, token):
+    if row is None:
+        return None
+
+    if account is None:
+        account = valuation.book.add(user_id, float(row['current_cash']), row['positions'], snapshot, token)
+
+    unlocked = None
+    if row['achievements'] is not None:
+        unlocked = achievements.catalog(set(row['achievements']) | achievements.get_writer().pending(user_id))
+
+    orders = None
+    if row['orders'] is not None:
+        orders = [order_book.format_order(order) for order in _parse_times(row['orders'], 'created_at')]
+
+    return {
+        'account': valuation.describe(account, snapshot),
+        'history': [accounts.format_trade(trade) for trade in _parse_times(row['trades'], 'timestamp')],
+        'achievements': unlocked,
+        'orders': orders
+    }
+
+def load_dashboard(user_id, snapshot, history_limit, with_achievements=False, with_orders=False):
+    account = valuation.book.cached(user_id, snapshot)
+    token = valuation.book.token()
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(DASHBOARD_SQL, query_params(user_id, account, history_limit, with_achievements, with_orders))
+    row = cur.fetchone()
+    cur.close()
+    return build(user_id, row, snapshot, account, token)
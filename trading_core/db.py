@@ -0,0 +1,121 @@
+import os
+import time
+import atexit
+import contextvars
+from flask import g
+from psycopg import AsyncCursor, Cursor
+from psycopg.rows import dict_row
+from psycopg_pool import ConnectionPool
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Pool sizing (per worker process)
+POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 1))
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 5))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+POOL_MAX_IDLE = float(os.environ.get('DB_POOL_MAX_IDLE', 300))
+POOL_MAX_LIFETIME = float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800))
+
+# Statements executed, connections checked out and seconds spent executing
+# by whatever the current context is measuring (a benchmark session, a
+# request); see track_queries(). A context variable rather than a thread
+# local, so an async request's concurrent reads all count towards it.
+class QueryStats:
+    def __init__(self):
+        self.queries = 0
+        self.connections = 0
+        self.db_time = 0.0
+
+_query_stats = contextvars.ContextVar('query_stats', default=None)
+
+# Start counting for the current context; returns the counters
+def track_queries():
+    stats = QueryStats()
+    _query_stats.set(stats)
+    return stats
+
+# The current context's counters, started if needed. Callers measuring a
+# span take the difference, so an outer measurement keeps counting.
+def query_stats():
+    return _query_stats.get() or track_queries()
+
+def count_connection():
+    stats = _query_stats.get()
+    if stats is not None:
+        stats.connections += 1
+
+class CountingCursor(Cursor):
+    def execute(self, query, params=None, **kwargs):
+        stats = _query_stats.get()
+        if stats is None:
+            return super().execute(query, params, **kwargs)
+        stats.queries += 1
+        start = time.perf_counter()
+        try:
+            return super().execute(query, params, **kwargs)
+        finally:
+            stats.db_time += time.perf_counter() - start
+
+class AsyncCountingCursor(AsyncCursor):
+    async def execute(self, query, params=None, **kwargs):
+        stats = _query_stats.get()
+        if stats is None:
+            return await super().execute(query, params, **kwargs)
+        stats.queries += 1
+        start = time.perf_counter()
+        try:
+            return await super().execute(query, params, **kwargs)
+        finally:
+            stats.db_time += time.perf_counter() - start
+
+_pool = None
+_pool_pid = None
+
+# Shared connection pool, created lazily once per worker process.
+# Gunicorn forks workers after importing the app, so the pid check makes
+# sure a child never reuses sockets inherited from its parent.
+def get_pool():
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = ConnectionPool(
+            os.environ.get('DATABASE_URL'),
+            min_size=POOL_MIN_SIZE,
+            max_size=POOL_MAX_SIZE,
+            timeout=POOL_TIMEOUT,
+            max_idle=POOL_MAX_IDLE,
+            max_lifetime=POOL_MAX_LIFETIME,
+            kwargs={'row_factory': dict_row, 'cursor_factory': CountingCursor},
+            check=ConnectionPool.check_connection,
+            name='trading',
+            open=True
+        )
+        _pool_pid = os.getpid()
+    return _pool
+
+def close_pool():
+    global _pool, _pool_pid
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.close()
+    _pool = None
+    _pool_pid = None
+
+atexit.register(close_pool)
+
+# Request-scoped connection: the first helper to ask for a connection checks
+# one out of the pool and every later helper in the same request reuses it.
+# Callers must not close it; it goes back to the pool on app context teardown.
+def get_db_connection():
+    if 'db_conn' not in g:
+        g.db_conn = get_pool().getconn()
+        count_connection()
+    return g.db_conn
+
+def release_db_connection(exc=None):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        # The pool rolls back anything left uncommitted before reusing it
+        get_pool().putconn(conn)
+
+def init_app(app):
+    app.teardown_appcontext(release_db_connection)
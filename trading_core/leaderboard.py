@@ -0,0 +1,499 @@
+import os
+import random
+import threading
+import time
+from datetime import timedelta
+from dotenv import load_dotenv
+from . import achievements, market_cache
+from .db import get_pool
+from .valuation import ACCOUNT_CHANNEL
+
+load_dotenv()
+
+# Live leaderboard.
+#
+# Each worker keeps every user's cash, share counts and marked-to-market value
+# in memory, ranked by all-time return in an indexable skip list, so the top N
+# is a walk from the head and any user's rank is O(log n). Ticks re-rank only
+# the holders of symbols that moved; a trade (ACCOUNT_CHANNEL notification)
+# reloads just that account. Every LEADERBOARD_REBUILD_INTERVAL seconds the
+# board loads only the users created since, since nothing notifies about
+# them. The whole board is reloaded at start and after the listener
+# reconnects, when notifications may have been missed; without a listener
+# (MARKET_CACHE_LISTEN=0) there are none, so it is reloaded every interval.
+#
+# The tick achievement rules (portfolio value, rank, weekly P&L) are checked
+# here, where each trader's value is already known: after every tick for the
+# traders that moved plus the top ACHIEVEMENT_TOP_N, and for everyone on a
+# rebuild. The rules and the weekly roll-over update the in-memory traders
+# under the lock, which readers also take; only queueing the resulting writes
+# for the achievement writer happens after it is released.
+#
+# One worker at a time writes the top LEADERBOARD_SNAPSHOT_SIZE to
+# leaderboard_snapshots every LEADERBOARD_SNAPSHOT_INTERVAL seconds.
+
+REBUILD_INTERVAL = float(os.environ.get('LEADERBOARD_REBUILD_INTERVAL', 300))
+SNAPSHOT_INTERVAL = float(os.environ.get('LEADERBOARD_SNAPSHOT_INTERVAL', 300))
+SNAPSHOT_SIZE = int(os.environ.get('LEADERBOARD_SNAPSHOT_SIZE', 100))
+ACHIEVEMENT_TOP_N = 100
+
+# New users are picked up by id; ids are assigned at insert but become
+# visible at commit, so look back this far to catch late commits
+USER_ID_LOOKBACK = 1000
+
+# Arbitrary key for the advisory lock that elects the snapshot writer
+SNAPSHOT_LOCK_ID = 72315003
+
+BADGES = {1: '🏆', 2: '🥈', 3: '🥉'}
+
+class _Node:
+    __slots__ = ('key', 'forward', 'span')
+
+    def __init__(self, key, level):
+        self.key = key
+        self.forward = [None] * level
+        self.span = [0] * level
+
+# Skip list that also counts how many nodes each link skips, so ranks can be
+# found on the way down (same layout as Redis sorted sets). Keys must be
+# unique and comparable.
+class RankedSkipList:
+    MAX_LEVEL = 32
+
+    def __init__(self):
+        self._head = _Node(None, self.MAX_LEVEL)
+        self._level = 1
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _random_level(self):
+        level = 1
+        while level < self.MAX_LEVEL and random.random() < 0.25:
+            level += 1
+        return level
+
+    def insert(self, key):
+        update = [None] * self.MAX_LEVEL
+        rank = [0] * self.MAX_LEVEL
+        node = self._head
+        for i in range(self._level - 1, -1, -1):
+            rank[i] = 0 if i == self._level - 1 else rank[i + 1]
+            while node.forward[i] is not None and node.forward[i].key < key:
+                rank[i] += node.span[i]
+                node = node.forward[i]
+            update[i] = node
+
+        level = self._random_level()
+        if level > self._level:
+            for i in range(self._level, level):
+                rank[i] = 0
+                update[i] = self._head
+                update[i].span[i] = self.size
+            self._level = level
+
+        new = _Node(key, level)
+        for i in range(level):
+            new.forward[i] = update[i].forward[i]
+            update[i].forward[i] = new
+            new.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = (rank[0] - rank[i]) + 1
+        for i in range(level, self._level):
+            update[i].span[i] += 1
+        self.size += 1
+
+    def remove(self, key):
+        update = [None] * self.MAX_LEVEL
+        node = self._head
+        for i in range(self._level - 1, -1, -1):
+            while node.forward[i] is not None and node.forward[i].key < key:
+                node = node.forward[i]
+            update[i] = node
+
+        node = node.forward[0]
+        if node is None or node.key != key:
+            return False
+
+        for i in range(self._level):
+            if update[i].forward[i] is node:
+                update[i].span[i] += node.span[i] - 1
+                update[i].forward[i] = node.forward[i]
+            else:
+                update[i].span[i] -= 1
+        while self._level > 1 and self._head.forward[self._level - 1] is None:
+            self._level -= 1
+        self.size -= 1
+        return True
+
+    # 1-based position of key, or None if absent
+    def rank(self, key):
+        rank = 0
+        node = self._head
+        for i in range(self._level - 1, -1, -1):
+            while node.forward[i] is not None and node.forward[i].key <= key:
+                rank += node.span[i]
+                node = node.forward[i]
+            if node.key == key:
+                return rank
+        return None
+
+    # The first n keys in order
+    def head(self, n):
+        keys = []
+        node = self._head.forward[0]
+        while node is not None and len(keys) < n:
+            keys.append(node.key)
+            node = node.forward[0]
+        return keys
+
+class TraderState:
+    __slots__ = ('user_id', 'platform_type', 'initial_cash', 'cash', 'shares', 'market_value',
+                 'key', 'trade_count', 'streak_days', 'unlocked', 'week_start', 'week_start_value')
+
+    def __init__(self, row):
+        self.user_id = row['user_id']
+        self.platform_type = row['platform_type']
+        self.initial_cash = float(row['initial_cash'] or 0)
+        self.cash = float(row['current_cash'] or 0)
+        # symbol -> shares
+        self.shares = dict(zip(row['symbols'], row['shares']))
+        self.market_value = 0.0
+        self.key = None
+        self.trade_count = row['trade_count']
+        self.streak_days = row['streak_days']
+        self.unlocked = row['unlocked']
+        self.week_start = row['week_start']
+        self.week_start_value = float(row['week_start_value']) if row['week_start_value'] is not None else None
+
+    @property
+    def total_value(self):
+        return self.cash + self.market_value
+
+    @property
+    def return_percent(self):
+        if self.initial_cash <= 0:
+            return 0.0
+        return (self.total_value - self.initial_cash) / self.initial_cash * 100
+
+# Every user (or the given users) after user_id %(after)s, with their share
+# counts and achievement counters; a streak whose last trade was before
+# yesterday has lapsed
+LOAD_TRADERS_SQL = '''
+    SELECT u.user_id, u.platform_type, u.initial_cash, u.current_cash,
+           COALESCE(array_agg(p.symbol) FILTER (WHERE p.symbol IS NOT NULL), '{}') AS symbols,
+           COALESCE(array_agg(p.shares) FILTER (WHERE p.symbol IS NOT NULL), '{}') AS shares,
+           COALESCE(s.trade_count, 0) AS trade_count,
+           CASE WHEN s.last_trade_date >= CURRENT_DATE - 1 THEN s.streak_days ELSE 0 END AS streak_days,
+           COALESCE(s.unlocked, 0) AS unlocked, s.week_start, s.week_start_value
+    FROM users u
+    LEFT JOIN portfolio p ON p.user_id = u.user_id
+    LEFT JOIN user_stats s ON s.user_id = u.user_id
+    WHERE (%(user_ids)s::integer[] IS NULL OR u.user_id = ANY(%(user_ids)s::integer[]))
+      AND u.user_id > %(after)s
+    GROUP BY u.user_id, s.user_id
+'''
+
+class Leaderboard:
+    def __init__(self):
+        self.ranking = RankedSkipList()
+        self.loaded = False
+        self._traders = {}
+        self._holders = {}
+        self._prices = {}
+        self._version = None
+        self._last_user_id = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._tick_pending = False
+        self._pending_users = set()
+        self._pending_lock = threading.Lock()
+
+    # Listener callbacks; the work happens on the leaderboard thread
+    def on_tick(self, version):
+        self._tick_pending = True
+        self._wake.set()
+
+    # A None payload means the listener reconnected and may have missed
+    # notifications, which forces a rebuild
+    def on_account(self, payload):
+        with self._pending_lock:
+            self._pending_users.add(int(payload) if payload is not None else None)
+        self._wake.set()
+
+    def _value(self, trader):
+        trader.market_value = sum(shares * self._prices.get(symbol, 0.0)
+                                  for symbol, shares in trader.shares.items())
+
+    # Re-rank one trader after its value changed
+    def _rekey(self, trader):
+        if trader.key is not None:
+            self.ranking.remove(trader.key)
+        trader.key = (-round(trader.return_percent, 6), trader.user_id)
+        self.ranking.insert(trader.key)
+
+    def _put(self, trader):
+        self._drop(trader.user_id)
+        self._last_user_id = max(self._last_user_id, trader.user_id)
+        self._traders[trader.user_id] = trader
+        for symbol in trader.shares:
+            self._holders.setdefault(symbol, set()).add(trader.user_id)
+        self._value(trader)
+        self._rekey(trader)
+
+    def _drop(self, user_id):
+        trader = self._traders.pop(user_id, None)
+        if trader is None:
+            return
+        for symbol in trader.shares:
+            holders = self._holders.get(symbol)
+            if holders is not None:
+                holders.discard(user_id)
+        if trader.key is not None:
+            self.ranking.remove(trader.key)
+
+    # Move prices to the snapshot, touching only holders of symbols that moved.
+    # Returns the user_ids that were re-ranked.
+    def _apply_snapshot(self, snapshot):
+        if snapshot.version == self._version:
+            return set()
+        touched = set()
+        for quote in snapshot.quotes:
+            symbol = quote['symbol']
+            old = self._prices.get(symbol, 0.0)
+            new = quote['price']
+            if old == new:
+                continue
+            self._prices[symbol] = new
+            for user_id in self._holders.get(symbol, ()):
+                trader = self._traders[user_id]
+                trader.market_value += trader.shares[symbol] * (new - old)
+                touched.add(user_id)
+        for user_id in touched:
+            self._rekey(self._traders[user_id])
+        self._version = snapshot.version
+        return touched
+
+    # Run the tick achievement rules for gamified traders, given as
+    # (trader, rank) pairs. A trader's first tick in a new week sets that
+    # week's starting value; if the week that just ended directly preceded
+    # it, its P&L is checked for Green Week. Updates the traders, so it runs
+    # under self._lock (or on a board no other thread can see yet); returns
+    # the writes for _record_achievements to queue once the lock is released.
+    def _check_achievements(self, ranked):
+        current_week = achievements.week_start()
+        weeks = []
+        unlocks = []
+        for trader, rank in ranked:
+            if trader.platform_type != 'gamified':
+                continue
+            metrics = {
+                'total_value': trader.total_value,
+                'rank': rank,
+                'trade_count': trader.trade_count
+            }
+            if trader.week_start != current_week:
+                if (trader.week_start_value is not None
+                        and trader.week_start == current_week - timedelta(days=7)):
+                    metrics['closed_week_pnl'] = trader.total_value - trader.week_start_value
+                trader.week_start = current_week
+                trader.week_start_value = trader.total_value
+                weeks.append((trader.user_id, current_week, round(trader.total_value, 2)))
+            names = achievements.evaluate('tick', metrics, trader.unlocked)
+            if names:
+                for name in names:
+                    trader.unlocked |= achievements.BITS[name]
+                unlocks.append((trader.user_id, names))
+        return weeks, unlocks
+
+    # Hand what _check_achievements found to the achievement writer
+    def _record_achievements(self, writes):
+        weeks, unlocks = writes
+        writer = achievements.get_writer()
+        for user_id, start, value in weeks:
+            writer.set_week(user_id, start, value)
+        for user_id, names in unlocks:
+            achievements.on_tick(user_id, names)
+
+    # Under self._lock: (trader, rank) for the traders that moved plus the top
+    # of the board, whose ranks may have changed without their value changing
+    def _achievement_candidates(self, user_ids):
+        user_ids = set(user_ids)
+        user_ids.update(key[1] for key in self.ranking.head(ACHIEVEMENT_TOP_N))
+        traders = [self._traders[user_id] for user_id in user_ids if user_id in self._traders]
+        return [(trader, self.ranking.rank(trader.key)) for trader in traders]
+
+    def _load(self, conn, user_ids=None, after=0):
+        cur = conn.cursor()
+        cur.execute(LOAD_TRADERS_SQL, {'user_ids': user_ids, 'after': after})
+        rows = cur.fetchall()
+        cur.close()
+        return rows
+
+    # Replace the whole board from the database. The new board is built off
+    # to the side so readers are only blocked for the swap.
+    def rebuild(self, conn):
+        snapshot = market_cache.cache.get_snapshot(conn)
+        rows = self._load(conn)
+        fresh = Leaderboard()
+        fresh._prices = {quote['symbol']: quote['price'] for quote in snapshot.quotes}
+        fresh._version = snapshot.version
+        for row in rows:
+            fresh._put(TraderState(row))
+        # The new board is still private, so rank and check everyone from it
+        # in one walk without the lock
+        ranked = [(fresh._traders[key[1]], rank)
+                  for rank, key in enumerate(fresh.ranking.head(fresh.ranking.size), start=1)]
+        writes = fresh._check_achievements(ranked)
+        with self._lock:
+            self.ranking = fresh.ranking
+            self._traders = fresh._traders
+            self._holders = fresh._holders
+            self._prices = fresh._prices
+            self._version = fresh._version
+            self._last_user_id = fresh._last_user_id
+            self.loaded = True
+        self._record_achievements(writes)
+
+    # Reload the given users after trades
+    def refresh(self, conn, user_ids):
+        rows = self._load(conn, sorted(user_ids))
+        with self._lock:
+            refreshed = []
+            for row in rows:
+                trader = TraderState(row)
+                self._put(trader)
+                refreshed.append(trader.user_id)
+            writes = self._check_achievements(self._achievement_candidates(refreshed))
+        self._record_achievements(writes)
+
+    # Add the users created since the last load. Users already on the board
+    # are kept current by notifications, so they are left alone.
+    def load_new(self, conn):
+        rows = self._load(conn, after=max(self._last_user_id - USER_ID_LOOKBACK, 0))
+        with self._lock:
+            added = []
+            for row in rows:
+                if row['user_id'] not in self._traders:
+                    self._put(TraderState(row))
+                    added.append(row['user_id'])
+            if not added:
+                return
+            writes = self._check_achievements(self._achievement_candidates(added))
+        self._record_achievements(writes)
+
+    def tick(self, conn):
+        snapshot = market_cache.cache.get_snapshot(conn)
+        with self._lock:
+            touched = self._apply_snapshot(snapshot)
+            if not touched:
+                return
+            writes = self._check_achievements(self._achievement_candidates(touched))
+        self._record_achievements(writes)
+
+    # Write the current top of the board, at most once per interval across
+    # all workers
+    def write_snapshot(self, conn):
+        with self._lock:
+            top = [self._traders[key[1]] for key in self.ranking.head(SNAPSHOT_SIZE)]
+            rows = [(rank, trader.user_id, trader.total_value, trader.return_percent)
+                    for rank, trader in enumerate(top, start=1)]
+        if not rows:
+            return
+        with conn.transaction():
+            cur = conn.cursor()
+            cur.execute('SELECT pg_try_advisory_xact_lock(%s) AS locked', (SNAPSHOT_LOCK_ID,))
+            if cur.fetchone()['locked']:
+                cur.execute('''
+                    INSERT INTO leaderboard_snapshots (taken_at, rank, user_id, total_value, return_percent)
+                    SELECT CURRENT_TIMESTAMP, r.rank, r.user_id, r.total_value, r.return_percent
+                    FROM unnest(%s::integer[], %s::integer[], %s::numeric[], %s::numeric[])
+                        AS r(rank, user_id, total_value, return_percent)
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM leaderboard_snapshots
+                        WHERE taken_at > CURRENT_TIMESTAMP - make_interval(secs => %s)
+                    )
+                ''', ([r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows],
+                      [r[3] for r in rows], SNAPSHOT_INTERVAL * 0.9))
+            cur.close()
+
+    # Starts with a full load, retried every cache TTL until it succeeds
+    def run_forever(self):
+        rebuilt_at = None
+        scanned_at = None
+        snapshot_at = time.monotonic()
+        self._wake.set()
+        while True:
+            self._wake.wait(market_cache.CACHE_TTL)
+            self._wake.clear()
+            try:
+                with get_pool().connection() as conn:
+                    now = time.monotonic()
+                    with self._pending_lock:
+                        pending, self._pending_users = self._pending_users, set()
+                    if (rebuilt_at is None or None in pending
+                            or (not market_cache.CACHE_LISTEN and now - rebuilt_at >= REBUILD_INTERVAL)):
+                        self.rebuild(conn)
+                        rebuilt_at = scanned_at = now
+                        self._tick_pending = False
+                    else:
+                        if now - scanned_at >= REBUILD_INTERVAL:
+                            self.load_new(conn)
+                            scanned_at = now
+                        if pending:
+                            self.refresh(conn, pending)
+                        # Without a listener there are no tick callbacks;
+                        # the cache TTL decides when prices are re-read
+                        if self._tick_pending or not market_cache.CACHE_LISTEN:
+                            self._tick_pending = False
+                            self.tick(conn)
+                    if now - snapshot_at >= SNAPSHOT_INTERVAL:
+                        self.write_snapshot(conn)
+                        snapshot_at = now
+            except Exception as e:
+                print(f"Leaderboard error: {e}")
+
+    # Rank, board size and trading streak for a user. A user the board hasn't
+    # loaded yet (a brand new user, or any user before the first load
+    # finishes) has no rank; the board thread is asked to load it, so it
+    # shows on a later request. Page requests never wait on the database.
+    def rank_of(self, user_id):
+        with self._lock:
+            trader = self._traders.get(user_id)
+            if trader is not None:
+                return self.ranking.rank(trader.key), self.ranking.size, trader.streak_days
+            size = self.ranking.size
+        if self.loaded:
+            self.on_account(user_id)
+        return None, size, 0
+
+    def top(self, n=10):
+        with self._lock:
+            traders = [self._traders[key[1]] for key in self.ranking.head(n)]
+            return [{
+                'rank': rank,
+                'user_id': trader.user_id,
+                'name': f"Trader_{trader.user_id}",
+                'returns': round(trader.return_percent, 2),
+                'total_value': trader.total_value,
+                'streak': trader.streak_days,
+                'badge': BADGES.get(rank, '⭐')
+            } for rank, trader in enumerate(traders, start=1)]
+
+board = Leaderboard()
+
+market_cache.cache.subscribe(board.on_tick)
+market_cache.cache.subscribe(board.on_account, channel=ACCOUNT_CHANNEL)
+
+_board_pid = None
+
+# Start the board's thread, once per worker. The full load happens on that
+# thread; until it finishes, rank_of() has no rank for anyone and top() is
+# empty.
+def ensure_started():
+    global _board_pid
+    if _board_pid == os.getpid():
+        return board
+    _board_pid = os.getpid()
+    threading.Thread(target=board.run_forever, name='leaderboard', daemon=True).start()
+    return board
@@ -0,0 +1,163 @@
+import os
+import time
+import threading
+import psycopg
+from dotenv import load_dotenv
+from .db import get_db_connection
+from .market_engine import TICK_CHANNEL, TICK_INTERVAL
+
+load_dotenv()
+
+# Per-worker cache of the current market snapshot.
+#
+# Quotes are read from stock_prices once per tick version and then served from
+# memory. A snapshot older than MARKET_CACHE_TTL is revalidated with a cheap
+# version check, and the tick engine's NOTIFY drops it as soon as a new tick
+# commits, so readers normally see new prices without waiting for the TTL.
+
+CACHE_TTL = float(os.environ.get('MARKET_CACHE_TTL', TICK_INTERVAL))
+CACHE_LISTEN = os.environ.get('MARKET_CACHE_LISTEN', '1') == '1'
+
+class MarketSnapshot:
+    def __init__(self, version, rows):
+        self.version = version
+        self.fetched_at = time.monotonic()
+        self.quotes = []
+        for row in rows:
+            current = float(row['current_price'])
+            base = float(row['base_price'])
+            change = current - base
+            self.quotes.append({
+                'symbol': row['symbol'],
+                'name': row['company_name'],
+                'price': current,
+                'base_price': base,
+                'change': change,
+                'percent': (change / base * 100) if base > 0 else 0,
+                'volatility': row['volatility']
+            })
+        self.by_symbol = {quote['symbol']: quote for quote in self.quotes}
+        self._views = {}
+        self._lock = threading.Lock()
+
+    # Per-app presentation of the quotes, built once per snapshot.
+    # Callers must treat the returned rows as read-only.
+    def view(self, name, format_quote):
+        rows = self._views.get(name)
+        if rows is None:
+            with self._lock:
+                rows = self._views.get(name)
+                if rows is None:
+                    rows = [format_quote(quote) for quote in self.quotes]
+                    self._views[name] = rows
+        return rows
+
+class MarketSnapshotCache:
+    def __init__(self, ttl=CACHE_TTL):
+        self.ttl = ttl
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._subscribers = {TICK_CHANNEL: []}
+
+    def invalidate(self):
+        self._snapshot = None
+
+    # Call fn(payload) from the listener thread for every notification on
+    # `channel` (by default, the tick version of every tick), and fn(None)
+    # whenever the listener (re)connects and may have missed some. Subscribe
+    # before the listener starts; callbacks must return quickly.
+    def subscribe(self, fn, channel=TICK_CHANNEL):
+        self._subscribers.setdefault(channel, []).append(fn)
+
+    # The snapshot if it is within its TTL, else None; never touches the database
+    def fresh(self):
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - snapshot.fetched_at < self.ttl:
+            return snapshot
+        return None
+
+    # Defaults to the request's connection; background threads pass their own
+    def get_snapshot(self, conn=None):
+        snapshot = self.fresh()
+        if snapshot is not None:
+            return snapshot
+
+        # Single flight: one thread refreshes while the others wait for it
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and time.monotonic() - snapshot.fetched_at < self.ttl:
+                return snapshot
+
+            conn = conn or get_db_connection()
+            cur = conn.cursor()
+            if snapshot is not None:
+                cur.execute('SELECT tick_version FROM market_clock WHERE id = 1')
+                clock = cur.fetchone()
+                if clock and clock['tick_version'] == snapshot.version:
+                    # Nothing ticked; keep the snapshot and restart its TTL
+                    cur.close()
+                    snapshot.fetched_at = time.monotonic()
+                    return snapshot
+
+            cur.execute('''
+                SELECT s.symbol, s.company_name, s.current_price, s.base_price, s.volatility,
+                       c.tick_version
+                FROM stock_prices s
+                CROSS JOIN market_clock c
+                ORDER BY s.symbol
+            ''')
+            rows = cur.fetchall()
+            cur.close()
+
+            version = rows[0]['tick_version'] if rows else None
+            snapshot = MarketSnapshot(version, rows)
+            self._snapshot = snapshot
+            return snapshot
+
+    # Drop the snapshot whenever the tick engine publishes a new version, and
+    # pass every notification on to the subscribers
+    def listen_forever(self, conninfo=None):
+        conninfo = conninfo or os.environ.get('DATABASE_URL')
+        while True:
+            try:
+                with psycopg.connect(conninfo, autocommit=True) as conn:
+                    for channel in self._subscribers:
+                        conn.execute(f'LISTEN {channel}')
+                    # Anything may have ticked while we were disconnected
+                    self.invalidate()
+                    for fns in self._subscribers.values():
+                        for fn in fns:
+                            fn(None)
+                    for notify in conn.notifies():
+                        if notify.channel == TICK_CHANNEL:
+                            snapshot = self._snapshot
+                            if snapshot is None or str(snapshot.version) != notify.payload:
+                                self.invalidate()
+                        for fn in self._subscribers.get(notify.channel, ()):
+                            fn(notify.payload)
+            except Exception as e:
+                print(f"Market cache listener error: {e}")
+            time.sleep(1)
+
+cache = MarketSnapshotCache()
+
+_listener_pid = None
+
+def ensure_listener_started():
+    global _listener_pid
+    if _listener_pid == os.getpid():
+        return
+    _listener_pid = os.getpid()
+    threading.Thread(target=cache.listen_forever, name='market-cache-listener', daemon=True).start()
+
+def get_snapshot():
+    return cache.get_snapshot()
+
+def init_app(app):
+    if not CACHE_LISTEN:
+        return
+
+    # Like the tick engine, started from the first request in each worker
+    @app.before_request
+    def start_market_cache_listener():
+        ensure_listener_started()
@@ -0,0 +1,193 @@
+import os
+import sys
+import time
+import threading
+import psycopg
+from psycopg.rows import dict_row
+from dotenv import load_dotenv
+from .market_sim import MarketSimulator
+from . import clickstream_history, tick_history
+
+load_dotenv()
+
+# Market tick engine.
+#
+# Prices advance on a fixed cadence, independent of traffic; request handlers
+# only read stock_prices. Every web worker may start an engine thread, but only
+# the one holding the advisory lock actually ticks, so the tick rate does not
+# multiply with the number of workers. The leader also starts the periodic
+# clickstream partition and rollup maintenance on a thread of its own. It can
+# also run as its own process:
+#
+#     python -m trading_core.market_engine
+
+TICK_INTERVAL = float(os.environ.get('MARKET_TICK_INTERVAL', 5))
+SYMBOL_REFRESH_INTERVAL = float(os.environ.get('MARKET_SYMBOL_REFRESH_INTERVAL', 60))
+ENGINE_IN_PROCESS = os.environ.get('MARKET_ENGINE_IN_PROCESS', '1') == '1'
+
+# Arbitrary key for the session-level advisory lock that elects the ticker
+TICK_LOCK_ID = 72315002
+
+# Channel that tells every worker a new tick has been committed
+TICK_CHANNEL = 'market_tick'
+
+def load_stocks(cur):
+    cur.execute('SELECT symbol, base_price, current_price, volatility FROM stock_prices ORDER BY symbol')
+    return cur.fetchall()
+
+# Write all new prices, bump the tick version and publish it, in one statement.
+# NOTIFY is only delivered once the surrounding transaction commits.
+# Returns the market_clock row (tick_version, ticked_at).
+def write_prices(cur, symbols, prices):
+    cur.execute('''
+        WITH moved AS (
+            UPDATE stock_prices AS s
+            SET current_price = t.price, last_updated = CURRENT_TIMESTAMP
+            FROM unnest(%s::varchar[], %s::numeric[]) AS t(symbol, price)
+            WHERE s.symbol = t.symbol
+            RETURNING s.symbol
+        ), clock AS (
+            UPDATE market_clock
+            SET tick_version = tick_version + 1, ticked_at = CURRENT_TIMESTAMP
+            WHERE id = 1
+            RETURNING tick_version, ticked_at
+        )
+        SELECT tick_version, ticked_at, pg_notify(%s, tick_version::text)
+        FROM clock
+    ''', (symbols, prices, TICK_CHANNEL))
+    return cur.fetchone()
+
+class MarketTickEngine:
+    def __init__(self, interval=TICK_INTERVAL, conninfo=None, simulator=None):
+        self.interval = interval
+        self.conninfo = conninfo or os.environ.get('DATABASE_URL')
+        self.simulator = simulator or MarketSimulator()
+        # Imported here because order execution depends on the market cache,
+        # which imports this module's settings
+        from .order_book import OrderMatcher
+        self.matcher = OrderMatcher()
+        self.ticks = 0
+        self.version = None
+        self._stocks = None
+        self._stocks_loaded_at = 0.0
+        self._partition_day = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._maintenance = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, name='market-tick-engine', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    # Advance every symbol once. The engine's own connection is used so ticks
+    # never compete with request handlers for pooled connections.
+    def tick(self, conn):
+        now = time.monotonic()
+        with conn.transaction():
+            cur = conn.cursor()
+            if self._stocks is None or now - self._stocks_loaded_at >= SYMBOL_REFRESH_INTERVAL:
+                self._stocks = load_stocks(cur)
+                self._stocks_loaded_at = now
+                self.simulator.load(self._stocks)
+            symbols = self.simulator.symbols
+            prices = self.simulator.step().tolist()
+            clock = write_prices(cur, symbols, prices)
+            self.version = clock['tick_version']
+            if tick_history.TICK_HISTORY:
+                if self._partition_day != clock['ticked_at'].date():
+                    tick_history.maintain_partitions(cur, clock['ticked_at'])
+                    self._partition_day = clock['ticked_at'].date()
+                tick_history.record_ticks(cur, self.version, symbols, prices, clock['ticked_at'])
+            cur.close()
+        self.ticks += 1
+
+        # Resting orders fill against the prices that were just published
+        try:
+            self.matcher.run(symbols, prices)
+        except Exception as e:
+            print(f"Order matching error: {e}")
+        return self.version
+
+    # Clickstream maintenance on its own thread and connection, so a long
+    # rollup never delays a tick. Started by the first leader in this process
+    # and kept running after; its own advisory lock keeps runs from overlapping.
+    def _start_maintenance(self):
+        if self._maintenance is not None and self._maintenance.is_alive():
+            return
+        self._maintenance = threading.Thread(target=clickstream_history.run_forever,
+                                             args=(self.conninfo, self._stop),
+                                             name='clickstream-maintenance', daemon=True)
+        self._maintenance.start()
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                with psycopg.connect(self.conninfo, row_factory=dict_row, autocommit=True) as conn:
+                    self._lead(conn)
+            except Exception as e:
+                print(f"Market engine error: {e}")
+            # Not the leader, or the connection dropped; try again later
+            self._stop.wait(self.interval)
+
+    def _lead(self, conn):
+        cur = conn.cursor()
+        cur.execute('SELECT pg_try_advisory_lock(%s) AS locked', (TICK_LOCK_ID,))
+        locked = cur.fetchone()['locked']
+        cur.close()
+        if not locked:
+            return
+
+        print(f"Market engine leading in pid {os.getpid()}, ticking every {self.interval}s")
+        # Universe and order book may have changed while another engine was leading
+        self._stocks = None
+        self.matcher.reset()
+        self._start_maintenance()
+        next_run = time.monotonic()
+        while not self._stop.is_set():
+            self.tick(conn)
+            # Fixed cadence: schedule from the previous deadline, not from now
+            next_run += self.interval
+            delay = next_run - time.monotonic()
+            if delay < 0:
+                next_run = time.monotonic()
+                delay = 0
+            self._stop.wait(delay)
+
+_engine = None
+_engine_pid = None
+
+# Start this worker's engine thread, once per process
+def ensure_engine_started():
+    global _engine, _engine_pid
+    if _engine_pid == os.getpid():
+        return _engine
+    _engine = MarketTickEngine()
+    _engine.start()
+    _engine_pid = os.getpid()
+    return _engine
+
+def init_app(app):
+    if not ENGINE_IN_PROCESS:
+        return
+
+    # Started lazily from the first request so that forked workers each get
+    # their own thread instead of inheriting a dead one from the master
+    @app.before_request
+    def start_market_engine():
+        ensure_engine_started()
+
+if __name__ == '__main__':
+    engine = MarketTickEngine()
+    try:
+        engine.run_forever()
+    except KeyboardInterrupt:
+        sys.exit(0)
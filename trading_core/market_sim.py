@@ -0,0 +1,93 @@
+import os
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Vectorized market simulator.
+#
+# All symbol state lives in NumPy arrays and one call to step() advances every
+# symbol at once, so a tick costs about the same for 20 symbols as for 10k.
+# Prices evolve from their current value rather than being redrawn around
+# base_price each tick, so they can trend. The price model is pluggable (see
+# MODELS) and the generator can be seeded to replay the same market.
+
+SIM_MODEL = os.environ.get('MARKET_SIM_MODEL', 'ou')
+SIM_SEED = int(os.environ['MARKET_SIM_SEED']) if os.environ.get('MARKET_SIM_SEED') else None
+
+# Drift per tick for GBM and jump-diffusion (0 = no trend on average)
+SIM_DRIFT = float(os.environ.get('MARKET_SIM_DRIFT', 0.0))
+
+# Mean-reversion speed per tick for OU; the pull back towards base_price
+# halves a deviation in about ln(2) / theta ticks
+SIM_REVERSION = float(os.environ.get('MARKET_SIM_REVERSION', 0.05))
+
+# Jump-diffusion: expected jumps per symbol per tick, and the jump size
+# (mean and standard deviation of the log return)
+SIM_JUMP_RATE = float(os.environ.get('MARKET_SIM_JUMP_RATE', 0.002))
+SIM_JUMP_MEAN = float(os.environ.get('MARKET_SIM_JUMP_MEAN', 0.0))
+SIM_JUMP_STDEV = float(os.environ.get('MARKET_SIM_JUMP_STDEV', 0.08))
+
+# Standard deviation of the log return per tick, by the stock_prices
+# volatility bucket
+VOLATILITY_SIGMAS = {
+    'high': 0.0125,
+    'medium': 0.005,
+    'low': 0.0025
+}
+
+MIN_PRICE = 0.01
+
+# Geometric Brownian motion
+def gbm_step(log_prices, log_base, sigma, rng):
+    z = rng.standard_normal(log_prices.shape)
+    return log_prices + (SIM_DRIFT - 0.5 * sigma ** 2) + sigma * z
+
+# Ornstein-Uhlenbeck on the log price, reverting towards base_price
+def ou_step(log_prices, log_base, sigma, rng):
+    z = rng.standard_normal(log_prices.shape)
+    return log_prices + SIM_REVERSION * (log_base - log_prices) + sigma * z
+
+# Merton jump-diffusion: GBM plus Poisson-arriving normal jumps
+def jump_step(log_prices, log_base, sigma, rng):
+    jumps = rng.poisson(SIM_JUMP_RATE, log_prices.shape)
+    jump_sizes = SIM_JUMP_MEAN * jumps + SIM_JUMP_STDEV * np.sqrt(jumps) * rng.standard_normal(log_prices.shape)
+    return gbm_step(log_prices, log_base, sigma, rng) + jump_sizes
+
+MODELS = {
+    'gbm': gbm_step,
+    'ou': ou_step,
+    'jump': jump_step
+}
+
+class MarketSimulator:
+    def __init__(self, model=SIM_MODEL, seed=SIM_SEED):
+        if model not in MODELS:
+            raise ValueError(f"Unknown market model '{model}', expected one of {', '.join(MODELS)}")
+        self.model = model
+        self._step = MODELS[model]
+        self.rng = np.random.default_rng(seed)
+        self.symbols = []
+        self.log_prices = np.empty(0)
+        self.log_base = np.empty(0)
+        self.sigma = np.empty(0)
+
+    # Replace the universe with rows from stock_prices (symbol, base_price,
+    # current_price, volatility). Symbols keep their current price.
+    def load(self, stocks):
+        self.symbols = [stock['symbol'] for stock in stocks]
+        base = np.array([float(stock['base_price']) for stock in stocks])
+        current = np.array([float(stock['current_price'] or stock['base_price']) for stock in stocks])
+        self.log_base = np.log(np.maximum(base, MIN_PRICE))
+        self.log_prices = np.log(np.maximum(current, MIN_PRICE))
+        self.sigma = np.array([VOLATILITY_SIGMAS.get(stock['volatility'], VOLATILITY_SIGMAS['low'])
+                               for stock in stocks])
+
+    # Advance every symbol one tick and return the new prices in dollars,
+    # rounded to the cent
+    def step(self):
+        self.log_prices = self._step(self.log_prices, self.log_base, self.sigma, self.rng)
+        prices = np.maximum(np.round(np.exp(self.log_prices), 2), MIN_PRICE)
+        # Carry on from the price that was actually published
+        self.log_prices = np.log(prices)
+        return prices
@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from flask import Response, request, session
+from dotenv import load_dotenv
+from . import db
+
+load_dotenv()
+
+# Per-request instrumentation.
+#
+# Every request is measured for its total time, the statements it executed,
+# the connections it checked out and the time spent executing them (from the
+# counting cursors in db.py), plus any named phases the view marks with
+#
+#     with metrics.phase('render'):
+#         ...
+#
+# Each request's numbers go out three ways:
+#
+#   Server-Timing   response header, shown per request in browser dev tools
+#   request log     one JSON line per request on stdout
+#   /metrics        Prometheus text format: request, DB and phase counters
+#                   and histograms by endpoint, plus pool, price feed and
+#                   background writer gauges
+#
+# /metrics covers the worker that serves the scrape; under gunicorn each
+# worker keeps its own numbers. DB time is summed over statements, so an
+# async request's concurrent reads can add up to more than the request took.
+
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '1') == '1'
+REQUEST_LOG = os.environ.get('REQUEST_LOG', '1') == '1'
+# Only log requests at least this slow
+REQUEST_LOG_MIN_MS = float(os.environ.get('REQUEST_LOG_MIN_MS', 0))
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+
+# Histogram buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help)
+METRICS = {
+    'http_requests_total': ('counter', 'Requests served, by endpoint, method and status'),
+    'http_request_duration_seconds': ('histogram', 'Time to build the response, by endpoint'),
+    'db_queries_total': ('counter', 'Statements executed by requests, by endpoint'),
+    'db_connections_total': ('counter', 'Pool connections checked out by requests, by endpoint'),
+    'db_time_seconds_total': ('counter', 'Time requests spent executing statements, by endpoint'),
+    'request_phase_duration_seconds': ('histogram', 'Time spent in each marked phase, by endpoint'),
+    'db_pool_size': ('gauge', 'Connections in the sync pool'),
+    'db_pool_available': ('gauge', 'Idle connections in the sync pool'),
+    'db_pool_requests_waiting': ('gauge', 'Requests waiting for a sync pool connection'),
+    'price_feed_streams': ('gauge', 'Open price streams'),
+    'clickstream_queue_size': ('gauge', 'Clickstream events waiting to be written'),
+    'clickstream_dropped_total': ('counter', 'Clickstream events dropped because the queue was full'),
+    'achievement_writes_total': ('counter', 'Achievement unlocks written'),
+    'achievement_write_failures_total': ('counter', 'Achievement unlocks lost to write errors')
+}
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (name, labels) -> value
+        self._counters = {}
+        # (name, labels) -> [count per bucket..., +Inf count, sum]
+        self._histograms = {}
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(BUCKETS) + 2)
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += 1
+            histogram[-1] += value
+
+    def samples(self):
+        with self._lock:
+            return dict(self._counters), {key: list(value) for key, value in self._histograms.items()}
+
+registry = Registry()
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+# Point-in-time values from the rest of the core, read at scrape time
+def collect_gauges():
+    from . import achievements, clickstream, price_feed
+
+    values = {}
+    try:
+        pool = db.get_pool().get_stats()
+        values['db_pool_size'] = pool.get('pool_size', 0)
+        values['db_pool_available'] = pool.get('pool_available', 0)
+        values['db_pool_requests_waiting'] = pool.get('requests_waiting', 0)
+    except Exception as e:
+        print(f"Metrics pool stats error: {e}")
+    values['price_feed_streams'] = price_feed.feed.streams
+    clicks = clickstream.get_writer()
+    values['clickstream_queue_size'] = clicks.queue.qsize()
+    values['clickstream_dropped_total'] = clicks.dropped
+    writer = achievements.get_writer()
+    values['achievement_writes_total'] = writer.written
+    values['achievement_write_failures_total'] = writer.failed
+    return values
+
+# Everything in Prometheus text exposition format
+def render_metrics():
+    counters, histograms = registry.samples()
+    gauges = collect_gauges()
+
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if name in gauges:
+            lines.append(f'{name} {gauges[name]}')
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f'{name}{format_labels(labels)} {value}')
+        for (metric, labels), histogram in sorted(histograms.items()):
+            if metric != name:
+                continue
+            for bound, count in zip(BUCKETS, histogram):
+                lines.append(f'{name}_bucket{format_labels(labels + (("le", bound),))} {count}')
+            lines.append(f'{name}_bucket{format_labels(labels + (("le", "+Inf"),))} {histogram[-2]}')
+            lines.append(f'{name}_sum{format_labels(labels)} {histogram[-1]}')
+            lines.append(f'{name}_count{format_labels(labels)} {histogram[-2]}')
+    return '\n'.join(lines) + '\n'
+
+class RequestTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stats = db.query_stats()
+        self.start_counts = (self.stats.queries, self.stats.connections, self.stats.db_time)
+        # name -> seconds, in the order first entered
+        self.phases = {}
+
+    def add_phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    # (seconds, queries, connections, db seconds) so far
+    def totals(self):
+        return (time.perf_counter() - self.started,
+                self.stats.queries - self.start_counts[0],
+                self.stats.connections - self.start_counts[1],
+                self.stats.db_time - self.start_counts[2])
+
+_timer = contextvars.ContextVar('request_timer', default=None)
+
+# Time a block of the current request as a named phase; a no-op outside one
+@contextmanager
+def phase(name):
+    timer = _timer.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timer is not None:
+            timer.add_phase(name, time.perf_counter() - start)
+
+def server_timing(timer, totals):
+    seconds, queries, connections, db_time = totals
+    parts = [f'{name};dur={duration * 1000:.2f}' for name, duration in timer.phases.items()]
+    parts.append(f'db;dur={db_time * 1000:.2f};desc="{queries} queries, {connections} connections"')
+    parts.append(f'total;dur={seconds * 1000:.2f}')
+    return ', '.join(parts)
+
+def start_request():
+    _timer.set(RequestTimer())
+
+def finish_request(app_name, response):
+    timer = _timer.get()
+    if timer is None:
+        return response
+    _timer.set(None)
+    totals = timer.totals()
+    seconds, queries, connections, db_time = totals
+    endpoint = request.endpoint or 'unmatched'
+
+    if SERVER_TIMING:
+        response.headers['Server-Timing'] = server_timing(timer, totals)
+
+    if METRICS_ENABLED and endpoint != 'metrics':
+        labels = (('app', app_name), ('endpoint', endpoint))
+        registry.inc('http_requests_total', labels + (('method', request.method), ('status', response.status_code)))
+        registry.observe('http_request_duration_seconds', labels, seconds)
+        registry.inc('db_queries_total', labels, queries)
+        registry.inc('db_connections_total', labels, connections)
+        registry.inc('db_time_seconds_total', labels, db_time)
+        for name, duration in timer.phases.items():
+            registry.observe('request_phase_duration_seconds', labels + (('phase', name),), duration)
+
+    if REQUEST_LOG and endpoint != 'metrics' and seconds * 1000 >= REQUEST_LOG_MIN_MS:
+        print(json.dumps({
+            'ts': datetime.now().isoformat(timespec='milliseconds'),
+            'app': app_name,
+            'method': request.method,
+            'path': request.path,
+            'endpoint': endpoint,
+            'status': response.status_code,
+            'user_id': session.get('user_id'),
+            'duration_ms': round(seconds * 1000, 2),
+            'db_queries': queries,
+            'db_connections': connections,
+            'db_ms': round(db_time * 1000, 2),
+            'phases_ms': {name: round(duration * 1000, 2) for name, duration in timer.phases.items()}
+        }))
+    return response
+
+def init_app(app):
+    app_name = app.import_name
+
+    # Registered before the core's other hooks so it times them too
+    @app.before_request
+    def start_request_timer():
+        start_request()
+
+    @app.after_request
+    def finish_request_timer(response):
+        return finish_request(app_name, response)
+
+    if METRICS_ENABLED:
+        @app.route('/metrics')
+        def metrics():
+            return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,434 @@
+import os
+import math
+import heapq
+import time
+from dotenv import load_dotenv
+from .db import get_db_connection, get_pool
+from .orders import OrderRejected, execute_batch
+
+load_dotenv()
+
+# Resting limit and stop orders.
+#
+# The web apps only write to the orders table (place, cancel, replace). The
+# tick engine owns the in-memory book: after every tick it picks up new orders,
+# pops every order the new prices trigger from per-symbol heaps, claims them
+# (open -> triggered) so they can no longer be cancelled, and fills them
+# through execute_batch, one batch per user, recording each outcome in the
+# same transaction as the fill. If a user's fill fails for any other reason,
+# that user's orders are put back to open and back in the book, and the other
+# users still fill.
+#
+# Triggers, with P the new price:
+#   buy limit  P <= limit      sell limit  P >= limit
+#   buy stop   P >= stop       sell stop   P <= stop
+# Orders fill at P; a limit order therefore never fills worse than its limit.
+# Within one tick, triggered orders fill oldest first.
+#
+# Cancelled orders stay in the heaps until they would trigger or the book is
+# reloaded (every ORDER_BOOK_RELOAD_INTERVAL seconds); the claim only matches
+# orders that are still open, so they never fill.
+
+RELOAD_INTERVAL = float(os.environ.get('ORDER_BOOK_RELOAD_INTERVAL', 300))
+MAX_OPEN_ORDERS = int(os.environ.get('MAX_OPEN_ORDERS', 100))
+
+# New orders are picked up by id; ids are assigned at insert but become
+# visible at commit, so look back this far to catch late commits
+ORDER_ID_LOOKBACK = 1000
+
+ORDER_TYPES = ('limit', 'stop')
+
+# orders.trigger_price is DECIMAL(10, 2)
+MAX_PRICE = 99999999.99
+
+class RestingOrder:
+    __slots__ = ('order_id', 'user_id', 'symbol', 'side', 'order_type', 'shares', 'price', 'gamified')
+
+    def __init__(self, row):
+        self.order_id = row['order_id']
+        self.user_id = row['user_id']
+        self.symbol = row['symbol']
+        self.side = row['side']
+        self.order_type = row['order_type']
+        self.shares = row['shares']
+        self.price = float(row['trigger_price'])
+        # Fills count towards the owner's achievements
+        self.gamified = row['platform_type'] == 'gamified'
+
+# Four heaps per symbol, each ordered so the next order to trigger is on top;
+# ties go to the oldest order
+class SymbolBook:
+    __slots__ = ('buy_limits', 'sell_limits', 'buy_stops', 'sell_stops')
+
+    def __init__(self):
+        self.buy_limits = []   # (-limit, order_id)
+        self.sell_limits = []  # (limit, order_id)
+        self.buy_stops = []    # (stop, order_id)
+        self.sell_stops = []   # (-stop, order_id)
+
+    def add(self, order):
+        if order.order_type == 'limit':
+            if order.side == 'buy':
+                heapq.heappush(self.buy_limits, (-order.price, order.order_id))
+            else:
+                heapq.heappush(self.sell_limits, (order.price, order.order_id))
+        else:
+            if order.side == 'buy':
+                heapq.heappush(self.buy_stops, (order.price, order.order_id))
+            else:
+                heapq.heappush(self.sell_stops, (-order.price, order.order_id))
+
+    # Pop the ids of every order triggered at `price`
+    def trigger(self, price):
+        triggered = []
+        for heap, key in ((self.buy_limits, -price), (self.sell_stops, -price)):
+            while heap and heap[0][0] <= key:
+                triggered.append(heapq.heappop(heap)[1])
+        for heap in (self.sell_limits, self.buy_stops):
+            while heap and heap[0][0] <= price:
+                triggered.append(heapq.heappop(heap)[1])
+        return triggered
+
+    def __len__(self):
+        return len(self.buy_limits) + len(self.sell_limits) + len(self.buy_stops) + len(self.sell_stops)
+
+class OrderBook:
+    def __init__(self):
+        self.orders = {}
+        self.books = {}
+        self.last_order_id = 0
+
+    def add(self, order):
+        if order.order_id in self.orders:
+            return
+        self.orders[order.order_id] = order
+        self.books.setdefault(order.symbol, SymbolBook()).add(order)
+        self.last_order_id = max(self.last_order_id, order.order_id)
+
+    # Remove and return every order triggered by the new prices, oldest first.
+    # Only symbols with resting orders are looked at.
+    def match(self, prices):
+        triggered = []
+        for symbol, book in self.books.items():
+            price = prices.get(symbol)
+            if price is None:
+                continue
+            for order_id in book.trigger(price):
+                order = self.orders.pop(order_id, None)
+                if order is not None:
+                    triggered.append(order)
+        triggered.sort(key=lambda order: order.order_id)
+        return triggered
+
+    def __len__(self):
+        return len(self.orders)
+
+# Orders for the in-memory book, with the owner's platform
+RESTING_ORDERS_SQL = '''
+    SELECT o.order_id, o.user_id, o.symbol, o.side, o.order_type, o.shares, o.trigger_price, u.platform_type
+    FROM orders o
+    JOIN users u ON u.user_id = o.user_id
+'''
+
+# Record how each claimed order ended, in the fill's transaction
+RECORD_OUTCOMES_SQL = '''
+    UPDATE orders AS o
+    SET status = r.status,
+        filled_price = r.price,
+        filled_at = CASE WHEN r.status = 'filled' THEN CURRENT_TIMESTAMP END,
+        message = r.message,
+        updated_at = CURRENT_TIMESTAMP
+    FROM unnest(%s::bigint[], %s::varchar[], %s::numeric[], %s::varchar[])
+        AS r(order_id, status, price, message)
+    WHERE o.order_id = r.order_id
+'''
+
+class OrderMatcher:
+    def __init__(self):
+        self.book = OrderBook()
+        self.filled = 0
+        self.rejected = 0
+        self._loaded_at = None
+
+    # Force a full reload on the next run, e.g. after becoming the leader
+    def reset(self):
+        self._loaded_at = None
+
+    def _sync(self, conn):
+        cur = conn.cursor()
+        now = time.monotonic()
+        if self._loaded_at is None or now - self._loaded_at >= RELOAD_INTERVAL:
+            # Orders left 'triggered' by a crash never filled; they rest again
+            cur.execute(RESTING_ORDERS_SQL + "WHERE o.status IN ('open', 'triggered')")
+            book = OrderBook()
+            for row in cur.fetchall():
+                book.add(RestingOrder(row))
+            self.book = book
+            self._loaded_at = now
+        else:
+            cur.execute(RESTING_ORDERS_SQL + "WHERE o.status = 'open' AND o.order_id > %s",
+                        (self.book.last_order_id - ORDER_ID_LOOKBACK,))
+            for row in cur.fetchall():
+                self.book.add(RestingOrder(row))
+        cur.close()
+        conn.commit()
+
+    # Claim the triggered orders that are still live; cancelled ones drop out
+    def _claim(self, conn, triggered):
+        cur = conn.cursor()
+        cur.execute('''
+            UPDATE orders
+            SET status = 'triggered', updated_at = CURRENT_TIMESTAMP
+            WHERE order_id = ANY(%s::bigint[]) AND status IN ('open', 'triggered')
+            RETURNING order_id
+        ''', ([order.order_id for order in triggered],))
+        claimed = {row['order_id'] for row in cur.fetchall()}
+        cur.close()
+        conn.commit()
+        return [order for order in triggered if order.order_id in claimed]
+
+    # Put the claimed orders of a failed fill back to open and back in the
+    # book. Orders the fill already recorded stay as they are. If even that
+    # fails, the next full reload picks up the 'triggered' rows.
+    def _release(self, conn, user_orders):
+        try:
+            conn.rollback()
+            cur = conn.cursor()
+            cur.execute('''
+                UPDATE orders
+                SET status = 'open', updated_at = CURRENT_TIMESTAMP
+                WHERE order_id = ANY(%s::bigint[]) AND status = 'triggered'
+                RETURNING order_id
+            ''', ([order.order_id for order in user_orders],))
+            released = {row['order_id'] for row in cur.fetchall()}
+            cur.close()
+            conn.commit()
+        except Exception as e:
+            print(f"Order release error: {e}")
+            self.reset()
+            return
+        for order in user_orders:
+            if order.order_id in released:
+                self.book.add(order)
+
+    def _fill(self, conn, user_id, user_orders, quotes):
+        def record_outcomes(cur, results):
+            statuses = ['filled' if result['success'] else 'rejected' for result in results]
+            cur.execute(RECORD_OUTCOMES_SQL, (
+                [order.order_id for order in user_orders],
+                statuses,
+                [result.get('price') for result in results],
+                [result.get('message') for result in results]
+            ))
+
+        raw_orders = [{'symbol': order.symbol, 'action': order.side, 'shares': order.shares}
+                      for order in user_orders]
+        try:
+            results, summary = execute_batch(conn, user_id, raw_orders, quotes,
+                                             award_achievements=user_orders[0].gamified,
+                                             before_commit=record_outcomes)
+        except OrderRejected as e:
+            # The account is gone; nothing can fill
+            cur = conn.cursor()
+            cur.execute(RECORD_OUTCOMES_SQL, (
+                [order.order_id for order in user_orders],
+                ['rejected'] * len(user_orders),
+                [None] * len(user_orders),
+                [str(e)] * len(user_orders)
+            ))
+            cur.close()
+            conn.commit()
+            self.rejected += len(user_orders)
+            return
+        self.filled += summary['filled']
+        self.rejected += summary['rejected']
+
+    # Match the book against one tick and fill whatever triggered.
+    # Returns the number of orders that triggered.
+    def run(self, symbols, prices):
+        with get_pool().connection() as conn:
+            self._sync(conn)
+            triggered = self.book.match(dict(zip(symbols, prices)))
+            if not triggered:
+                return 0
+            claimed = self._claim(conn, triggered)
+
+            by_user = {}
+            for order in claimed:
+                by_user.setdefault(order.user_id, []).append(order)
+            quotes = {symbol: {'price': price} for symbol, price in zip(symbols, prices)}
+            for user_id, user_orders in by_user.items():
+                try:
+                    self._fill(conn, user_id, user_orders, quotes)
+                except Exception as e:
+                    print(f"Order fill error for user {user_id}: {e}")
+                    self._release(conn, user_orders)
+        return len(triggered)
+
+# Order row formatted for display
+def format_order(order):
+    return {
+        'order_id': order['order_id'],
+        'symbol': order['symbol'],
+        'side': order['side'].upper(),
+        'order_type': order['order_type'],
+        'shares': order['shares'],
+        'price': float(order['trigger_price']),
+        'status': order['status'],
+        'created_at': order['created_at'].strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+# Check an order's size and price and return (shares, price)
+def parse_size(shares, price):
+    try:
+        shares = int(shares)
+        price = round(float(price), 2)
+    except (TypeError, ValueError, OverflowError):
+        raise OrderRejected('Invalid order parameters')
+    if shares <= 0:
+        raise OrderRejected('Invalid number of shares')
+    # NaN would never trigger; infinity and huge prices don't fit the column
+    if not math.isfinite(price) or price <= 0 or price > MAX_PRICE:
+        raise OrderRejected('Invalid price')
+    return shares, price
+
+# Check a new resting order and return (symbol, side, order_type, shares, price)
+def parse_resting_order(symbol, side, order_type, shares, price, quotes):
+    symbol = str(symbol or '').upper()
+    if symbol not in quotes:
+        raise OrderRejected('Please select a symbol from the Market Data list')
+    if side not in ('buy', 'sell'):
+        raise OrderRejected('Invalid action')
+    if order_type not in ORDER_TYPES:
+        raise OrderRejected('Invalid order type')
+    shares, price = parse_size(shares, price)
+    return symbol, side, order_type, shares, price
+
+# The user's cash, shares of the symbol and other open orders
+ACCOUNT_CHECK_SQL = '''
+    SELECT u.user_id, u.current_cash,
+           COALESCE((SELECT shares FROM portfolio
+                     WHERE user_id = u.user_id AND symbol = %(symbol)s), 0) AS held,
+           (SELECT COUNT(*) FROM orders
+            WHERE user_id = u.user_id AND status = 'open'
+              AND order_id IS DISTINCT FROM %(replacing)s) AS open_orders
+    FROM users u
+    WHERE u.user_id = %(user_id)s
+'''
+
+# Check the account can rest the order: the open order limit, and the cash
+# or shares to cover it at its price. `replacing` is an open order the new
+# one takes the place of, which doesn't count towards the limit.
+def check_account(cur, user_id, symbol, side, shares, price, replacing=None):
+    cur.execute(ACCOUNT_CHECK_SQL, {'symbol': symbol, 'user_id': user_id, 'replacing': replacing})
+    account = cur.fetchone()
+    if not account:
+        raise OrderRejected('User not found')
+    if account['open_orders'] >= MAX_OPEN_ORDERS:
+        raise OrderRejected(f'At most {MAX_OPEN_ORDERS} open orders')
+    if side == 'buy' and shares * price > float(account['current_cash']):
+        raise OrderRejected('Insufficient funds')
+    if side == 'sell' and account['held'] < shares:
+        raise OrderRejected('Insufficient shares')
+
+# Rest a limit or stop order for the user. Cash and shares are checked at
+# placement and again when the order fills; nothing is reserved in between.
+def place_order(conn, user_id, symbol, side, order_type, shares, price, quotes):
+    symbol, side, order_type, shares, price = parse_resting_order(symbol, side, order_type, shares, price, quotes)
+
+    cur = conn.cursor()
+    try:
+        check_account(cur, user_id, symbol, side, shares, price)
+
+        cur.execute('''
+            INSERT INTO orders (user_id, symbol, side, order_type, shares, trigger_price)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            RETURNING order_id, symbol, side, order_type, shares, trigger_price, status, created_at
+        ''', (user_id, symbol, side, order_type, shares, price))
+        order = cur.fetchone()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+    return format_order(order)
+
+def cancel_order(conn, user_id, order_id):
+    cur = conn.cursor()
+    try:
+        cur.execute('''
+            UPDATE orders
+            SET status = 'cancelled', updated_at = CURRENT_TIMESTAMP
+            WHERE order_id = %s AND user_id = %s AND status = 'open'
+            RETURNING order_id, symbol, side, order_type, shares, trigger_price, status, created_at
+        ''', (order_id, user_id))
+        order = cur.fetchone()
+        if not order:
+            raise OrderRejected('Order is no longer open')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+    return format_order(order)
+
+# Cancel an open order and rest a new one with the new size and/or price in
+# its place, atomically. The replacement is checked like a new order and
+# loses the original's time priority.
+def replace_order(conn, user_id, order_id, shares=None, price=None):
+    cur = conn.cursor()
+    try:
+        # Locking the row keeps the matcher from claiming it meanwhile
+        cur.execute('''
+            SELECT symbol, side, order_type, shares, trigger_price
+            FROM orders
+            WHERE order_id = %s AND user_id = %s AND status = 'open'
+            FOR UPDATE
+        ''', (order_id, user_id))
+        original = cur.fetchone()
+        if not original:
+            raise OrderRejected('Order is no longer open')
+        shares, price = parse_size(original['shares'] if shares is None else shares,
+                                   original['trigger_price'] if price is None else price)
+        check_account(cur, user_id, original['symbol'], original['side'], shares, price, replacing=order_id)
+
+        cur.execute('''
+            UPDATE orders
+            SET status = 'replaced', updated_at = CURRENT_TIMESTAMP
+            WHERE order_id = %s
+        ''', (order_id,))
+        cur.execute('''
+            INSERT INTO orders (user_id, symbol, side, order_type, shares, trigger_price, replaces)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            RETURNING order_id, symbol, side, order_type, shares, trigger_price, status, created_at
+        ''', (user_id, original['symbol'], original['side'], original['order_type'], shares, price, order_id))
+        order = cur.fetchone()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+    return format_order(order)
+
+# Open orders for the user, newest first
+OPEN_ORDERS_SQL = '''
+    SELECT order_id, symbol, side, order_type, shares, trigger_price, status, created_at
+    FROM orders
+    WHERE user_id = %s AND status IN ('open', 'triggered')
+    ORDER BY created_at DESC
+'''
+
+def get_open_orders(user_id):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(OPEN_ORDERS_SQL, (user_id,))
+    orders = cur.fetchall()
+    cur.close()
+
+    return [format_order(order) for order in orders]
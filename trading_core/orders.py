@@ -0,0 +1,339 @@
+# Order execution.
+#
+# Every order runs in one transaction and two round-trips: the account row is
+# locked first (SELECT ... FOR UPDATE), which serializes concurrent orders from
+# the same user, and then a single statement moves the cash, updates the
+# position and records the trade. Locking the account before touching the
+# portfolio means buys and sells always take locks in the same order.
+#
+# Batches (execute_batch) take the same locks once, apply every order in
+# memory, and write the result with one more statement.
+
+import os
+from . import achievements, valuation
+
+MAX_BATCH_ORDERS = int(os.environ.get('MAX_BATCH_ORDERS', 5000))
+
+class OrderRejected(Exception):
+    pass
+
+# Lock the account row and return its cash balance
+def lock_account(cur, user_id):
+    cur.execute('''
+        SELECT user_id, current_cash
+        FROM users
+        WHERE user_id = %s
+        FOR UPDATE
+    ''', (user_id,))
+    account = cur.fetchone()
+    if not account:
+        raise OrderRejected('User not found')
+    return account
+
+# Debit cash, upsert the position with average-cost math, record the trade,
+# optionally bump the achievement counters and tell the other workers the
+# account changed, all in one statement
+BUY_SQL = f'''
+    WITH account AS (
+        UPDATE users
+        SET current_cash = current_cash - %(total)s
+        WHERE user_id = %(user_id)s
+        RETURNING user_id, current_cash
+    ), position AS (
+        INSERT INTO portfolio (user_id, symbol, shares, avg_price)
+        SELECT user_id, %(symbol)s, %(shares)s, %(price)s
+        FROM account
+        ON CONFLICT (user_id, symbol) DO UPDATE
+        SET shares = portfolio.shares + EXCLUDED.shares,
+            avg_price = (portfolio.shares * portfolio.avg_price + EXCLUDED.shares * EXCLUDED.avg_price)
+                        / (portfolio.shares + EXCLUDED.shares),
+            updated_at = CURRENT_TIMESTAMP
+        RETURNING shares, avg_price
+    ), trade AS (
+        INSERT INTO trades (user_id, symbol, action, shares, price, total_cost)
+        SELECT user_id, %(symbol)s, 'BUY', %(shares)s, %(price)s, %(total)s
+        FROM account
+        RETURNING trade_id, timestamp
+    ), {achievements.TRADE_STATS_CTE}
+    SELECT account.current_cash, position.shares, position.avg_price,
+           trade.trade_id, trade.timestamp,
+           stats.trade_count, stats.trades_today, stats.streak_days, stats.unlocked,
+           pg_notify(%(channel)s, %(user_id)s::text)
+    FROM account, position, trade
+    LEFT JOIN stats ON true
+'''
+
+# Reduce (or close) the position, credit cash, record the trade, optionally
+# bump the achievement counters and notify the account change, all in one statement.
+# At most one of reduced/closed matches, and nothing else happens if neither
+# does.
+SELL_SQL = f'''
+    WITH reduced AS (
+        UPDATE portfolio
+        SET shares = shares - %(shares)s, updated_at = CURRENT_TIMESTAMP
+        WHERE user_id = %(user_id)s AND symbol = %(symbol)s AND shares > %(shares)s
+        RETURNING shares, avg_price
+    ), closed AS (
+        DELETE FROM portfolio
+        WHERE user_id = %(user_id)s AND symbol = %(symbol)s AND shares = %(shares)s
+        RETURNING 0 AS shares, avg_price
+    ), position AS (
+        SELECT shares, avg_price FROM reduced
+        UNION ALL
+        SELECT shares, avg_price FROM closed
+    ), account AS (
+        UPDATE users
+        SET current_cash = current_cash + %(total)s
+        WHERE user_id = %(user_id)s AND EXISTS (SELECT 1 FROM position)
+        RETURNING user_id, current_cash
+    ), trade AS (
+        INSERT INTO trades (user_id, symbol, action, shares, price, total_cost)
+        SELECT user_id, %(symbol)s, 'SELL', %(shares)s, %(price)s, %(total)s
+        FROM account
+        RETURNING trade_id, timestamp
+    ), {achievements.TRADE_STATS_CTE}
+    SELECT account.current_cash, position.shares, position.avg_price,
+           trade.trade_id, trade.timestamp,
+           stats.trade_count, stats.trades_today, stats.streak_days, stats.unlocked,
+           pg_notify(%(channel)s, %(user_id)s::text)
+    FROM account, position, trade
+    LEFT JOIN stats ON true
+'''
+
+# Fill a market order at `price` for the user's account.
+#
+# Runs on the caller's connection and commits on success; on rejection or
+# error everything is rolled back and the account lock released.
+# Raises OrderRejected with a user-facing message when the order can't fill.
+def execute_order(conn, user_id, symbol, action, shares, price, award_achievements=False):
+    if action not in ('buy', 'sell'):
+        raise OrderRejected('Invalid action')
+
+    total_cost = shares * price
+    params = {
+        'user_id': user_id,
+        'symbol': symbol,
+        'shares': shares,
+        'price': price,
+        'total': total_cost,
+        'trade_count': 1,
+        'award_achievements': award_achievements,
+        'channel': valuation.ACCOUNT_CHANNEL
+    }
+
+    cur = conn.cursor()
+    try:
+        account = lock_account(cur, user_id)
+
+        if action == 'buy':
+            if total_cost > float(account['current_cash']):
+                raise OrderRejected('Insufficient funds')
+            cur.execute(BUY_SQL, params)
+        else:
+            cur.execute(SELL_SQL, params)
+
+        result = cur.fetchone()
+        if not result:
+            # Only the sell path can match nothing: no position, or too small
+            raise OrderRejected('Insufficient shares')
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+    valuation.book.apply(user_id, float(result['current_cash']),
+                         {symbol: (result['shares'], float(result['avg_price']))})
+    unlocked = []
+    if result['trade_count'] is not None:
+        unlocked = achievements.on_trade(user_id, result)
+
+    return {
+        'user_id': user_id,
+        'symbol': symbol,
+        'action': action,
+        'shares': shares,
+        'price': price,
+        'total': total_cost,
+        'cash': float(result['current_cash']),
+        'position_shares': result['shares'],
+        'avg_price': float(result['avg_price']),
+        'trade_id': result['trade_id'],
+        'timestamp': result['timestamp'],
+        'achievements': unlocked
+    }
+
+# Write a whole batch of fills in one statement: the final cash balance, the
+# final state of every touched position, one trades row per fill, and the
+# account change notification
+BATCH_SQL = f'''
+    WITH account AS (
+        UPDATE users
+        SET current_cash = %(cash)s
+        WHERE user_id = %(user_id)s
+        RETURNING user_id
+    ), positions AS (
+        INSERT INTO portfolio (user_id, symbol, shares, avg_price)
+        SELECT account.user_id, p.symbol, p.shares, p.avg_price
+        FROM account, unnest(%(open_symbols)s::varchar[], %(open_shares)s::integer[], %(open_avg)s::numeric[])
+            AS p(symbol, shares, avg_price)
+        ON CONFLICT (user_id, symbol) DO UPDATE
+        SET shares = EXCLUDED.shares, avg_price = EXCLUDED.avg_price, updated_at = CURRENT_TIMESTAMP
+        RETURNING 1
+    ), closed AS (
+        DELETE FROM portfolio
+        WHERE user_id = %(user_id)s AND symbol = ANY(%(closed_symbols)s::varchar[])
+        RETURNING 1
+    ), trade AS (
+        INSERT INTO trades (user_id, symbol, action, shares, price, total_cost)
+        SELECT account.user_id, t.symbol, t.action, t.shares, t.price, t.total
+        FROM account, unnest(%(trade_symbols)s::varchar[], %(trade_actions)s::varchar[],
+                             %(trade_shares)s::integer[], %(trade_prices)s::numeric[],
+                             %(trade_totals)s::numeric[])
+            AS t(symbol, action, shares, price, total)
+        RETURNING 1
+    ), {achievements.TRADE_STATS_CTE}
+    SELECT (SELECT COUNT(*) FROM trade) AS trades,
+           stats.trade_count, stats.trades_today, stats.streak_days, stats.unlocked,
+           pg_notify(%(channel)s, %(user_id)s::text)
+    FROM (SELECT 1) AS one
+    LEFT JOIN stats ON true
+'''
+
+# Check one raw order from a request body; returns (symbol, action, shares)
+def parse_order(raw, quotes):
+    if not isinstance(raw, dict):
+        raise OrderRejected('Invalid order parameters')
+    symbol = str(raw.get('symbol') or '').upper()
+    action = raw.get('action')
+    try:
+        shares = int(raw.get('shares', 0))
+    except (TypeError, ValueError):
+        raise OrderRejected('Invalid number of shares')
+    if shares <= 0:
+        raise OrderRejected('Invalid number of shares')
+    if symbol not in quotes:
+        raise OrderRejected('Please select a symbol from the Market Data list')
+    if action not in ('buy', 'sell'):
+        raise OrderRejected('Invalid action')
+    return symbol, action, shares
+
+# Fill a list of market orders for one user against one price snapshot.
+#
+# `quotes` maps symbol -> quote dict with a 'price'. Orders are applied in
+# sequence against the locked cash balance and positions, so a later sell can
+# use shares bought earlier in the same batch. With atomic=True the first
+# rejection rolls back the whole batch; otherwise rejected orders are skipped
+# and the rest still fill. Returns (results, summary); results has one entry
+# per input order. before_commit(cur, results), if given, runs just before the
+# commit so callers can record the outcome in the same transaction.
+def execute_batch(conn, user_id, raw_orders, quotes, atomic=False, award_achievements=False,
+                  before_commit=None):
+    cur = conn.cursor()
+    try:
+        account = lock_account(cur, user_id)
+        cash = float(account['current_cash'])
+
+        parsed = []
+        for raw in raw_orders:
+            try:
+                parsed.append(parse_order(raw, quotes))
+            except OrderRejected as e:
+                parsed.append(e)
+
+        # Lock every position the batch touches, in a stable order
+        symbols = sorted({order[0] for order in parsed if not isinstance(order, OrderRejected)})
+        cur.execute('''
+            SELECT symbol, shares, avg_price
+            FROM portfolio
+            WHERE user_id = %s AND symbol = ANY(%s::varchar[])
+            ORDER BY symbol
+            FOR UPDATE
+        ''', (user_id, symbols))
+        positions = {row['symbol']: [row['shares'], float(row['avg_price'])] for row in cur.fetchall()}
+
+        results = []
+        fills = []
+        for index, order in enumerate(parsed):
+            try:
+                if isinstance(order, OrderRejected):
+                    raise order
+                symbol, action, shares = order
+                price = quotes[symbol]['price']
+                total_cost = shares * price
+                held, avg_price = positions.get(symbol, [0, 0.0])
+
+                if action == 'buy':
+                    if total_cost > cash:
+                        raise OrderRejected('Insufficient funds')
+                    cash -= total_cost
+                    new_shares = held + shares
+                    avg_price = ((held * avg_price) + (shares * price)) / new_shares
+                else:
+                    if held < shares:
+                        raise OrderRejected('Insufficient shares')
+                    cash += total_cost
+                    new_shares = held - shares
+
+                positions[symbol] = [new_shares, avg_price]
+                fills.append((symbol, action.upper(), shares, price, total_cost))
+                results.append({
+                    'index': index,
+                    'success': True,
+                    'symbol': symbol,
+                    'action': action,
+                    'shares': shares,
+                    'price': price,
+                    'total': total_cost
+                })
+            except OrderRejected as e:
+                if atomic:
+                    raise OrderRejected(f'Order {index + 1}: {e}')
+                results.append({'index': index, 'success': False, 'message': str(e)})
+
+        stats = None
+        if fills:
+            touched = {fill[0] for fill in fills}
+            open_positions = [(s, positions[s]) for s in sorted(touched) if positions[s][0] > 0]
+            cur.execute(BATCH_SQL, {
+                'user_id': user_id,
+                'cash': cash,
+                'open_symbols': [s for s, p in open_positions],
+                'open_shares': [p[0] for s, p in open_positions],
+                'open_avg': [p[1] for s, p in open_positions],
+                'closed_symbols': sorted(s for s in touched if positions[s][0] == 0),
+                'trade_symbols': [fill[0] for fill in fills],
+                'trade_actions': [fill[1] for fill in fills],
+                'trade_shares': [fill[2] for fill in fills],
+                'trade_prices': [fill[3] for fill in fills],
+                'trade_totals': [fill[4] for fill in fills],
+                'trade_count': len(fills),
+                'award_achievements': award_achievements,
+                'channel': valuation.ACCOUNT_CHANNEL
+            })
+            stats = cur.fetchone()
+
+        if before_commit is not None:
+            before_commit(cur, results)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+    if fills:
+        valuation.book.apply(user_id, cash, {fill[0]: tuple(positions[fill[0]]) for fill in fills})
+    unlocked = []
+    if stats is not None and stats['trade_count'] is not None:
+        unlocked = achievements.on_trade(user_id, stats)
+
+    summary = {
+        'filled': len(fills),
+        'rejected': len(results) - len(fills),
+        'cash': cash,
+        'achievements': unlocked
+    }
+    return results, summary
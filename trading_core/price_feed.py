@@ -0,0 +1,246 @@
+import os
+import json
+import asyncio
+import threading
+from flask import Response, request
+from dotenv import load_dotenv
+from . import aio, market_cache
+from .db import get_pool
+
+load_dotenv()
+
+# Server-Sent Events price feed.
+#
+# Each worker runs one feed thread that wakes on the tick engine's NOTIFY (via
+# the market cache listener), loads the new snapshot once and publishes it to
+# every open stream. Streams only send the symbols whose price changed. A
+# stream that falls behind skips straight to the latest snapshot and diffs
+# against the last one it sent, so missed ticks are coalesced into one event.
+#
+# Under the ASGI app streams are async generators woken from the feed thread
+# through their event loop, so an open stream holds no thread at all.
+#
+# Under a sync WSGI server (gunicorn's default sync workers) an open stream
+# would hold a whole worker until the client leaves, and be killed at the
+# worker timeout, so streaming is only offered where a stream is cheap: the
+# ASGI app or a threaded server. Elsewhere the dashboards poll /api/quotes.
+
+HEARTBEAT_INTERVAL = float(os.environ.get('PRICE_FEED_HEARTBEAT', 15))
+MAX_STREAMS = int(os.environ.get('PRICE_FEED_MAX_STREAMS', 100))
+# 'auto' streams under the ASGI app or a multithreaded WSGI server; '1' forces
+# it on (e.g. for gevent workers), '0' off
+STREAMING = os.environ.get('PRICE_FEED_STREAMING', 'auto')
+
+# Whether the server handling the current request can hold streams open
+def streaming_enabled():
+    if STREAMING == 'auto':
+        return bool(request.environ.get('wsgi.multithread'))
+    return STREAMING == '1'
+
+# Symbols whose price differs between two snapshots
+def changed_symbols(old, new):
+    if old is None:
+        return [quote['symbol'] for quote in new.quotes]
+    return [quote['symbol'] for quote in new.quotes
+            if quote['price'] != old.by_symbol.get(quote['symbol'], {}).get('price')]
+
+# One SSE event with the formatted rows for the given symbols
+def format_event(snapshot, view_name, format_quote, symbols=None):
+    rows = snapshot.view(view_name, format_quote)
+    if symbols is not None:
+        wanted = set(symbols)
+        rows = [row for row in rows if row['symbol'] in wanted]
+    payload = {'version': snapshot.version, 'full': symbols is None, 'quotes': rows}
+    return f"id: {snapshot.version}\ndata: {json.dumps(payload)}\n\n"
+
+class PriceFeed:
+    def __init__(self, max_streams=MAX_STREAMS, heartbeat=HEARTBEAT_INTERVAL):
+        self.max_streams = max_streams
+        self.heartbeat = heartbeat
+        self.streams = 0
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._seq = 0
+        self._snapshot = None
+        self._base_version = None
+        self._changed = []
+        self._events = {}
+        # (event loop, asyncio.Event) of every open async stream
+        self._waiters = set()
+
+    # Called from the market cache listener on every NOTIFY
+    def notify(self, version=None):
+        self._wake.set()
+
+    def acquire(self):
+        with self._cond:
+            if self.streams >= self.max_streams:
+                return False
+            self.streams += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self.streams -= 1
+
+    def publish(self, snapshot):
+        with self._cond:
+            if self._snapshot is not None and snapshot.version == self._snapshot.version:
+                return
+            self._changed = changed_symbols(self._snapshot, snapshot)
+            self._base_version = self._snapshot.version if self._snapshot is not None else None
+            self._snapshot = snapshot
+            self._events = {}
+            self._seq += 1
+            self._cond.notify_all()
+            for loop, wake in self._waiters:
+                loop.call_soon_threadsafe(wake.set)
+
+    # Wake on every tick (or every cache TTL if nothing is listening) and
+    # load the new snapshot, but only while someone is streaming
+    def run_forever(self):
+        while True:
+            self._wake.wait(market_cache.CACHE_TTL)
+            self._wake.clear()
+            if not self.streams:
+                continue
+            try:
+                with get_pool().connection() as conn:
+                    snapshot = market_cache.cache.get_snapshot(conn)
+                self.publish(snapshot)
+            except Exception as e:
+                print(f"Price feed error: {e}")
+
+    # The shared delta from the previous snapshot, formatted once per view
+    def _shared_event(self, snapshot, view_name, format_quote):
+        key = (snapshot.version, view_name)
+        event = self._events.get(key)
+        if event is None:
+            event = format_event(snapshot, view_name, format_quote, self._changed)
+            self._events[key] = event
+        return event
+
+    # Under self._cond: (seq, snapshot, shared event) for the latest publish,
+    # with no snapshot if nothing was published since `seq` and no event
+    # unless the stream is exactly one tick behind
+    def _latest(self, seq, last, view_name, format_quote):
+        if self._seq == seq:
+            return seq, None, None
+        current = self._snapshot
+        if current is not None and current.version != last.version and last.version == self._base_version:
+            return self._seq, current, self._shared_event(current, view_name, format_quote)
+        return self._seq, current, None
+
+    def stream(self, snapshot, view_name, format_quote):
+        yield format_event(snapshot, view_name, format_quote)
+        last = snapshot
+        seq = None
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._seq != seq, timeout=self.heartbeat)
+                seq, current, event = self._latest(seq, last, view_name, format_quote)
+            if current is None:
+                # Keeps proxies from closing an idle connection
+                yield ': keepalive\n\n'
+                continue
+            if current.version == last.version:
+                continue
+            if event is None:
+                # Missed one or more ticks: send everything that moved since
+                # the last snapshot this client saw
+                event = format_event(current, view_name, format_quote, changed_symbols(last, current))
+            last = current
+            yield event
+
+    # stream() as an async generator, for the ASGI app
+    async def astream(self, snapshot, view_name, format_quote):
+        wake = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), wake)
+        with self._cond:
+            self._waiters.add(waiter)
+        try:
+            yield format_event(snapshot, view_name, format_quote)
+            last = snapshot
+            seq = None
+            while True:
+                with self._cond:
+                    idle = self._seq == seq
+                    if idle:
+                        wake.clear()
+                if idle:
+                    try:
+                        await asyncio.wait_for(wake.wait(), self.heartbeat)
+                    except asyncio.TimeoutError:
+                        pass
+                with self._cond:
+                    seq, current, event = self._latest(seq, last, view_name, format_quote)
+                if current is None:
+                    yield ': keepalive\n\n'
+                    continue
+                if current.version == last.version:
+                    continue
+                if event is None:
+                    event = format_event(current, view_name, format_quote, changed_symbols(last, current))
+                last = current
+                yield event
+        finally:
+            with self._cond:
+                self._waiters.discard(waiter)
+
+feed = PriceFeed()
+
+_feed_pid = None
+_subscribed = False
+
+def ensure_feed_started():
+    global _feed_pid, _subscribed
+    if _feed_pid == os.getpid():
+        return
+    _feed_pid = os.getpid()
+    if not _subscribed:
+        market_cache.cache.subscribe(feed.notify)
+        _subscribed = True
+    market_cache.ensure_listener_started()
+    threading.Thread(target=feed.run_forever, name='price-feed', daemon=True).start()
+
+# Streaming response for GET /api/quotes/stream. The initial snapshot is read
+# here, on the request's connection, so the stream itself holds no database
+# connection. Each open stream occupies a worker thread, so it is refused
+# unless streaming_enabled().
+def sse_response(view_name, format_quote):
+    if not streaming_enabled():
+        # 204 tells EventSource not to reconnect; the page polls instead
+        return Response(status=204)
+    ensure_feed_started()
+    if not feed.acquire():
+        return Response('Too many open price streams', status=503, headers={'Retry-After': '5'})
+    try:
+        snapshot = market_cache.get_snapshot()
+    except Exception:
+        feed.release()
+        raise
+
+    response = Response(feed.stream(snapshot, view_name, format_quote),
+                        mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(feed.release)
+    return response
+
+# sse_response() for the ASGI app's async views
+async def sse_response_async(view_name, format_quote):
+    if not streaming_enabled():
+        return Response(status=204)
+    ensure_feed_started()
+    if not feed.acquire():
+        return Response('Too many open price streams', status=503, headers={'Retry-After': '5'})
+    try:
+        snapshot = await aio.get_snapshot()
+    except Exception:
+        feed.release()
+        raise
+
+    response = Response(feed.astream(snapshot, view_name, format_quote),
+                        mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(feed.release)
+    return response
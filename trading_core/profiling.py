@@ -0,0 +1,299 @@
+import os
+import sys
+import hmac
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+import contextvars
+import cProfile
+import pstats
+from collections import Counter
+from datetime import datetime
+from flask import jsonify, request
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Opt-in request profiling.
+#
+# A request is profiled when it is picked by config (PROFILE_SAMPLE_RATE of
+# the requests to PROFILE_ENDPOINTS, or to every endpoint if that is empty)
+# or when it carries a valid signed token in the X-Profile-Token header:
+#
+#     python -m trading_core.profiling token --ttl 3600
+#     curl -H "X-Profile-Token: <token>" http://localhost:5000/
+#
+# Tokens are an expiry time signed with PROFILE_SECRET; without a secret the
+# header (and the admin endpoint) are disabled. Two profilers are available:
+#
+#   sample    (default) a thread samples the request thread's stack every
+#             PROFILE_INTERVAL seconds; cheap enough for production, and its
+#             output is collapsed stacks ("a;b;c 12"), ready for flamegraph.pl
+#             or speedscope
+#   cprofile  deterministic cProfile of the request thread; exact call counts
+#             at a few times the cost, written as .pstats for snakeviz or
+#             `python -m pstats`
+#
+# Each profiled request writes one file to PROFILE_DIR (its name is returned
+# in the X-Profile header) and is added to this worker's running totals;
+# GET /admin/profile?n=20 with the token in the X-Profile-Token header returns
+# the top n (1 to REPORT_MAX_ROWS) functions by self and total time for each
+# profiler, listed separately: sampled times are estimates from stack counts
+# and cProfile's are measured, so the two don't rank together. The token
+# is only read from the header, never the query string, which ends up in
+# access logs. Under the ASGI app the async views share the event loop
+# thread, so their profiles can include other requests' work.
+
+PROFILE_MODE = os.environ.get('PROFILE_MODE', 'sample')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_ENDPOINTS = {name.strip() for name in os.environ.get('PROFILE_ENDPOINTS', '').split(',') if name.strip()}
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.005))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+# Oldest files are removed past this many
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', 500))
+PROFILE_SECRET = os.environ.get('PROFILE_SECRET', '')
+
+TOKEN_HEADER = 'X-Profile-Token'
+
+# Rows returned by /admin/profile: default and maximum
+REPORT_DEFAULT_ROWS = 20
+REPORT_MAX_ROWS = 200
+
+# Never profiled
+EXCLUDED_ENDPOINTS = ('static', 'metrics', 'profile_report')
+
+def make_token(ttl=3600, secret=None):
+    secret = secret or PROFILE_SECRET
+    expires = str(int(time.time() + ttl))
+    signature = hmac.new(secret.encode(), expires.encode(), hashlib.sha256).hexdigest()
+    return f"{expires}.{signature}"
+
+def check_token(token, secret=None):
+    secret = secret or PROFILE_SECRET
+    if not secret or not token or '.' not in token:
+        return False
+    expires, signature = token.split('.', 1)
+    expected = hmac.new(secret.encode(), expires.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(signature, expected) and expires.isdigit() and int(expires) > time.time()
+
+# One stack frame as shown in reports and flame graphs
+def frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+# The stack of `frame`, outermost first, in collapsed-stack form
+def collapse(frame):
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+class StackSampler:
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+
+PROFILE_MODES = ('sample', 'cprofile')
+
+class ProfileTotals:
+    def __init__(self):
+        # mode -> profiles added
+        self.profiles = dict.fromkeys(PROFILE_MODES, 0)
+        self.samples = 0
+        # function -> samples as the innermost frame / anywhere on the stack
+        self.self_samples = Counter()
+        self.total_samples = Counter()
+        self.stats = None
+        self._lock = threading.Lock()
+
+    def add_samples(self, stacks):
+        with self._lock:
+            self.profiles['sample'] += 1
+            for stack, count in stacks.items():
+                functions = stack.split(';')
+                self.samples += count
+                self.self_samples[functions[-1]] += count
+                for function in set(functions):
+                    self.total_samples[function] += count
+
+    def add_profile(self, profile):
+        with self._lock:
+            self.profiles['cprofile'] += 1
+            if self.stats is None:
+                self.stats = pstats.Stats(profile)
+            else:
+                self.stats.add(profile)
+
+    # The n hottest functions by self time, with their total time, by mode
+    def top(self, n=20):
+        with self._lock:
+            sampled = [{
+                'function': function,
+                'self_ms': round(count * PROFILE_INTERVAL * 1000, 2),
+                'total_ms': round(self.total_samples[function] * PROFILE_INTERVAL * 1000, 2),
+                'self_samples': count,
+                'total_samples': self.total_samples[function]
+            } for function, count in self.self_samples.most_common(n)]
+            profiled = []
+            if self.stats is not None:
+                functions = sorted(self.stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:n]
+                profiled = [{
+                    'function': f"{name} ({os.path.basename(filename)}:{line})",
+                    'self_ms': round(self_time * 1000, 2),
+                    'total_ms': round(total_time * 1000, 2),
+                    'calls': calls
+                } for (filename, line, name), (_, calls, self_time, total_time, _) in functions]
+            return {'sample': sampled, 'cprofile': profiled}
+
+totals = ProfileTotals()
+
+# Per request; async views on the event loop share one thread
+_profiler = contextvars.ContextVar('request_profiler', default=None)
+
+def should_profile(endpoint):
+    if endpoint in EXCLUDED_ENDPOINTS:
+        return False
+    if check_token(request.headers.get(TOKEN_HEADER)):
+        return True
+    if PROFILE_SAMPLE_RATE <= 0:
+        return False
+    if PROFILE_ENDPOINTS and endpoint not in PROFILE_ENDPOINTS:
+        return False
+    return random.random() < PROFILE_SAMPLE_RATE
+
+def start_profile():
+    if PROFILE_MODE == 'cprofile':
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # Another profiler is already active
+            print(f"Profiling skipped: {e}")
+            return None
+        return profiler
+    sampler = StackSampler(threading.get_ident())
+    sampler.start()
+    return sampler
+
+def prune(directory):
+    files = sorted((entry for entry in os.scandir(directory) if entry.is_file()), key=lambda entry: entry.stat().st_mtime)
+    for entry in files[:max(len(files) - PROFILE_MAX_FILES, 0)]:
+        os.remove(entry.path)
+
+# Stop the profiler, write its file and add it to the totals.
+# Returns the file name.
+def finish_profile(profiler, endpoint):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{os.getpid()}-{endpoint}"
+    if isinstance(profiler, StackSampler):
+        profiler.stop()
+        name += '.collapsed'
+        with open(os.path.join(PROFILE_DIR, name), 'w') as f:
+            for stack, count in profiler.stacks.items():
+                f.write(f"{stack} {count}\n")
+        totals.add_samples(profiler.stacks)
+    else:
+        profiler.disable()
+        name += '.pstats'
+        profiler.dump_stats(os.path.join(PROFILE_DIR, name))
+        totals.add_profile(profiler)
+    prune(PROFILE_DIR)
+    return name
+
+def init_app(app):
+    @app.before_request
+    def start_request_profile():
+        endpoint = request.endpoint or 'unmatched'
+        _profiler.set(start_profile() if should_profile(endpoint) else None)
+
+    @app.after_request
+    def finish_request_profile(response):
+        profiler = _profiler.get()
+        if profiler is None:
+            return response
+        _profiler.set(None)
+        try:
+            response.headers['X-Profile'] = finish_profile(profiler, request.endpoint or 'unmatched')
+        except Exception as e:
+            print(f"Profile write error: {e}")
+        return response
+
+    # A request that never reached after_request still stops its profiler
+    @app.teardown_request
+    def discard_request_profile(exc):
+        profiler = _profiler.get()
+        if profiler is None:
+            return
+        _profiler.set(None)
+        if isinstance(profiler, StackSampler):
+            profiler.stop()
+        else:
+            profiler.disable()
+
+    @app.route('/admin/profile')
+    def profile_report():
+        if not check_token(request.headers.get(TOKEN_HEADER)):
+            return jsonify({'success': False, 'message': 'Forbidden'}), 403
+        try:
+            n = int(request.args.get('n', REPORT_DEFAULT_ROWS))
+        except ValueError:
+            return jsonify({'success': False, 'message': 'n must be an integer'}), 400
+        n = max(1, min(n, REPORT_MAX_ROWS))
+        return jsonify({
+            'mode': PROFILE_MODE,
+            'interval_ms': PROFILE_INTERVAL * 1000,
+            'profiles': dict(totals.profiles),
+            'samples': totals.samples,
+            'top': totals.top(n)
+        })
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Request profiling helpers')
+    commands = parser.add_subparsers(dest='command', required=True)
+    token_parser = commands.add_parser('token', help=f'print a signed {TOKEN_HEADER} value')
+    token_parser.add_argument('--ttl', type=int, default=3600, help='seconds the token is valid')
+    top_parser = commands.add_parser('top', help='hottest functions across collapsed-stack files')
+    top_parser.add_argument('files', nargs='+')
+    top_parser.add_argument('-n', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if args.command == 'token':
+        if not PROFILE_SECRET:
+            print("❌ PROFILE_SECRET is not set")
+            return 1
+        print(make_token(args.ttl))
+        return 0
+
+    merged = ProfileTotals()
+    for path in args.files:
+        stacks = Counter()
+        with open(path) as f:
+            for line in f:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack:
+                    stacks[stack] += int(count)
+        merged.add_samples(stacks)
+    print(json.dumps(merged.top(args.n)['sample'], indent=2))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
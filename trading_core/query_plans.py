@@ -0,0 +1,158 @@
+import sys
+import argparse
+from .bootstrap import get_connection
+from .dashboard import DASHBOARD_SQL
+
+# Query plan report for the hot per-user queries.
+#
+#     python -m trading_core.query_plans                  # plan every hot query
+#     python -m trading_core.query_plans --user <id>      # for a given user
+#     python -m trading_core.query_plans --no-seqscan     # small dev databases
+#
+# Each query runs under EXPLAIN (ANALYZE, BUFFERS) for one real user and is
+# checked against what it should cost: an index scan on its table (no
+# sequential scan) and, where the index supplies the order, no sort. Exits
+# non-zero when a query misses. Everything runs in a transaction that is
+# rolled back.
+#
+# On a nearly empty table the planner rightly prefers a sequential scan;
+# --no-seqscan disables them for the report so the check shows whether an
+# index can serve the query at all.
+
+# (name, table, sql, needs_sorted_index). Keep these in step with the
+# queries in accounts, achievements and orders; the dashboard statement runs
+# with every section switched on.
+HOT_QUERIES = [
+    ('resolve user', 'users', '''
+        SELECT user_id FROM users WHERE session_id = %(session_id)s
+    ''', False),
+    ('cash', 'users', '''
+        SELECT current_cash FROM users WHERE user_id = %(user_id)s
+    ''', False),
+    ('positions', 'portfolio', '''
+        SELECT symbol, shares, avg_price
+        FROM portfolio
+        WHERE user_id = %(user_id)s
+    ''', False),
+    ('trade history', 'trades', '''
+        SELECT symbol, action, shares, price, total_cost, timestamp
+        FROM trades
+        WHERE user_id = %(user_id)s
+        ORDER BY timestamp DESC
+        LIMIT 20
+    ''', True),
+    ('achievements', 'achievements', '''
+        SELECT achievement_name
+        FROM achievements
+        WHERE user_id = %(user_id)s
+    ''', False),
+    ('recent clicks', 'clickstream', '''
+        SELECT event_type, timestamp
+        FROM clickstream
+        WHERE user_id = %(user_id)s
+        ORDER BY timestamp DESC
+        LIMIT 50
+    ''', True),
+    ('dashboard', 'users', DASHBOARD_SQL, False)
+]
+
+INDEX_SCANS = ('Index Scan', 'Index Only Scan', 'Bitmap Index Scan')
+
+# Every node of an EXPLAIN (FORMAT JSON) plan, depth first
+def walk(plan):
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from walk(child)
+
+# The table itself or one of its partitions
+def is_table(relation, table):
+    return relation is not None and (relation == table or relation.startswith(table + '_'))
+
+# Problems with one plan; empty when it uses an index on `table` and, if
+# required, reads it in order
+def check_plan(plan, table, needs_sorted_index):
+    nodes = list(walk(plan))
+    problems = []
+    if any(node['Node Type'] == 'Seq Scan' and is_table(node.get('Relation Name'), table) for node in nodes):
+        problems.append(f'sequential scan on {table}')
+    if not any(node['Node Type'] in INDEX_SCANS for node in nodes):
+        problems.append('no index scan')
+    if needs_sorted_index and any(node['Node Type'] in ('Sort', 'Incremental Sort') for node in nodes):
+        problems.append('sorts instead of reading the index in order')
+    return problems
+
+def describe(plan):
+    parts = []
+    for node in walk(plan):
+        name = node['Node Type']
+        if 'Index Name' in node:
+            name += f" using {node['Index Name']}"
+        elif 'Relation Name' in node:
+            name += f" on {node['Relation Name']}"
+        parts.append(name)
+    return ' -> '.join(parts)
+
+# A user with recent activity, so the plans run against real rows
+def sample_user(cur):
+    cur.execute('SELECT user_id FROM trades ORDER BY trade_id DESC LIMIT 1')
+    row = cur.fetchone()
+    if row is None:
+        cur.execute('SELECT user_id FROM users ORDER BY user_id DESC LIMIT 1')
+        row = cur.fetchone()
+    return row['user_id'] if row else 0
+
+# Plan every hot query; returns a list of (name, summary, execution ms, problems)
+def run_report(conn, user_id=None, no_seqscan=False):
+    results = []
+    with conn.transaction(force_rollback=True):
+        cur = conn.cursor()
+        if no_seqscan:
+            cur.execute('SET LOCAL enable_seqscan = off')
+        if user_id is None:
+            user_id = sample_user(cur)
+        cur.execute('SELECT session_id FROM users WHERE user_id = %s', (user_id,))
+        row = cur.fetchone()
+        params = {'user_id': user_id, 'session_id': row['session_id'] if row else '',
+                  'positions': True, 'history_limit': 20, 'achievements': True, 'orders': True}
+        for name, table, sql, needs_sorted_index in HOT_QUERIES:
+            cur.execute('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + sql, params)
+            explained = cur.fetchone()['QUERY PLAN'][0]
+            plan = explained['Plan']
+            results.append((name, describe(plan), explained['Execution Time'],
+                            check_plan(plan, table, needs_sorted_index)))
+        cur.close()
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check that the hot per-user queries use their indexes')
+    parser.add_argument('--user', type=int, help='user_id to plan for (default: the most recent trader)')
+    parser.add_argument('--no-seqscan', action='store_true', help='disable sequential scans while planning')
+    args = parser.parse_args(argv)
+
+    try:
+        conn = get_connection()
+    except Exception as e:
+        print(f"❌ Connection failed: {e}")
+        return 1
+
+    try:
+        results = run_report(conn, args.user, args.no_seqscan)
+    finally:
+        conn.close()
+
+    failed = 0
+    for name, summary, execution_ms, problems in results:
+        mark = '❌' if problems else '✅'
+        print(f"{mark} {name:<14} {execution_ms:>8.3f} ms  {summary}")
+        for problem in problems:
+            print(f"      {problem}")
+        failed += bool(problems)
+
+    if failed:
+        print(f"❌ {failed} of {len(results)} hot queries miss their index")
+        return 1
+    print(f"✅ All {len(results)} hot queries use their indexes")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+from flask import Blueprint, request, jsonify, session
+from . import accounts, aio, market_cache, order_book, price_feed, tick_history
+from .clickstream import log_event
+from .db import get_db_connection
+from .orders import OrderRejected
+
+# Routes both apps serve the same way: quotes, the price stream, bars and
+# resting orders. Each app registers them with its platform and quote format:
+#
+#     asgi_app = AsgiApp(app)
+#     routes.init_app(app, asgi_app, 'gamified', format_quote)
+#
+# The market table view is named after the platform. Under the ASGI app the
+# quote and order reads run as async views; cancel, replace and bars run the
+# sync views on its thread pool.
+
+def create_blueprint(platform, format_quote, starter_achievements=()):
+    blueprint = Blueprint('trading', __name__)
+
+    def init_user():
+        accounts.init_user(platform, starter_achievements=starter_achievements)
+
+    @blueprint.route('/api/quotes')
+    def api_quotes():
+        snapshot = market_cache.get_snapshot()
+        return jsonify({'version': snapshot.version, 'quotes': snapshot.view(platform, format_quote)})
+
+    # Live quotes as Server-Sent Events; each event carries only the symbols that moved
+    @blueprint.route('/api/quotes/stream')
+    def api_quotes_stream():
+        return price_feed.sse_response(platform, format_quote)
+
+    # OHLCV bars for charts: ?resolution=1s|1m|1h&start=&end=&limit=
+    @blueprint.route('/api/bars/<symbol>')
+    def api_bars(symbol):
+        try:
+            bars = tick_history.get_bars(symbol.upper(),
+                                         resolution=request.args.get('resolution', '1m'),
+                                         start=request.args.get('start'),
+                                         end=request.args.get('end'),
+                                         limit=request.args.get('limit', 500))
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        return jsonify({'symbol': symbol.upper(), 'bars': bars})
+
+    @blueprint.route('/api/orders')
+    def api_orders():
+        init_user()
+        return jsonify({'orders': order_book.get_open_orders(session['user_id'])})
+
+    @blueprint.route('/orders/<int:order_id>/cancel', methods=['POST'])
+    def cancel_order(order_id):
+        init_user()
+        try:
+            order = order_book.cancel_order(get_db_connection(), session['user_id'], order_id)
+        except OrderRejected as e:
+            return jsonify({'success': False, 'message': str(e)})
+        log_event('order_cancelled', {'order_id': order_id})
+        return jsonify({
+            'success': True,
+            'message': f"Order {order_id} cancelled",
+            'order': order,
+            'orders': order_book.get_open_orders(session['user_id'])
+        })
+
+    # Change the size and/or price of an open order: {"shares": ..., "price": ...}
+    @blueprint.route('/orders/<int:order_id>/replace', methods=['POST'])
+    def replace_order(order_id):
+        init_user()
+        data = request.json or {}
+        try:
+            order = order_book.replace_order(get_db_connection(), session['user_id'], order_id,
+                                             shares=data.get('shares'), price=data.get('price'))
+        except OrderRejected as e:
+            return jsonify({'success': False, 'message': str(e)})
+        log_event('order_replaced', {'order_id': order_id, 'new_order_id': order['order_id']})
+        return jsonify({
+            'success': True,
+            'message': f"Order {order_id} replaced by order {order['order_id']}",
+            'order': order,
+            'orders': order_book.get_open_orders(session['user_id'])
+        })
+
+    return blueprint
+
+# Async versions of the blueprint's read routes, for the ASGI app
+def register_async_views(asgi_app, platform, format_quote, starter_achievements=()):
+    @asgi_app.view('trading.api_quotes')
+    async def api_quotes_async():
+        snapshot = await aio.get_snapshot()
+        return jsonify({'version': snapshot.version, 'quotes': snapshot.view(platform, format_quote)})
+
+    @asgi_app.view('trading.api_quotes_stream')
+    async def api_quotes_stream_async():
+        return await price_feed.sse_response_async(platform, format_quote)
+
+    @asgi_app.view('trading.api_orders')
+    async def api_orders_async():
+        user_id = await aio.init_user(platform, starter_achievements=starter_achievements)
+        return jsonify({'orders': await aio.get_open_orders(user_id)})
+
+def init_app(app, asgi_app, platform, format_quote, starter_achievements=()):
+    app.register_blueprint(create_blueprint(platform, format_quote, starter_achievements))
+    register_async_views(asgi_app, platform, format_quote, starter_achievements)
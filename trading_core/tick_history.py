@@ -0,0 +1,131 @@
+import os
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from .db import get_db_connection
+
+load_dotenv()
+
+# Tick history and OHLCV bars.
+#
+# Every tick the engine COPYs the new prices into price_ticks, which is range
+# partitioned by day, and folds them into 1s/1m/1h bars in price_bars with one
+# upsert, inside the tick's own transaction. Chart queries only ever read
+# price_bars, one index range scan per request, never the raw ticks.
+#
+# Partitions are created ahead of time by the engine; partitions older than
+# TICK_RETENTION_DAYS are dropped, as are 1s bars older than
+# BAR_1S_RETENTION_HOURS. Bar volume is the number of ticks in the bar; the
+# simulated market has no traded volume of its own.
+
+TICK_HISTORY = os.environ.get('MARKET_TICK_HISTORY', '1') == '1'
+TICK_RETENTION_DAYS = int(os.environ.get('TICK_RETENTION_DAYS', 7))
+BAR_1S_RETENTION_HOURS = int(os.environ.get('BAR_1S_RETENTION_HOURS', 24))
+
+# Days of partitions to keep ready ahead of the current one
+PARTITIONS_AHEAD = 2
+
+# Bar resolution -> date_trunc unit
+RESOLUTIONS = {
+    '1s': 'second',
+    '1m': 'minute',
+    '1h': 'hour'
+}
+
+MAX_BARS = 2000
+
+def partition_name(day):
+    return f"price_ticks_p{day:%Y%m%d}"
+
+# Create today's partition and the next few, drop the expired ones and
+# prune old 1s bars. Cheap enough to run once a day from the tick engine.
+def maintain_partitions(cur, now=None):
+    now = now or datetime.now()
+    today = now.date()
+    for offset in range(PARTITIONS_AHEAD + 1):
+        day = today + timedelta(days=offset)
+        cur.execute(f'''
+            CREATE TABLE IF NOT EXISTS {partition_name(day)}
+            PARTITION OF price_ticks
+            FOR VALUES FROM ('{day}') TO ('{day + timedelta(days=1)}')
+        ''')
+
+    cutoff = partition_name(today - timedelta(days=TICK_RETENTION_DAYS))
+    cur.execute('''
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'price_ticks'
+    ''')
+    for row in cur.fetchall():
+        if row['relname'] < cutoff:
+            cur.execute(f"DROP TABLE IF EXISTS {row['relname']}")
+
+    cur.execute('''
+        DELETE FROM price_bars
+        WHERE resolution = '1s' AND bucket < %s
+    ''', (now - timedelta(hours=BAR_1S_RETENTION_HOURS),))
+
+# Append one tick for every symbol and roll it into the bars
+def record_ticks(cur, version, symbols, prices, ticked_at):
+    with cur.copy('COPY price_ticks (symbol, ts, price, tick_version) FROM STDIN') as copy:
+        for symbol, price in zip(symbols, prices):
+            copy.write_row((symbol, ticked_at, price, version))
+
+    cur.execute('''
+        INSERT INTO price_bars AS b (symbol, resolution, bucket, open, high, low, close, volume)
+        SELECT t.symbol, r.resolution, date_trunc(r.unit, %s::timestamp),
+               t.price, t.price, t.price, t.price, 1
+        FROM unnest(%s::varchar[], %s::numeric[]) AS t(symbol, price)
+        CROSS JOIN unnest(%s::varchar[], %s::text[]) AS r(resolution, unit)
+        ON CONFLICT (symbol, resolution, bucket) DO UPDATE
+        SET high = GREATEST(b.high, EXCLUDED.high),
+            low = LEAST(b.low, EXCLUDED.low),
+            close = EXCLUDED.close,
+            volume = b.volume + 1
+    ''', (ticked_at, symbols, prices, list(RESOLUTIONS), list(RESOLUTIONS.values())))
+
+# Bars for one symbol, oldest first, straight from price_bars. Without a
+# start, returns the most recent `limit` bars up to `end`.
+def get_bars(symbol, resolution='1m', start=None, end=None, limit=500):
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown resolution '{resolution}', expected one of {', '.join(RESOLUTIONS)}")
+    limit = max(1, min(int(limit), MAX_BARS))
+    # ISO 8601 strings from the query string; a bad value raises ValueError
+    if isinstance(start, str):
+        start = datetime.fromisoformat(start)
+    if isinstance(end, str):
+        end = datetime.fromisoformat(end)
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    if start is not None:
+        cur.execute('''
+            SELECT bucket, open, high, low, close, volume
+            FROM price_bars
+            WHERE symbol = %s AND resolution = %s
+              AND bucket >= %s AND bucket < COALESCE(%s::timestamp, 'infinity'::timestamp)
+            ORDER BY bucket
+            LIMIT %s
+        ''', (symbol, resolution, start, end, limit))
+        bars = cur.fetchall()
+    else:
+        cur.execute('''
+            SELECT bucket, open, high, low, close, volume
+            FROM price_bars
+            WHERE symbol = %s AND resolution = %s
+              AND bucket < COALESCE(%s::timestamp, 'infinity'::timestamp)
+            ORDER BY bucket DESC
+            LIMIT %s
+        ''', (symbol, resolution, end, limit))
+        bars = cur.fetchall()[::-1]
+    cur.close()
+
+    return [{
+        'time': bar['bucket'].strftime('%Y-%m-%d %H:%M:%S'),
+        'open': float(bar['open']),
+        'high': float(bar['high']),
+        'low': float(bar['low']),
+        'close': float(bar['close']),
+        'volume': bar['volume']
+    } for bar in bars]
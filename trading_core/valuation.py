@@ -0,0 +1,206 @@
+import os
+import threading
+from collections import OrderedDict, defaultdict
+from dotenv import load_dotenv
+from . import accounts, market_cache
+
+load_dotenv()
+
+# Incremental portfolio valuation.
+#
+# Each worker keeps the cash and positions of recently active users in
+# memory together with their market value. When a new tick arrives, only the
+# accounts holding a symbol that moved are touched, by shares * price change,
+# so the totals behind the dashboards (and the leaderboard) are O(1) reads.
+#
+# Positions change only through orders: the worker that filled an order
+# applies the new cash and positions straight away, and every trade also
+# NOTIFYs ACCOUNT_CHANNEL so the other workers drop their copy of that
+# account and reload it on the next read.
+#
+# A read from the database can race a trade: the NOTIFY may drop the account
+# after the old cash and positions were read but before they are cached. So
+# every change bumps an invalidation counter. Callers take token() before
+# reading, and add() only keeps the account if the user wasn't invalidated
+# after that; otherwise the read is served once and not cached.
+
+MAX_ACCOUNTS = int(os.environ.get('VALUATION_MAX_ACCOUNTS', 10000))
+
+# Channel the order statements notify with the user_id of the account (as text)
+ACCOUNT_CHANNEL = 'account_changed'
+
+class AccountValue:
+    def __init__(self, cash, positions, prices):
+        self.cash = cash
+        # symbol -> [shares, avg_price]
+        self.positions = positions
+        self.market_value = sum(shares * prices[symbol]
+                                for symbol, (shares, avg_price) in positions.items()
+                                if symbol in prices)
+
+    @property
+    def total_value(self):
+        return self.cash + self.market_value
+
+class PortfolioBook:
+    def __init__(self, max_accounts=MAX_ACCOUNTS):
+        self.max_accounts = max_accounts
+        self._accounts = OrderedDict()
+        self._holders = defaultdict(set)
+        self._prices = {}
+        self._version = None
+        self._lock = threading.Lock()
+        # Invalidation count, and the count at each user's latest invalidation
+        self._invalidations = 0
+        self._invalidated = OrderedDict()
+        # Every invalidation up to this count may no longer be in _invalidated
+        self._forgotten = 0
+
+    # Move every loaded account to the snapshot's prices. Costs one pass over
+    # the quotes plus one update per holder of each symbol that moved.
+    def _sync(self, snapshot):
+        if snapshot.version == self._version and self._prices:
+            return
+        for quote in snapshot.quotes:
+            symbol = quote['symbol']
+            old = self._prices.get(symbol)
+            new = quote['price']
+            if old == new:
+                continue
+            self._prices[symbol] = new
+            for user_id in self._holders.get(symbol, ()):
+                account = self._accounts[user_id]
+                account.market_value += account.positions[symbol][0] * (new - (old or 0.0))
+        self._version = snapshot.version
+
+    def _put(self, user_id, account):
+        self._drop(user_id)
+        self._accounts[user_id] = account
+        for symbol in account.positions:
+            self._holders[symbol].add(user_id)
+        while len(self._accounts) > self.max_accounts:
+            self._drop(next(iter(self._accounts)))
+
+    def _drop(self, user_id):
+        account = self._accounts.pop(user_id, None)
+        if account is None:
+            return
+        for symbol in account.positions:
+            holders = self._holders.get(symbol)
+            if holders is not None:
+                holders.discard(user_id)
+                if not holders:
+                    del self._holders[symbol]
+
+    def _invalidate(self, user_id):
+        self._invalidations += 1
+        self._invalidated[user_id] = self._invalidations
+        self._invalidated.move_to_end(user_id)
+        while len(self._invalidated) > self.max_accounts:
+            _, count = self._invalidated.popitem(last=False)
+            self._forgotten = max(self._forgotten, count)
+
+    # Whether the user may have changed since `token` was taken
+    def _stale(self, user_id, token):
+        if token == self._invalidations:
+            return False
+        return self._invalidated.get(user_id, self._forgotten) > token
+
+    # Take before reading an account from the database and pass to add()
+    def token(self):
+        with self._lock:
+            return self._invalidations
+
+    # The user's valued account if this worker has it loaded, else None
+    def cached(self, user_id, snapshot):
+        with self._lock:
+            self._sync(snapshot)
+            account = self._accounts.get(user_id)
+            if account is not None:
+                self._accounts.move_to_end(user_id)
+            return account
+
+    # Value an account read from the database (its cash and
+    # accounts.get_positions() rows) and keep it, unless the user was
+    # invalidated since `token` was taken before the read
+    def add(self, user_id, cash, rows, snapshot, token):
+        positions = {row['symbol']: [row['shares'], float(row['avg_price'])] for row in rows}
+        with self._lock:
+            self._sync(snapshot)
+            account = AccountValue(cash, positions, self._prices)
+            if not self._stale(user_id, token):
+                self._put(user_id, account)
+            return account
+
+    # The user's valued account, loading it on first use.
+    # Returns None if there is no such users row.
+    def get(self, user_id, snapshot=None):
+        snapshot = snapshot or market_cache.get_snapshot()
+        account = self.cached(user_id, snapshot)
+        if account is not None:
+            return account
+
+        token = self.token()
+        cash = accounts.get_cash(user_id)
+        if cash is None:
+            return None
+        return self.add(user_id, cash, accounts.get_positions(user_id), snapshot, token)
+
+    # Apply the outcome of a committed order: the new cash balance and the
+    # new [shares, avg_price] of every symbol it touched (0 shares = closed)
+    def apply(self, user_id, cash, positions):
+        with self._lock:
+            # A read that started before the order committed is stale
+            self._invalidate(user_id)
+            account = self._accounts.get(user_id)
+            if account is None:
+                return
+            updated = dict(account.positions)
+            for symbol, (shares, avg_price) in positions.items():
+                if shares > 0:
+                    updated[symbol] = [shares, avg_price]
+                else:
+                    updated.pop(symbol, None)
+            self._put(user_id, AccountValue(cash, updated, self._prices))
+
+    # Forget an account; None (the listener reconnected and may have missed
+    # notifications) forgets every account
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._accounts.clear()
+                self._holders.clear()
+                self._invalidations += 1
+                self._invalidated.clear()
+                self._forgotten = self._invalidations
+            else:
+                self._drop(user_id)
+                self._invalidate(user_id)
+
+    # Positions of a loaded account in accounts.value_positions() form
+    def positions(self, account, snapshot):
+        rows = [{'symbol': symbol, 'shares': shares, 'avg_price': avg_price}
+                for symbol, (shares, avg_price) in sorted(account.positions.items())]
+        return accounts.value_positions(rows, snapshot.by_symbol)[0]
+
+book = PortfolioBook()
+
+def on_account_changed(payload):
+    book.invalidate(int(payload) if payload is not None else None)
+
+market_cache.cache.subscribe(on_account_changed, channel=ACCOUNT_CHANNEL)
+
+# Cash, market value and positions for a user, or None without a users row
+def value_account(user_id, snapshot=None):
+    snapshot = snapshot or market_cache.get_snapshot()
+    return describe(book.get(user_id, snapshot), snapshot)
+
+def describe(account, snapshot):
+    if account is None:
+        return None
+    return {
+        'cash': account.cash,
+        'market_value': account.market_value,
+        'total_value': account.total_value,
+        'positions': book.positions(account, snapshot)
+    }
@@ -1,364 +1,153 @@
 from flask import Flask, render_template, request, jsonify, session
-from datetime import datetime
-import psycopg
-from psycopg.rows import dict_row
 import os
-import json
 from dotenv import load_dotenv
 import random
+import trading_core
+from trading_core import accounts, aio, bootstrap, dashboard, market_cache, metrics, order_book, orders, price_feed, routes, valuation
+from trading_core.asgi import AsgiApp
+from trading_core.clickstream import log_event
+from trading_core.db import get_db_connection
 
 load_dotenv()
 
 app = Flask(__name__)
+trading_core.init_app(app)
 app.secret_key = os.environ.get('SECRET_KEY', 'change-this-traditional-production')
 
-db_initialized = False
-
-@app.before_request
-def initialize_once():
-    global db_initialized
-    if not db_initialized:
-        init_db()
-        init_stock_data()
-        db_initialized = True
+# Number of recent trades shown in the History tab
+HISTORY_LIMIT = 20
 
 @app.route("/health")
 def health():
     return "ok", 200
 
-# Database connection
-def get_db_connection():
-    conn = psycopg.connect(
-        os.environ.get('DATABASE_URL'),
-        row_factory=dict_row
-    )
-    return conn
+# Initialize session and user
+def init_user():
+    accounts.init_user('traditional')
 
-# Initialize database tables (same as gamified)
-def init_db():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    # Users table
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            user_id SERIAL PRIMARY KEY,
-            session_id VARCHAR(255) UNIQUE NOT NULL,
-            platform_type VARCHAR(50) NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            initial_cash DECIMAL(12, 2) DEFAULT 100000.00,
-            current_cash DECIMAL(12, 2) DEFAULT 100000.00
-        )
-    ''')
-    
-    # Trades table
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS trades (
-            trade_id SERIAL PRIMARY KEY,
-            user_id INTEGER REFERENCES users(user_id),
-            session_id VARCHAR(255) NOT NULL,
-            symbol VARCHAR(10) NOT NULL,
-            action VARCHAR(10) NOT NULL,
-            shares INTEGER NOT NULL,
-            price DECIMAL(10, 2) NOT NULL,
-            total_cost DECIMAL(12, 2) NOT NULL,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Portfolio table
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS portfolio (
-            portfolio_id SERIAL PRIMARY KEY,
-            user_id INTEGER REFERENCES users(user_id),
-            session_id VARCHAR(255) NOT NULL,
-            symbol VARCHAR(10) NOT NULL,
-            shares INTEGER NOT NULL,
-            avg_price DECIMAL(10, 2) NOT NULL,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(session_id, symbol)
-        )
-    ''')
-    
-    # Clickstream table for behavioral tracking
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS clickstream (
-            click_id SERIAL PRIMARY KEY,
-            user_id INTEGER REFERENCES users(user_id),
-            session_id VARCHAR(255) NOT NULL,
-            event_type VARCHAR(50) NOT NULL,
-            event_data JSONB,
-            page_url VARCHAR(255),
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Stock prices table (shared with gamified)
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS stock_prices (
-            symbol VARCHAR(10) PRIMARY KEY,
-            company_name VARCHAR(100) NOT NULL,
-            base_price DECIMAL(10, 2) NOT NULL,
-            current_price DECIMAL(10, 2) NOT NULL,
-            volatility VARCHAR(10) NOT NULL,
-            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    conn.commit()
-    cur.close()
-    conn.close()
+# Format a cached quote for the market table
+def format_quote(quote):
+    current = quote['price']
+    
+    # Calculate bid/ask spread (0.01-0.02% spread)
+    spread = current * 0.0001
+    bid = round(current - spread, 2)
+    ask = round(current + spread, 2)
+    
+    return {
+        'symbol': quote['symbol'],
+        'name': quote['name'],
+        'bid': bid,
+        'ask': ask,
+        'last': current,
+        'change': quote['change'],
+        'change_percent': quote['percent'],
+        'volume': f"{random.randint(10, 250)}M"
+    }
 
-def init_user():
-    if 'session_id' not in session:
-        session['session_id'] = os.urandom(16).hex()
-        
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute('''
-            INSERT INTO users (session_id, platform_type, initial_cash, current_cash)
-            VALUES (%s, %s, %s, %s)
-            RETURNING user_id
-        ''', (session['session_id'], 'traditional', 100000.00, 100000.00))
-        
-        user = cur.fetchone()
-        session['user_id'] = user['user_id']
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+# Get current stock prices, formatted once per cached snapshot
+def get_market_data(snapshot=None):
+    snapshot = snapshot or market_cache.get_snapshot()
+    return snapshot.view('traditional', format_quote)
 
-def log_event(event_type, event_data=None):
-    if 'session_id' not in session:
-        return
-    
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    cur.execute('''
-        INSERT INTO clickstream (user_id, session_id, event_type, event_data, page_url)
-        VALUES (%s, %s, %s, %s, %s)
-    ''', (
-        session.get('user_id'),
-        session['session_id'],
-        event_type,
-        json.dumps(event_data) if event_data else None,
-        request.url
-    ))
-    
-    conn.commit()
-    cur.close()
-    conn.close()
+# Account summary and positions for a user, in the template's field
+# names. Returns None if the user has no users row.
+def get_account(user_id, snapshot=None):
+    return account_view(valuation.value_account(user_id, snapshot))
 
-# Update stock prices with algorithmic volatility
-def update_stock_prices():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    # Get all stocks
-    cur.execute('SELECT symbol, base_price, volatility FROM stock_prices')
-    stocks = cur.fetchall()
-    
-    for stock in stocks:
-        symbol = stock['symbol']
-        base_price = float(stock['base_price'])
-        volatility = stock['volatility']
-        
-        # Determine volatility range
-        if volatility == 'high':
-            change_percent = random.uniform(-0.05, 0.05)  # ±5%
-        elif volatility == 'medium':
-            change_percent = random.uniform(-0.02, 0.02)  # ±2%
-        else:  # low
-            change_percent = random.uniform(-0.01, 0.01)  # ±1%
-        
-        # Calculate new price
-        new_price = base_price * (1 + change_percent)
-        new_price = round(new_price, 2)
-        
-        # Update in database
-        cur.execute('''
-            UPDATE stock_prices 
-            SET current_price = %s, last_updated = CURRENT_TIMESTAMP
-            WHERE symbol = %s
-        ''', (new_price, symbol))
-    
-    conn.commit()
-    cur.close()
-    conn.close()
+# A valuation.value_account() result in the template's field names
+def account_view(account):
+    if account is None:
+        return None
+    
+    current_cash = account['cash']
+    portfolio_value = account['total_value']
+    positions = account['positions']
+    
+    return {
+        'account_summary': {
+            'total_value': portfolio_value,
+            'cash_balance': current_cash,
+            'buying_power': current_cash * 2,
+            'today_change': portfolio_value - 100000.00,
+            'today_change_percent': ((portfolio_value - 100000.00) / 100000.00 * 100)
+        },
+        'positions': [{
+            'symbol': item['symbol'],
+            'shares': item['shares'],
+            'avg_cost': item['avg_price'],
+            'current_price': item['current_price'],
+            'market_value': item['market_value'],
+            'gain_loss': item['gain_loss'],
+            'gain_loss_percent': item['gain_loss_percent']
+        } for item in positions]
+    }
 
-# Initialize stock data if not exists (same 20 stocks as gamified)
-def init_stock_data():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    stocks = [
-        ('AAPL', 'Apple Inc.', 178.50, 'medium'),
-        ('MSFT', 'Microsoft Corporation', 378.50, 'medium'),
-        ('GOOGL', 'Alphabet Inc.', 142.00, 'medium'),
-        ('AMZN', 'Amazon.com Inc.', 151.25, 'medium'),
-        ('META', 'Meta Platforms Inc.', 352.75, 'medium'),
-        ('TSLA', 'Tesla Inc.', 242.50, 'high'),
-        ('NVDA', 'NVIDIA Corporation', 478.00, 'high'),
-        ('AMD', 'Advanced Micro Devices', 138.25, 'high'),
-        ('JPM', 'JPMorgan Chase & Co.', 158.75, 'low'),
-        ('BAC', 'Bank of America Corp.', 33.50, 'low'),
-        ('WMT', 'Walmart Inc.', 168.25, 'low'),
-        ('PG', 'Procter & Gamble Co.', 155.50, 'low'),
-        ('JNJ', 'Johnson & Johnson', 157.75, 'low'),
-        ('DIS', 'The Walt Disney Company', 96.50, 'medium'),
-        ('NKE', 'Nike Inc.', 108.75, 'medium'),
-        ('NFLX', 'Netflix Inc.', 442.50, 'high'),
-        ('COST', 'Costco Wholesale Corp.', 588.25, 'low'),
-        ('V', 'Visa Inc.', 258.50, 'low'),
-        ('MA', 'Mastercard Inc.', 412.75, 'low'),
-        ('PEP', 'PepsiCo Inc.', 172.50, 'low')
-    ]
-    
-    for symbol, name, price, volatility in stocks:
-        cur.execute('''
-            INSERT INTO stock_prices (symbol, company_name, base_price, current_price, volatility)
-            VALUES (%s, %s, %s, %s, %s)
-            ON CONFLICT (symbol) DO NOTHING
-        ''', (symbol, name, price, price, volatility))
-    
-    conn.commit()
-    cur.close()
-    conn.close()
+# Trade history in the template's field names
+def format_history(trade):
+    return {
+        'symbol': trade['symbol'],
+        'side': trade['action'],
+        'shares': trade['shares'],
+        'price': trade['price'],
+        'total': trade['total'],
+        'timestamp': trade['timestamp']
+    }
 
-# Get current stock prices
-def get_market_data():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    cur.execute('''
-        SELECT symbol, company_name, current_price, base_price, volatility
-        FROM stock_prices
-        ORDER BY symbol
-    ''')
-    stocks = cur.fetchall()
-    
-    cur.close()
-    conn.close()
-    
-    market_data = []
-    for stock in stocks:
-        current = float(stock['current_price'])
-        base = float(stock['base_price'])
-        change = current - base
-        change_percent = (change / base * 100) if base > 0 else 0
-        
-        # Calculate bid/ask spread (0.01-0.02% spread)
-        spread = current * 0.0001
-        bid = round(current - spread, 2)
-        ask = round(current + spread, 2)
-        
-        market_data.append({
-            'symbol': stock['symbol'],
-            'name': stock['company_name'],
-            'bid': bid,
-            'ask': ask,
-            'last': current,
-            'change': change,
-            'change_percent': change_percent,
-            'volume': f"{random.randint(10, 250)}M"
-        })
-    
-    return market_data
+def get_history(user_id):
+    return [format_history(trade) for trade in accounts.get_trade_history(user_id, HISTORY_LIMIT)]
 
 @app.route('/')
 def index():
-    init_user()
-    init_stock_data()
-    update_stock_prices()
+    with metrics.phase('user'):
+        init_user()
     log_event('page_view', {'page': 'home'})
     
-    session_id = session['session_id']
-    
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    # Get user's current cash
-    cur.execute('SELECT current_cash FROM users WHERE session_id = %s', (session_id,))
-    user = cur.fetchone()
-    current_cash = float(user['current_cash']) if user else 100000.00
-    
-    # Get portfolio
-    cur.execute('''
-        SELECT symbol, shares, avg_price 
-        FROM portfolio 
-        WHERE session_id = %s
-    ''', (session_id,))
-    portfolio_data = cur.fetchall()
-    
-    # Calculate portfolio value
-    portfolio_value = current_cash
-    positions = []
-    market_data = get_market_data()
-    
-    for item in portfolio_data:
-        stock = next((s for s in market_data if s['symbol'] == item['symbol']), None)
-        if stock:
-            market_value = item['shares'] * stock['last']
-            cost_basis = item['shares'] * float(item['avg_price'])
-            gain_loss = market_value - cost_basis
-            gain_loss_percent = (gain_loss / cost_basis * 100) if cost_basis > 0 else 0
-            
-            portfolio_value += market_value
-            
-            positions.append({
-                'symbol': item['symbol'],
-                'shares': item['shares'],
-                'avg_cost': float(item['avg_price']),
-                'current_price': stock['last'],
-                'market_value': market_value,
-                'gain_loss': gain_loss,
-                'gain_loss_percent': gain_loss_percent
-            })
-    
-    account_summary = {
-        'total_value': portfolio_value,
-        'cash_balance': current_cash,
-        'buying_power': current_cash * 2,
-        'today_change': portfolio_value - 100000.00,
-        'today_change_percent': ((portfolio_value - 100000.00) / 100000.00 * 100)
-    }
-    
-    # Get trade history
-    cur.execute('''
-        SELECT symbol, action as side, shares, price, total_cost as total, timestamp
-        FROM trades
-        WHERE session_id = %s
-        ORDER BY timestamp DESC
-        LIMIT 20
-    ''', (session_id,))
-    history = cur.fetchall()
-    
-    cur.close()
-    conn.close()
-    
-    # Format history
-    formatted_history = []
-    for trade in history:
-        formatted_history.append({
-            'symbol': trade['symbol'],
-            'side': trade['side'],
-            'shares': trade['shares'],
-            'price': float(trade['price']),
-            'total': float(trade['total']),
-            'timestamp': trade['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
-        })
-    
-    return render_template('traditional.html',
-                         account_summary=account_summary,
-                         positions=positions,
-                         market_data=market_data,
-                         orders=[],  # No pending orders functionality
-                         history=formatted_history)
+    user_id = session['user_id']
+    
+    with metrics.phase('snapshot'):
+        snapshot = market_cache.get_snapshot()
+    # Account, positions, trade history and open orders in one round-trip
+    with metrics.phase('dashboard'):
+        data = dashboard.load_dashboard(user_id, snapshot, HISTORY_LIMIT, with_orders=True)
+    if data is None:
+        # The session points at a users row that no longer exists; resolve it again
+        accounts.forget_user()
+        init_user()
+        user_id = session['user_id']
+        data = dashboard.load_dashboard(user_id, snapshot, HISTORY_LIMIT, with_orders=True)
+    
+    return render_dashboard(snapshot, data)
+
+# `data` is a dashboard.load_dashboard() result with orders, or None
+def render_dashboard(snapshot, data):
+    account = account_view(data['account']) if data else None
+    if account is None:
+        account = {
+            'account_summary': {
+                'total_value': accounts.STARTING_CASH,
+                'cash_balance': accounts.STARTING_CASH,
+                'buying_power': accounts.STARTING_CASH * 2,
+                'today_change': 0.0,
+                'today_change_percent': 0.0
+            },
+            'positions': []
+        }
+    
+    with metrics.phase('render'):
+        return render_template('traditional.html',
+                             account_summary=account['account_summary'],
+                             positions=account['positions'],
+                             market_data=get_market_data(snapshot),
+                             orders=data['orders'] if data else [],
+                             history=[format_history(trade) for trade in data['history']] if data else [],
+                             history_limit=HISTORY_LIMIT,
+                             price_stream=price_feed.streaming_enabled())
 
 @app.route('/trade', methods=['POST'])
 def trade():
-    init_user()
+    with metrics.phase('user'):
+        init_user()
     
     data = request.json
     symbol = data.get('symbol', '').upper()
@@ -374,129 +163,167 @@ def trade():
     if not symbol or shares <= 0:
         return jsonify({'success': False, 'message': 'Invalid order parameters'})
     
-    market_data = get_market_data()
-    stock = next((s for s in market_data if s['symbol'] == symbol), None)
+    stock = market_cache.get_snapshot().by_symbol.get(symbol)
     if not stock:
         return jsonify({'success': False, 'message': 'Please select a symbol from the Market Data list'})
     
-    session_id = session['session_id']
-    price = stock['last']
-    total_cost = shares * price
-    
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    cur.execute('SELECT current_cash FROM users WHERE session_id = %s', (session_id,))
-    user = cur.fetchone()
-    current_cash = float(user['current_cash'])
-    
-    if action == 'buy':
-        if total_cost > current_cash:
-            cur.close()
-            conn.close()
-            return jsonify({'success': False, 'message': 'Insufficient funds'})
-        
-        # Update cash
-        new_cash = current_cash - total_cost
-        cur.execute('UPDATE users SET current_cash = %s WHERE session_id = %s', (new_cash, session_id))
-        
-        # Update portfolio
-        cur.execute('SELECT shares, avg_price FROM portfolio WHERE session_id = %s AND symbol = %s', (session_id, symbol))
-        existing = cur.fetchone()
-        
-        if existing:
-            old_shares = existing['shares']
-            old_avg = float(existing['avg_price'])
-            new_shares = old_shares + shares
-            new_avg = ((old_shares * old_avg) + (shares * price)) / new_shares
-            
-            cur.execute('''
-                UPDATE portfolio 
-                SET shares = %s, avg_price = %s, updated_at = CURRENT_TIMESTAMP
-                WHERE session_id = %s AND symbol = %s
-            ''', (new_shares, new_avg, session_id, symbol))
-        else:
-            cur.execute('''
-                INSERT INTO portfolio (user_id, session_id, symbol, shares, avg_price)
-                VALUES (%s, %s, %s, %s, %s)
-            ''', (session['user_id'], session_id, symbol, shares, price))
+    if action not in ('buy', 'sell'):
+        return jsonify({'success': False, 'message': 'Invalid action'})
+    
+    # Limit and stop orders rest in the book until a tick triggers them
+    order_type = data.get('order_type', 'market')
+    if order_type != 'market':
+        try:
+            with metrics.phase('order'):
+                order = order_book.place_order(get_db_connection(), session['user_id'], symbol, action,
+                                               order_type, shares, data.get('price'),
+                                               market_cache.get_snapshot().by_symbol)
+        except orders.OrderRejected as e:
+            return jsonify({'success': False, 'message': str(e)})
         
-        # Record trade
-        cur.execute('''
-            INSERT INTO trades (user_id, session_id, symbol, action, shares, price, total_cost)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        ''', (session['user_id'], session_id, symbol, 'BUY', shares, price, total_cost))
-        
-        conn.commit()
-        cur.close()
-        conn.close()
-        
-        log_event('trade_completed', {
+        log_event('order_placed', {
+            'order_id': order['order_id'],
             'symbol': symbol,
             'shares': shares,
-            'action': 'buy',
-            'price': price,
-            'total': total_cost
+            'action': action,
+            'order_type': order_type,
+            'price': order['price']
         })
         
         return jsonify({
             'success': True,
-            'message': f'Order filled: Bought {shares} shares of {symbol} at ${price:.2f}',
-            'cash': new_cash
+            'message': f'{order_type.title()} order placed: {action.upper()} {shares} {symbol} at ${order["price"]:.2f}',
+            'order': order,
+            'orders': order_book.get_open_orders(session['user_id'])
         })
     
-    elif action == 'sell':
-        cur.execute('SELECT shares FROM portfolio WHERE session_id = %s AND symbol = %s', (session_id, symbol))
-        portfolio_item = cur.fetchone()
-        
-        if not portfolio_item or portfolio_item['shares'] < shares:
-            cur.close()
-            conn.close()
-            return jsonify({'success': False, 'message': 'Insufficient shares'})
-        
-        # Update cash
-        new_cash = current_cash + total_cost
-        cur.execute('UPDATE users SET current_cash = %s WHERE session_id = %s', (new_cash, session_id))
-        
-        # Update portfolio
-        new_shares = portfolio_item['shares'] - shares
-        if new_shares == 0:
-            cur.execute('DELETE FROM portfolio WHERE session_id = %s AND symbol = %s', (session_id, symbol))
-        else:
-            cur.execute('''
-                UPDATE portfolio 
-                SET shares = %s, updated_at = CURRENT_TIMESTAMP
-                WHERE session_id = %s AND symbol = %s
-            ''', (new_shares, session_id, symbol))
-        
-        # Record trade
-        cur.execute('''
-            INSERT INTO trades (user_id, session_id, symbol, action, shares, price, total_cost)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        ''', (session['user_id'], session_id, symbol, 'SELL', shares, price, total_cost))
-        
-        conn.commit()
-        cur.close()
-        conn.close()
-        
-        log_event('trade_completed', {
-            'symbol': symbol,
-            'shares': shares,
-            'action': 'sell',
-            'price': price,
-            'total': total_cost
-        })
-        
-        return jsonify({
-            'success': True,
-            'message': f'Order filled: Sold {shares} shares of {symbol} at ${price:.2f}',
-            'cash': new_cash
-        })
+    # Balance check, cash, position and trade in one locked transaction
+    try:
+        with metrics.phase('order'):
+            fill = orders.execute_order(get_db_connection(), session['user_id'], symbol, action,
+                                        shares, stock['price'])
+    except orders.OrderRejected as e:
+        return jsonify({'success': False, 'message': str(e)})
+    
+    log_event('trade_completed', {
+        'symbol': symbol,
+        'shares': shares,
+        'action': action,
+        'price': fill['price'],
+        'total': fill['total']
+    })
+    
+    with metrics.phase('account'):
+        account = get_account(session['user_id'])
+    
+    verb = 'Bought' if action == 'buy' else 'Sold'
+    return jsonify({
+        'success': True,
+        'message': f'Order filled: {verb} {shares} shares of {symbol} at ${fill["price"]:.2f}',
+        'cash': fill['cash'],
+        # Everything the page needs to update itself without a reload
+        'trade': format_history(accounts.format_trade(fill)),
+        'account': account
+    })
+
+@app.route('/trade/batch', methods=['POST'])
+def trade_batch():
+    init_user()
+    
+    data = request.json
+    if not data or not isinstance(data.get('orders'), list) or not data['orders']:
+        return jsonify({'success': False, 'message': 'Invalid order parameters'})
+    
+    if len(data['orders']) > orders.MAX_BATCH_ORDERS:
+        return jsonify({'success': False, 'message': f'At most {orders.MAX_BATCH_ORDERS} orders per batch'})
+    
+    atomic = bool(data.get('atomic', False))
     
-    cur.close()
-    conn.close()
-    return jsonify({'success': False, 'message': 'Invalid action'})
+    # Every order is validated and priced against the same snapshot
+    snapshot = market_cache.get_snapshot()
+    try:
+        results, summary = orders.execute_batch(get_db_connection(), session['user_id'], data['orders'],
+                                                snapshot.by_symbol, atomic=atomic)
+    except orders.OrderRejected as e:
+        return jsonify({'success': False, 'message': str(e)})
+    
+    log_event('trade_batch_completed', {
+        'orders': len(results),
+        'filled': summary['filled'],
+        'rejected': summary['rejected'],
+        'atomic': atomic
+    })
+    
+    return jsonify({
+        'success': summary['filled'] > 0,
+        'message': f"Orders filled: {summary['filled']} of {len(results)}",
+        'results': results,
+        'cash': summary['cash'],
+        'account': get_account(session['user_id'])
+    })
+
+# JSON read API, used by the page to update itself in place after a trade
+
+@app.route('/api/portfolio')
+def api_portfolio():
+    init_user()
+    account = get_account(session['user_id'])
+    if account is None:
+        return jsonify({'success': False, 'message': 'User not found'}), 404
+    return jsonify(account)
+
+@app.route('/api/history')
+def api_history():
+    init_user()
+    return jsonify({'trades': get_history(session['user_id'])})
+
+# ASGI serving mode: `uvicorn traditional_app_db:asgi_app`. The read routes
+# below replace their sync views on the event loop; trades run the sync views
+# above on the ASGI app's thread pool. Quotes, bars and order changes are the
+# shared routes in trading_core.routes, registered here for both modes.
+asgi_app = AsgiApp(app)
+routes.init_app(app, asgi_app, 'traditional', format_quote)
+
+async def init_user_async():
+    return await aio.init_user('traditional')
+
+async def get_account_async(user_id, snapshot):
+    return account_view(await aio.value_account(user_id, snapshot))
+
+async def get_history_async(user_id):
+    return [format_history(trade) for trade in await aio.get_trade_history(user_id, HISTORY_LIMIT)]
+
+@asgi_app.view('index')
+async def index_async():
+    with metrics.phase('user'):
+        user_id = await init_user_async()
+    log_event('page_view', {'page': 'home'})
+    
+    with metrics.phase('snapshot'):
+        snapshot = await aio.get_snapshot()
+    with metrics.phase('dashboard'):
+        data = await aio.load_dashboard(user_id, snapshot, HISTORY_LIMIT, with_orders=True)
+    if data is None:
+        # The session points at a users row that no longer exists; resolve it again
+        accounts.forget_user()
+        user_id = await init_user_async()
+        data = await aio.load_dashboard(user_id, snapshot, HISTORY_LIMIT, with_orders=True)
+    
+    return render_dashboard(snapshot, data)
+
+@asgi_app.view('api_portfolio')
+async def api_portfolio_async():
+    user_id = await init_user_async()
+    account = await get_account_async(user_id, await aio.get_snapshot())
+    if account is None:
+        return jsonify({'success': False, 'message': 'User not found'}), 404
+    return jsonify(account)
+
+@asgi_app.view('api_history')
+async def api_history_async():
+    user_id = await init_user_async()
+    return jsonify({'trades': await get_history_async(user_id)})
 
 if __name__ == '__main__':
-    init_db()
+    bootstrap.run_migrations()
     app.run(debug=True, host='0.0.0.0', port=int(os.environ.get('PORT', 5001)))